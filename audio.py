@@ -0,0 +1,554 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import wave
+import numpy as np
+
+from pydub import AudioSegment
+from typing import Dict, List, Optional, Tuple
+
+from ffmpeg_runner import FFmpegRunner, ProgressFn
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 44100
+CHANNELS = 1
+# Above this size merge_with_timing streams to the encoder instead of rendering in memory
+MAX_BUFFER_BYTES = 256 * 1024 * 1024
+# Max inputs per ffmpeg invocation when mixing cue files
+MIX_FAN_IN = 64
+# Speech fitting: seconds a cue may run into the following gap, and the
+# fastest tempo applied by stretching before asking TTS to speak faster
+MAX_BORROW = 0.5
+MAX_TEMPO = 1.3
+MAX_STRETCH = 2.0
+
+
+def load_pcm(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS) -> np.ndarray:
+    """
+    Decode an audio file to interleaved 16-bit PCM at the given rate/layout.
+    pydub reads WAVs in-process but spawns ffmpeg for anything else, so
+    async code uses decode_pcm.
+    """
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_frame_rate(sample_rate).set_channels(channels).set_sample_width(2)
+    return np.frombuffer(audio.raw_data, dtype=np.int16)
+
+
+# MPEG audio frame header tables, indexed by the header's version bits
+MP3_BITRATES = {
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_frame(header: bytes) -> Optional[Tuple[int, int, int]]:
+    """(frame bytes, samples per frame, sample rate) of an MPEG audio frame header, None if invalid"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version, layer = (header[1] >> 3) & 3, (header[1] >> 1) & 3
+    bitrate_index, rate_index, padding = header[2] >> 4, (header[2] >> 2) & 3, (header[2] >> 1) & 1
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = MP3_BITRATES[(3 if version == 3 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    if layer == 3:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 576 if layer == 1 and version != 3 else 1152
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    """
+    Length of an MP3 in seconds from its frame headers, without decoding:
+    the Xing/Info frame count when there is one, else every frame is
+    walked. None if the file is not MPEG audio.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = int.from_bytes(bytes(b & 0x7F for b in data[6:10]), "big")
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    first = mp3_frame(data[offset:offset + 4])
+    if first is None:
+        return None
+    _, samples, sample_rate = first
+
+    mono = data[offset + 3] >> 6 == 3
+    side_info = (17 if mono else 32) if data[offset + 1] & 0x18 == 0x18 else (9 if mono else 17)
+    tag = offset + 4 + side_info
+    if data[tag:tag + 4] in (b"Xing", b"Info") and data[tag + 7] & 1:
+        return int.from_bytes(data[tag + 8:tag + 12], "big") * samples / sample_rate
+
+    frames = 0
+    while True:
+        frame = mp3_frame(data[offset:offset + 4])
+        if frame is None or frame[0] <= 4:
+            break
+        frames += 1
+        offset += frame[0]
+    return frames * samples / sample_rate
+
+
+def clip_duration(path: str) -> Optional[float]:
+    """
+    Length of an audio clip in seconds from its WAV or MP3 headers (what
+    the TTS backends write), None for other formats (probe those instead).
+    """
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        return mp3_duration(path)
+
+
+def time_stretch(
+        pcm: np.ndarray, tempo: float, channels: int = CHANNELS, frame: int = 1024, tolerance: int = 256
+) -> np.ndarray:
+    """
+    Speed up (tempo > 1) or slow down 16-bit PCM without changing pitch
+    (WSOLA). Each frame is read up to `tolerance` samples away from its
+    nominal position, wherever it best matches the natural continuation of
+    the previous frame, so overlapping frames add in phase instead of
+    cancelling out.
+    """
+    if abs(tempo - 1.0) < 1e-3 or len(pcm) < (frame + tolerance) * channels:
+        return pcm
+
+    x = pcm.reshape(-1, channels).astype(np.float32)
+    mono = x.mean(axis=1)
+    last = len(x) - frame
+    hop_out = frame // 2
+    hop_in = hop_out * tempo
+    count = int(last / hop_in) + 1
+
+    # Where each frame is read from; sequential, as every choice depends on the last
+    positions = np.zeros(count, dtype=np.int64)
+    for k in range(1, count):
+        nominal = int(round(k * hop_in))
+        low, high = max(0, nominal - tolerance), min(last, nominal + tolerance)
+        natural = min(positions[k - 1] + hop_out, last)
+        scores = np.correlate(mono[low:high + frame], mono[natural:natural + frame], "valid")
+        positions[k] = low + int(np.argmax(scores))
+
+    window = np.hanning(frame).astype(np.float32)
+    reads = positions[:, None] + np.arange(frame)
+    writes = (np.arange(count) * hop_out)[:, None] + np.arange(frame)
+    frames = x[reads] * window[None, :, None]
+
+    out = np.zeros(((count - 1) * hop_out + frame, channels), dtype=np.float32)
+    norm = np.zeros(len(out), dtype=np.float32)
+    np.add.at(out, writes, frames)
+    np.add.at(norm, writes, np.broadcast_to(window, writes.shape))
+    out /= np.maximum(norm, 1e-3)[:, None]
+
+    return np.clip(out, -32768, 32767).astype(np.int16).reshape(-1)
+
+
+async def decode_pcm(
+        path: str,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        runner: FFmpegRunner = None,
+        nested: bool = False,
+) -> np.ndarray:
+    """
+    Decode an audio clip to interleaved 16-bit PCM. 16-bit WAVs (the tone
+    backend) are read in-process; anything else (edge-tts MP3s) is decoded
+    by ffmpeg through `runner`, so its concurrency limit and timeout apply.
+    """
+    if await asyncio.to_thread(wav_data_offset, path) is not None:
+        return await asyncio.to_thread(load_pcm, path, sample_rate, channels)
+
+    cmd = [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-i", path,
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "pipe:1",
+    ]
+    data = await (runner or FFmpegRunner()).run(cmd, capture_stdout=True, nested=nested)
+    return np.frombuffer(data, dtype=np.int16)
+
+
+async def load_cue(
+        path: str,
+        tempo: float = 1.0,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        runner: FFmpegRunner = None,
+        nested: bool = False,
+) -> np.ndarray:
+    pcm = await decode_pcm(path, sample_rate, channels, runner, nested)
+    if abs(tempo - 1.0) < 1e-3:
+        return pcm
+    return await asyncio.to_thread(time_stretch, pcm, tempo, channels)
+
+
+async def encode_pcm(
+        pcm: np.ndarray,
+        output_path: str,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        runner: FFmpegRunner = None,
+):
+    """Write PCM as a WAV in-process, or encode it to any other format with ffmpeg through `runner`"""
+    if output_path.lower().endswith(".wav"):
+        await asyncio.to_thread(write_wav, output_path, pcm, sample_rate, channels)
+        return output_path
+
+    cmd = [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-f", "s16le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "-i", "pipe:0",
+        output_path,
+        "-y",
+    ]
+
+    async def feed(stdin: asyncio.StreamWriter):
+        data = memoryview(pcm.tobytes())
+        for start in range(0, len(data), 1024 * 1024):
+            stdin.write(data[start:start + 1024 * 1024])
+            await stdin.drain()
+
+    await (runner or FFmpegRunner()).run(cmd, feed=feed)
+    return output_path
+
+
+def write_wav(path: str, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def fit_cues(
+        starts: np.ndarray,
+        ends: np.ndarray,
+        lengths: np.ndarray,
+        max_borrow: float = MAX_BORROW,
+        max_tempo: float = MAX_TEMPO,
+) -> Dict[str, np.ndarray]:
+    """
+    Fit synthesized speech of `lengths` seconds into cues, for all cues at
+    once. Speech that overruns its cue first borrows up to `max_borrow`
+    seconds of the gap before the next cue; what still doesn't fit gets a
+    tempo > 1. Cues needing more than `max_tempo` are flagged for
+    re-synthesis at a faster speaking rate.
+    """
+    order = np.argsort(starts, kind="stable")
+    next_starts = np.full(len(starts), np.inf)
+    next_starts[order[:-1]] = starts[order[1:]]
+
+    durations = ends - starts
+    windows = np.minimum(ends + max_borrow, np.maximum(next_starts, ends)) - starts
+    fitted = np.where(lengths > durations, np.minimum(lengths, windows), durations)
+    tempo = np.where(fitted > 0, lengths / np.maximum(fitted, 1e-6), 1.0)
+    tempo = np.maximum(tempo, 1.0)
+
+    return {
+        "duration": fitted,
+        "tempo": tempo,
+        "resynthesize": tempo > max_tempo,
+    }
+
+
+def plan_timeline(audio_files: List[Dict], sample_rate: int = SAMPLE_RATE) -> List[Tuple[int, int, str, float]]:
+    """
+    Place each cue on the timeline as (offset, max_frames, path, tempo),
+    sorted by start. A cue is trimmed to its own duration and never runs
+    into the next cue's start, so cues can be rendered independently.
+    """
+    ordered = sorted(audio_files, key=lambda af: af["start"])
+    plan = []
+
+    for i, af in enumerate(ordered):
+        offset = int(round(af["start"] * sample_rate))
+        frames = int(round(af["duration"] * sample_rate))
+        if i + 1 < len(ordered):
+            frames = min(frames, int(round(ordered[i + 1]["start"] * sample_rate)) - offset)
+        if frames > 0:
+            plan.append((offset, frames, af["path"], min(af.get("tempo", 1.0), MAX_STRETCH)))
+
+    return plan
+
+
+def timeline_frames(audio_files: List[Dict], total_ms: float, sample_rate: int = SAMPLE_RATE) -> int:
+    """Track length in frames: the video duration or the last cue end, whichever is longer"""
+    last_end = max((af["start"] + af["duration"] for af in audio_files), default=0)
+    return int(round(max(total_ms / 1000, last_end) * sample_rate))
+
+
+async def render_timeline(
+        audio_files: List[Dict],
+        total_ms: float = 0,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        runner: FFmpegRunner = None,
+) -> np.ndarray:
+    """
+    Render timed cues into one preallocated PCM buffer. Gaps and short
+    cues are left as silence, long cues are stretched by their "tempo"
+    (see fit_cues) and trimmed to their duration.
+    """
+    frames = timeline_frames(audio_files, total_ms, sample_rate)
+    return await render_range(plan_timeline(audio_files, sample_rate), 0, frames, sample_rate, channels, runner)
+
+
+async def render_range(
+        plan: List[Tuple[int, int, str, float]],
+        start: int,
+        end: int,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        runner: FFmpegRunner = None,
+) -> np.ndarray:
+    """
+    PCM for frames [start, end) of a planned timeline; only overlapping
+    cues are decoded, concurrently up to the runner's limit.
+    """
+    track = np.zeros((end - start) * channels, dtype=np.int16)
+    runner = runner or FFmpegRunner()
+
+    async def place(offset: int, max_frames: int, path: str, tempo: float):
+        pcm = (await load_cue(path, tempo, sample_rate, channels, runner))[:max_frames * channels]
+        low = max(offset, start)
+        high = min(offset + len(pcm) // channels, end)
+        if high > low:
+            track[(low - start) * channels:(high - start) * channels] = pcm[(low - offset) * channels:(high - offset) * channels]
+
+    await asyncio.gather(*(
+        place(*cue) for cue in plan if cue[0] < end and cue[0] + cue[1] > start
+    ))
+    return track
+
+
+def dirty_ranges(
+        old_files: List[Dict], new_files: List[Dict], sample_rate: int = SAMPLE_RATE
+) -> List[Tuple[int, int]]:
+    """
+    Frame ranges where two timelines differ: the extents of every cue
+    placement (clip, offset, trimmed length, tempo) present in only one of
+    them, merged. A moved cue dirties its old and new place, and a
+    neighbour whose trim changed because of it.
+    """
+    old_plan = set(plan_timeline(old_files, sample_rate))
+    new_plan = set(plan_timeline(new_files, sample_rate))
+    extents = sorted((offset, offset + frames) for offset, frames, _, _ in old_plan ^ new_plan)
+
+    merged = []
+    for start, end in extents:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def wav_data_offset(path: str) -> Optional[Tuple[int, int, int, int]]:
+    """(data offset, frames, sample rate, channels) of a 16-bit PCM WAV, None for anything else"""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], int.from_bytes(chunk[4:], "little")
+            if chunk_id == b"fmt ":
+                fmt = f.read(size + size % 2)
+            elif chunk_id == b"data":
+                if not fmt or int.from_bytes(fmt[:2], "little") != 1 or int.from_bytes(fmt[14:16], "little") != 16:
+                    return None
+                channels = int.from_bytes(fmt[2:4], "little")
+                sample_rate = int.from_bytes(fmt[4:8], "little")
+                return f.tell(), size // (2 * channels), sample_rate, channels
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+async def patch_timeline(
+        path: str,
+        old_files: List[Dict],
+        new_files: List[Dict],
+        total_ms: float = 0,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        max_dirty: float = 0.5,
+        runner: FFmpegRunner = None,
+) -> Optional[int]:
+    """
+    Re-render only the ranges where `new_files` differ from the cues the
+    WAV at `path` was rendered from, writing them in place. Returns the
+    frames rewritten, or None when a full render is needed instead (other
+    format or length, or more than `max_dirty` of the track changed).
+    """
+    layout = wav_data_offset(path)
+    frames = timeline_frames(new_files, total_ms, sample_rate)
+    if layout is None or layout[1:] != (frames, sample_rate, channels):
+        return None
+
+    ranges = dirty_ranges(old_files, new_files, sample_rate)
+    dirty = sum(end - start for start, end in ranges)
+    if dirty > max_dirty * frames:
+        return None
+
+    plan = plan_timeline(new_files, sample_rate)
+    data_offset = layout[0]
+    for start, end in ranges:
+        end = min(end, frames)
+        if start >= end:
+            continue
+        pcm = await render_range(plan, start, end, sample_rate, channels, runner)
+        await asyncio.to_thread(write_at, path, data_offset + start * channels * 2, pcm.tobytes())
+
+    logger.info(f"Patched {len(ranges)} ranges ({dirty / sample_rate:.1f}s) of {path}")
+    return dirty
+
+
+def write_at(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+async def stream_timeline(
+        audio_files: List[Dict],
+        output_path: str,
+        total_ms: float = 0,
+        sample_rate: int = SAMPLE_RATE,
+        channels: int = CHANNELS,
+        chunk_frames: int = SAMPLE_RATE,
+        runner: FFmpegRunner = None,
+        on_progress: ProgressFn = None,
+):
+    """
+    Walk cues in time order and pipe PCM (silence + cue audio) straight
+    into an ffmpeg encoder. Only one decoded cue and one silence chunk are
+    held in memory, so peak RSS does not grow with the video length.
+    """
+    cmd = [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-f", "s16le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "-i", "pipe:0",
+        output_path,
+        "-y",
+    ]
+    silence = memoryview(bytes(chunk_frames * channels * 2))
+    runner = runner or FFmpegRunner()
+
+    async def feed(stdin: asyncio.StreamWriter):
+        cursor = 0
+
+        async def write(data):
+            stdin.write(data)
+            await stdin.drain()
+
+        async def write_silence(frames: int):
+            while frames > 0:
+                size = min(frames, chunk_frames)
+                await write(silence[:size * channels * 2])
+                frames -= size
+
+        for offset, max_frames, path, tempo in plan_timeline(audio_files, sample_rate):
+            await write_silence(offset - cursor)
+            # The encoder already holds a runner slot, so decodes must not wait for one
+            pcm = await load_cue(path, tempo, sample_rate, channels, runner, nested=True)
+            pcm = pcm[:max_frames * channels]
+            await write(pcm.tobytes())
+            cursor = offset + len(pcm) // channels
+
+        await write_silence(timeline_frames(audio_files, total_ms, sample_rate) - cursor)
+
+    await runner.run(cmd, feed=feed, on_progress=on_progress)
+    return output_path
+
+
+def amix_command(inputs: List[Tuple[str, float]], output_path: str, duration: Optional[float] = None) -> List[str]:
+    """ffmpeg command mixing (path, delay_seconds) inputs without amix's per-input attenuation"""
+    cmd = ["ffmpeg", "-loglevel", "error"]
+    filters = []
+
+    for i, (path, delay) in enumerate(inputs):
+        cmd.extend(["-i", path])
+        filters.append(f"[{i}]adelay={int(round(delay * 1000))}:all=1[a{i}]")
+
+    mix_filter = "".join(f"[a{i}]" for i in range(len(inputs)))
+    filters.append(f"{mix_filter}amix=inputs={len(inputs)}:duration=longest:dropout_transition=0:normalize=0[out]")
+
+    cmd.extend(["-filter_complex", ";".join(filters), "-map", "[out]"])
+    if duration is not None:
+        cmd.extend(["-t", str(duration)])
+    cmd.extend([output_path, "-y"])
+    return cmd
+
+
+async def mix_hierarchical(
+        audio_files: List[Dict],
+        output_path: str,
+        temp_dir: str,
+        duration: Optional[float] = None,
+        fan_in: int = MIX_FAN_IN,
+        runner: FFmpegRunner = None,
+) -> str:
+    """
+    Mix any number of timed cue files with ffmpeg in bounded resources.
+    Cues are sorted by start and mixed `fan_in` at a time into short
+    intermediate WAVs (each offset from its group's first cue), level by
+    level, until one final mix of at most `fan_in` inputs remains.
+    """
+    level = sorted(((af["path"], af["start"]) for af in audio_files), key=lambda item: item[1])
+    runner = runner or FFmpegRunner()
+    # Intermediate mixes get a directory of their own, so concurrent calls
+    # sharing `temp_dir` never overwrite each other's parts
+    work_dir = tempfile.mkdtemp(prefix="mix_", dir=temp_dir)
+    depth = 0
+
+    try:
+        while len(level) > fan_in:
+            groups = [level[i:i + fan_in] for i in range(0, len(level), fan_in)]
+            next_level = []
+            commands = []
+
+            for k, group in enumerate(groups):
+                base = group[0][1]
+                part_path = os.path.join(work_dir, f"mix_{depth}_{k:05d}.wav")
+                commands.append(amix_command([(path, start - base) for path, start in group], part_path))
+                next_level.append((part_path, base))
+
+            logger.info(f"Mixing level {depth}: {len(level)} inputs into {len(groups)} parts")
+            await asyncio.gather(*(runner.run(cmd) for cmd in commands))
+
+            if depth > 0:
+                for path, _ in level:
+                    os.remove(path)
+            level = next_level
+            depth += 1
+
+        await runner.run(amix_command(level, output_path, duration))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
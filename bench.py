@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+from pydub import AudioSegment
+from typing import Dict, List
+
+from audio import SAMPLE_RATE, mix_hierarchical, render_timeline
+from mock_server import MockTranslateServer
+from network import ProviderClient
+from subtitles import write_cues
+from tools import VideoTool
+from translate import GoogleTranslator, translate_texts
+from tts import ToneTTSBackend
+
+
+def make_cues(count: int, folder: str, clips: int = 20) -> List[Dict]:
+    """Synthetic cues every 3 seconds, cycling through a few offline tone clips"""
+    backend = ToneTTSBackend()
+    paths = []
+    for i in range(min(clips, count)):
+        path = os.path.join(folder, f"clip_{i:02d}.wav")
+        asyncio.run(backend.synthesize("word " * (3 + i % 8), "bench", path))
+        paths.append(path)
+
+    return [
+        {"path": paths[i % len(paths)], "start": i * 3.0, "end": i * 3.0 + 2.5, "duration": 2.5}
+        for i in range(count)
+    ]
+
+
+def legacy_merge(audio_files: List[Dict], total_ms: float = 0) -> AudioSegment:
+    """The original merge_with_timing loop: grows one AudioSegment cue by cue"""
+    final_audio = AudioSegment.silent(duration=0)
+    for segment in audio_files:
+        start_ms = int(segment["start"] * 1000)
+        duration_ms = int(segment["duration"] * 1000)
+        audio = AudioSegment.from_file(segment["path"])[:duration_ms].set_frame_rate(SAMPLE_RATE)
+        if len(audio) < duration_ms:
+            audio += AudioSegment.silent(duration=duration_ms - len(audio))
+        gap = start_ms - len(final_audio)
+        if gap > 0:
+            final_audio += AudioSegment.silent(duration=gap)
+        final_audio += audio
+    if len(final_audio) < total_ms:
+        final_audio += AudioSegment.silent(duration=total_ms - len(final_audio))
+    return final_audio
+
+
+def legacy_mix(audio_files: List[Dict], output_path: str):
+    """The original merge_audio_segments: one ffmpeg call, one input + adelay per cue into a single amix"""
+    inputs = []
+    filters = []
+    for i, af in enumerate(audio_files):
+        inputs.extend(["-i", af["path"]])
+        filters.append(f"[{i}]adelay={int(af['start'] * 1000)}|{int(af['start'] * 1000)}[a{i}]")
+    mix_filter = "+".join(f"[a{i}]" for i in range(len(audio_files)))
+    filters.append(f"{mix_filter}amix=inputs={len(audio_files)}:duration=longest[out]")
+    total_duration = max(af["end"] for af in audio_files)
+    cmd = ["ffmpeg"] + inputs + ["-filter_complex", ";".join(filters), "-map", "[out]", "-t", str(total_duration), output_path, "-y"]
+    subprocess.run(cmd, check=True, capture_output=True, stdin=subprocess.DEVNULL)
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def bench_merge(args):
+    print(f"{'cues':>6} {'legacy (s)':>11} {'timeline (s)':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for count in args.cues:
+            cues = make_cues(count, folder)
+            legacy = timed(legacy_merge, cues) if count <= args.legacy_max else float("nan")
+            timeline = timed(asyncio.run, render_timeline(cues))
+            print(f"{count:>6} {legacy:>11.2f} {timeline:>13.2f} {legacy / timeline:>7.1f}x")
+
+
+def bench_mix(args):
+    print(f"{'cues':>6} {'single amix (s)':>16} {'hierarchical (s)':>17}")
+    with tempfile.TemporaryDirectory() as folder:
+        for count in args.cues:
+            cues = make_cues(count, folder)
+            output_path = os.path.join(folder, "mix.wav")
+            try:
+                legacy = f"{timed(legacy_mix, cues, output_path):.2f}"
+            except (subprocess.CalledProcessError, OSError) as e:
+                legacy = f"failed ({type(e).__name__})"
+            hierarchical = timed(asyncio.run, mix_hierarchical(cues, output_path, folder, fan_in=args.fan_in))
+            print(f"{count:>6} {legacy:>16} {hierarchical:>17.2f}")
+
+
+def make_video(path: str, seconds: int, size: str = "1280x720", gop: int = 60):
+    """Synthetic test pattern video with a tone track"""
+    subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop),
+            "-c:a", "aac", "-shortest", path, "-y",
+        ],
+        check=True,
+        stdin=subprocess.DEVNULL,
+    )
+
+
+async def bench_subtitle_modes(args, folder: str):
+    runs = [("soft", None), ("burn", args.preset), ("burn", "veryfast"), ("parallel", args.preset), ("parallel", "veryfast")]
+    service = VideoTool(tts_backend="tone", cache_dir=folder, metrics_file=None)
+
+    for seconds in args.seconds:
+        video_path = os.path.join(folder, f"video_{seconds}.mp4")
+        subtitle_path = os.path.join(folder, f"video_{seconds}_en.srt")
+        make_video(video_path, seconds)
+        write_cues(((i * 3000, i * 3000 + 2500, f"Subtitle line number {i}") for i in range(seconds // 3)), subtitle_path)
+
+        for mode, preset in runs:
+            service.burn_preset = preset or args.preset
+            output_path = os.path.join(folder, f"out_{seconds}_{mode}.mp4")
+            start = time.perf_counter()
+            await service.add_subtitles_to_video(video_path, subtitle_path, output_path, mode)
+            print(f"{seconds:>8} {mode:>9} {preset or '-':>9} {time.perf_counter() - start:>9.2f}")
+
+    service.cleanup()
+
+
+def bench_subtitles(args):
+    print(f"{'seconds':>8} {'mode':>9} {'preset':>9} {'time (s)':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(bench_subtitle_modes(args, folder))
+
+
+async def bench_network_modes(args, url: str, server: MockTranslateServer):
+    runs = [
+        ("no backoff", None),
+        ("retry only", dict(adaptive=False)),
+        ("adaptive", dict(adaptive=True)),
+        ("rate+adaptive", dict(adaptive=True, rate=args.server_rate * 0.9)),
+    ]
+
+    for name, options in runs:
+        texts = [f"{name} line number {i}" for i in range(args.lines)]
+        translator = GoogleTranslator("en", "km", base_url=url)
+        client = ProviderClient("bench", concurrency=args.concurrency, reset_timeout=2.0, **options) if options else None
+        before = server.stats()
+        start = time.perf_counter()
+        try:
+            await translate_texts(translator, texts, max_chars=args.batch_chars, concurrency=args.concurrency, client=client)
+            result = "ok"
+        except Exception as e:
+            result = type(e).__name__
+        seconds = time.perf_counter() - start
+
+        after = server.stats()
+        sent = after["requests"] - before["requests"]
+        throttled = after.get("http_429", 0) - before.get("http_429", 0)
+        limit = client.stats()["concurrency_limit"] if client else args.concurrency
+        print(f"{name:>14} {result:>16} {seconds:>8.2f} {args.lines / seconds:>8.1f} {sent:>9} {throttled:>6} {limit:>6}")
+
+
+def bench_network(args):
+    server = MockTranslateServer(args.server_rate, max_in_flight=args.server_concurrency, latency=args.latency, failure_rate=args.failure_rate)
+    url = server.serve()
+    print(f"{'client':>14} {'result':>16} {'time (s)':>8} {'lines/s':>8} {'requests':>9} {'429s':>6} {'limit':>6}")
+    try:
+        asyncio.run(bench_network_modes(args, url, server))
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="📊 Video.AI - Pipeline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="merge_with_timing: AudioSegment concatenation vs NumPy timeline")
+    merge.add_argument("--cues", help="Cue counts to test", type=int, nargs="+", default=[100, 250, 500, 1000, 2000])
+    merge.add_argument("--legacy_max", help="Skip the legacy merge above this many cues", type=int, default=1000)
+    merge.set_defaults(run=bench_merge)
+
+    mix = commands.add_parser("mix", help="merge_audio_segments: single amix graph vs hierarchical mixing (needs ffmpeg)")
+    mix.add_argument("--cues", help="Cue counts to test", type=int, nargs="+", default=[100, 500, 1500, 5000])
+    mix.add_argument("--fan_in", help="Inputs per ffmpeg call", type=int, default=64)
+    mix.set_defaults(run=bench_mix)
+
+    subtitles = commands.add_parser("subtitles", help="add_subtitles_to_video: soft track vs burn vs segment-parallel burn (needs ffmpeg)")
+    subtitles.add_argument("--seconds", help="Test video lengths", type=int, nargs="+", default=[60, 300])
+    subtitles.add_argument("--preset", help="Baseline x264 preset", default="medium")
+    subtitles.set_defaults(run=bench_subtitles)
+
+    network = commands.add_parser("network", help="translate_texts against a throttling local mock: no backoff vs retries vs adaptive limits")
+    network.add_argument("--lines", help="Subtitle lines to translate", type=int, default=2000)
+    network.add_argument("--batch_chars", help="Characters per request", type=int, default=500)
+    network.add_argument("--concurrency", help="Client concurrency (the adaptive maximum)", type=int, default=16)
+    network.add_argument("--server_rate", help="Mock requests per second before 429", type=float, default=40.0)
+    network.add_argument("--server_concurrency", help="Mock concurrent requests before 429", type=int, default=6)
+    network.add_argument("--latency", help="Mock seconds per request", type=float, default=0.05)
+    network.add_argument("--failure_rate", help="Mock fraction of 503 responses", type=float, default=0.02)
+    network.set_defaults(run=bench_network)
+
+    args = parser.parse_args()
+    args.run(args)
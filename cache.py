@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import unicodedata
+
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, collapsed whitespace"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_key(*parts: str) -> str:
+    """Stable hash of the given parts"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    On-disk translation memory keyed on (source lang, target lang,
+    normalized text). Least recently used rows are evicted once the
+    stored text exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str = "cache/translations.sqlite3", max_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.db.commit()
+
+    def key(self, source: str, target: str, text: str) -> str:
+        return content_key(source or "auto", target, normalize_text(text))
+
+    def get_many(self, source: str, target: str, texts: List[str]) -> Dict[str, str]:
+        """Return {text: translation} for every text already in the cache"""
+        keys = {self.key(source, target, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.db.execute(
+                f"SELECT key, translation FROM translations WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            found.update({keys[key]: translation for key, translation in rows})
+
+        if found:
+            hit_keys = [(time.time(), self.key(source, target, text)) for text in found]
+            self.db.executemany("UPDATE translations SET last_used = ? WHERE key = ?", hit_keys)
+            self.db.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, source: str, target: str, pairs: List[Tuple[str, str]]):
+        """Store (text, translation) pairs and evict if over the size cap"""
+        now = time.time()
+        rows = [
+            (
+                self.key(source, target, text),
+                source or "auto",
+                target,
+                normalize_text(text),
+                translation,
+                len(text.encode("utf-8")) + len(translation.encode("utf-8")),
+                now,
+            )
+            for text, translation in pairs
+        ]
+        self.db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used rows until the cache is under max_bytes"""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in self.db.execute("SELECT key, size FROM translations ORDER BY last_used"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+
+        self.db.executemany("DELETE FROM translations WHERE key = ?", stale)
+        self.db.commit()
+        logger.info(f"Evicted {len(stale)} cached translations ({freed} bytes)")
+
+    def stats(self) -> Dict:
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translations").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+class AudioCache:
+    """
+    Content-addressed store for synthesized speech, shared across videos.
+    Files are named by hash of (normalized text, voice, backend settings)
+    and evicted least-recently-used first once over `max_bytes`, down to
+    `evict_to` of it. The size is counted on startup and then kept as a
+    running total, so the cache is only walked again when eviction is due.
+    """
+
+    def __init__(self, root: str = "cache/tts", max_bytes: int = 2 * 1024 * 1024 * 1024, evict_to: float = 0.9):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evict_to = evict_to
+        self.hits = 0
+        self.misses = 0
+        # Counted before any clip is written, so each new clip is added once
+        self.total = sum(size for _, size, _ in self.entries())
+
+    def path_for(self, text: str, voice: str, signature: str, extension: str = "mp3") -> str:
+        key = content_key(normalize_text(text), voice, signature)
+        return os.path.join(self.root, key[:2], f"{key}.{extension}")
+
+    def lookup(self, path: str) -> bool:
+        """Return True if the clip is cached, refreshing its LRU position"""
+        if os.path.exists(path):
+            os.utime(path)
+            self.hits += 1
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.misses += 1
+        return False
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) for every cached clip"""
+        entries = []
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """Bytes of cached clips, as far as this process knows"""
+        return self.total
+
+    def add(self, path: str):
+        """Count a newly written clip towards the cache size"""
+        self.total += os.path.getsize(path)
+
+    def evict(self):
+        """
+        Delete least recently used clips once the cache is over max_bytes.
+        Clips written by other processes aren't in the running total; the
+        walk here recounts them before deciding what to remove.
+        """
+        if self.size() <= self.max_bytes:
+            return
+
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.evict_to
+        removed = 0
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # evicted by another process
+            total -= size
+            removed += 1
+
+        self.total = total
+        if removed:
+            logger.info(f"Evicted {removed} cached audio clips")
+
+    def stats(self) -> Dict:
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded media: each file is kept once,
+    named by the SHA-256 of its bytes, however many times and under
+    whatever names it is uploaded. Files on the same filesystem are
+    hardlinked rather than copied.
+    """
+
+    def __init__(self, root: str = "cache/uploads", chunk_size: int = 1024 * 1024):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}{extension.lower()}")
+
+    def hash_file(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def copy_hashing(self, source: str, part_path: str) -> str:
+        """Copy `source` in chunks, hashing as it goes, so the file is read once"""
+        digest = hashlib.sha256()
+        with open(source, "rb") as src, open(part_path, "wb") as dst:
+            for chunk in iter(lambda: src.read(self.chunk_size), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        return digest.hexdigest()
+
+    def store(self, source: str) -> Tuple[str, str]:
+        """Add a file and return (digest, stored path); known content is not written again"""
+        extension = os.path.splitext(source)[1]
+
+        if os.stat(source).st_dev == os.stat(self.root).st_dev:
+            digest = self.hash_file(source)
+            path = self.path_for(digest, extension)
+            if os.path.exists(path):
+                self.hits += 1
+                return digest, path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(source, path)
+                self.misses += 1
+                return digest, path
+            except FileExistsError:
+                self.hits += 1
+                return digest, path
+            except OSError:
+                pass  # e.g. hardlinks unsupported; fall back to copying
+
+        part_path = os.path.join(self.root, f".{os.getpid()}_{time.time_ns()}.part")
+        try:
+            digest = self.copy_hashing(source, part_path)
+            path = self.path_for(digest, extension)
+            if os.path.exists(path):
+                self.hits += 1
+                return digest, path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(part_path, path)
+            self.misses += 1
+            return digest, path
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
@@ -215,3 +215,36 @@ EDGE_TTS_VOICES = {
     "cy": "cy-GB-NiaNeural",
     "zu": "zu-ZA-ThembaNeural"
 }
+
+# ISO 639-2 tags for audio/subtitle stream metadata in MP4/MKV containers
+
+LANGUAGE_TAGS = {
+    "ar": "ara",
+    "bn": "ben",
+    "de": "deu",
+    "en": "eng",
+    "es": "spa",
+    "fil": "fil",
+    "fr": "fra",
+    "hi": "hin",
+    "id": "ind",
+    "it": "ita",
+    "ja": "jpn",
+    "km": "khm",
+    "ko": "kor",
+    "lo": "lao",
+    "ms": "msa",
+    "my": "mya",
+    "nl": "nld",
+    "pl": "pol",
+    "pt": "por",
+    "ru": "rus",
+    "th": "tha",
+    "tl": "tgl",
+    "tr": "tur",
+    "uk": "ukr",
+    "vi": "vie",
+    "zh": "zho",
+    "zh-CN": "zho",
+    "zh-TW": "zho"
+}
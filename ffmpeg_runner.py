@@ -0,0 +1,129 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressFn = Callable[[Dict[str, str]], None]
+FeedFn = Callable[[asyncio.StreamWriter], Awaitable[None]]
+
+
+class FFmpegError(RuntimeError):
+    """An ffmpeg/ffprobe process failed or timed out"""
+
+    def __init__(self, cmd: List[str], returncode: Optional[int], stderr: str):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+        reason = "timed out" if returncode is None else f"exited with {returncode}"
+        super().__init__(f"{cmd[0]} {reason}:\n{stderr}")
+
+
+class FFmpegRunner:
+    """
+    Runs ffmpeg/ffprobe without blocking the event loop. At most
+    `concurrency` processes run at once; each may have a timeout, is
+    killed when its task is cancelled, and reports `-progress` updates
+    (out_time, fps, speed, total_size, ...) to an optional callback.
+    """
+
+    def __init__(self, concurrency: int = os.cpu_count() or 1, timeout: Optional[float] = None):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.timeout = timeout
+
+    async def run(
+            self,
+            cmd: List[str],
+            timeout: Optional[float] = None,
+            on_progress: Optional[ProgressFn] = None,
+            feed: Optional[FeedFn] = None,
+            capture_stdout: bool = False,
+            nested: bool = False,
+    ) -> bytes:
+        """
+        Run `cmd` and return its stdout (when `capture_stdout`). `feed`
+        receives the process stdin writer for piping data in; stdin is
+        closed otherwise so ffmpeg never waits on the terminal. A `nested`
+        call works for a process already holding a slot (e.g. decoding
+        the cues an encoder is fed) and does not wait for another one.
+        """
+        cmd = list(cmd)
+        progress = on_progress is not None and not capture_stdout and cmd[0] == "ffmpeg"
+        if progress:
+            cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+
+        async with self.semaphore if not nested else contextlib.nullcontext():
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if feed else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE if progress or capture_stdout else asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stderr_tail = deque(maxlen=50)
+            tasks = [asyncio.create_task(self._read_stderr(process.stderr, stderr_tail))]
+            stdout_task = None
+
+            if progress:
+                tasks.append(asyncio.create_task(self._read_progress(process.stdout, on_progress)))
+            elif capture_stdout:
+                stdout_task = asyncio.create_task(process.stdout.read())
+                tasks.append(stdout_task)
+            if feed:
+                tasks.append(asyncio.create_task(self._feed(feed, process.stdin)))
+
+            waiter = asyncio.gather(*tasks, process.wait())
+            try:
+                # Shielded so a timeout stops waiting without cancelling the pipe readers
+                await asyncio.wait_for(asyncio.shield(waiter), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                await self._kill(process, tasks)
+                raise FFmpegError(cmd, None, "\n".join(stderr_tail))
+            except BaseException:
+                # Cancelled (or a feed error): never leave an orphaned encoder behind
+                await self._kill(process, tasks)
+                raise
+
+        if process.returncode != 0:
+            raise FFmpegError(cmd, process.returncode, "\n".join(stderr_tail))
+        return stdout_task.result() if stdout_task else b""
+
+    async def _feed(self, feed: FeedFn, stdin: asyncio.StreamWriter):
+        try:
+            await feed(stdin)
+            stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process exited early; its stderr explains why
+            pass
+
+    async def _read_stderr(self, stream: asyncio.StreamReader, tail: deque):
+        async for line in stream:
+            tail.append(line.decode(errors="replace").rstrip())
+
+    async def _read_progress(self, stream: asyncio.StreamReader, on_progress: ProgressFn):
+        """Parse `-progress` key=value blocks, each terminated by a progress= line"""
+        block = {}
+        async for line in stream:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            block[key] = value
+            if key == "progress":
+                on_progress(block)
+                block = {}
+
+    async def _kill(self, process: asyncio.subprocess.Process, tasks: List[asyncio.Task]):
+        """Stop the process, then give its pipe readers a moment to reach EOF"""
+        if process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+        _, pending = await asyncio.wait(tasks, timeout=1)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from typing import Dict, List, Optional
+
+from tools import VideoTool
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+
+
+class JobQueue:
+    """
+    Dubbing jobs persisted in SQLite, so submissions survive a restart and
+    any number of threads can submit, claim and poll. A job moves
+    queued → running → done | failed; claiming is atomic, so one job is
+    never picked up by two workers.
+    """
+
+    def __init__(self, path: str = "cache/jobs.sqlite3"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                video_path TEXT NOT NULL,
+                input_key TEXT,
+                params TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "input_key" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN input_key TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_input_key ON jobs (input_key, status)")
+
+    def execute(self, sql: str, args=()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.db.execute(sql, args)
+
+    def query(self, sql: str, args=()) -> List[sqlite3.Row]:
+        """Rows of a SELECT, fetched while holding the lock: the shared
+        connection's cursors must not be stepped by two threads at once"""
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def submit(self, video_path: str, input_key: Optional[str] = None, **params) -> str:
+        """
+        Queue a job. `input_key` identifies the input content and params;
+        if a finished job with the same key still has its outputs, the new
+        job completes immediately with that job's result.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        previous = self.find_done(input_key)
+        if previous:
+            # Inserted as done, so no worker can claim it in between
+            self.execute(
+                "INSERT INTO jobs (id, status, video_path, input_key, params, progress, message, result, created_at, finished_at)"
+                " VALUES (?, 'done', ?, ?, ?, 1, ?, ?, ?, ?)",
+                (job_id, video_path, input_key, json.dumps(params), f"Reused job {previous['id']}",
+                 json.dumps(previous["result"]), time.time(), time.time()),
+            )
+            logger.info(f"Job {job_id} reuses the outputs of job {previous['id']}")
+            return job_id
+
+        self.execute(
+            "INSERT INTO jobs (id, status, video_path, input_key, params, message, created_at) VALUES (?, 'queued', ?, ?, ?, 'Queued', ?)",
+            (job_id, video_path, input_key, json.dumps(params), time.time()),
+        )
+        logger.info(f"Queued job {job_id} for {video_path}")
+        return job_id
+
+    def find_done(self, input_key: Optional[str]) -> Optional[Dict]:
+        """Latest finished job for `input_key` whose output files all still exist"""
+        if not input_key:
+            return None
+        rows = self.query(
+            "SELECT * FROM jobs WHERE input_key = ? AND status = 'done' ORDER BY finished_at DESC",
+            (input_key,),
+        )
+        for row in rows:
+            job = self.to_dict(row)
+            if all(os.path.exists(path) for path in job["result"].get("files_created", [])):
+                return job
+        return None
+
+    def claim(self) -> Optional[Dict]:
+        """Mark the oldest queued job as running and return it, None if the queue is empty"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    self.db.execute(
+                        "UPDATE jobs SET status = 'running', message = 'Starting', started_at = ? WHERE id = ?",
+                        (time.time(), row["id"]),
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return self.to_dict(row) if row else None
+
+    def progress(self, job_id: str, progress: float, message: str):
+        self.execute("UPDATE jobs SET progress = ?, message = ? WHERE id = ?", (progress, message, job_id))
+
+    def finish(self, job_id: str, result: Dict, message: str = "Done"):
+        self.execute(
+            "UPDATE jobs SET status = 'done', progress = 1, message = ?, result = ?, finished_at = ? WHERE id = ?",
+            (message, json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str):
+        self.execute(
+            "UPDATE jobs SET status = 'failed', message = 'Failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, time.time(), job_id),
+        )
+
+    def requeue_running(self) -> int:
+        """Put jobs left running by a crashed process back in the queue"""
+        cursor = self.execute("UPDATE jobs SET status = 'queued', progress = 0, message = 'Requeued' WHERE status = 'running'")
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        rows = self.query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self.to_dict(rows[0]) if rows else None
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        rows = self.query("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self.to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.query("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: 0 for status in JOB_STATUSES} | {status: count for status, count in rows}
+
+    def to_dict(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def close(self):
+        self.db.close()
+
+
+class JobWorkers:
+    """
+    Runs queued jobs on a background thread with its own event loop, so
+    the web UI never waits on ffmpeg, translation or TTS. `workers` jobs
+    run at once and share one VideoTool: provider and ffmpeg limits apply
+    across all jobs, not per job.
+    """
+
+    def __init__(self, queue: JobQueue, output_dir: str, workers: int = 2, poll_interval: float = 1.0, **options):
+        self.queue = queue
+        self.output_dir = output_dir
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.options = options
+        self.thread = None
+        self.loop = None
+        self.stopping = None
+
+    def start(self):
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs")
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True, name="job-workers")
+        self.thread.start()
+
+    def stop(self):
+        if self.loop and self.stopping:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread:
+            self.thread.join()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        service = VideoTool(**self.options)
+        try:
+            await asyncio.gather(*(self.work(service) for _ in range(self.workers)))
+        finally:
+            service.cleanup()
+
+    async def work(self, service: VideoTool):
+        while not self.stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(service, job)
+
+    async def run_job(self, service: VideoTool, job: Dict):
+        job_id = job["id"]
+        params = job["params"]
+
+        # An identical job may have finished while this one was queued
+        previous = self.queue.find_done(job["input_key"])
+        if previous:
+            self.queue.finish(job_id, previous["result"], f"Reused job {previous['id']}")
+            return
+
+        languages = params.get("languages") or ["km"]
+        output_path = os.path.join(self.output_dir, f"{job_id}_{'_'.join(languages)}.mp4")
+        os.makedirs(self.output_dir, exist_ok=True)
+        logger.info(f"Job {job_id}: dubbing {job['video_path']} into {', '.join(languages)}")
+
+        try:
+            result = await service.translate_video(
+                job["video_path"],
+                languages,
+                output_path,
+                include_audio=params.get("include_audio", True),
+                include_subtitles=params.get("include_subtitles", True),
+                subtitle_path=params.get("subtitle_path"),
+                source_lang=params.get("source_lang"),
+                on_progress=lambda progress, message: self.queue.progress(job_id, progress, message),
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if result["success"]:
+            self.queue.finish(job_id, result)
+        else:
+            self.queue.fail(job_id, result["error"])
@@ -1,90 +1,348 @@
 import os
 import asyncio
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from os.path import dirname
 from dotenv import load_dotenv
 import argparse
 
+from audio import SAMPLE_RATE
+from pipeline import Pipeline
+from subtitles import SUBTITLE_FORMATS
+from video import SUBTITLE_MODES
 from tools import create_logger, VideoTool, pp, dd
+from translate import TRANSLATORS
+from tts import TTS_BACKENDS
 
 load_dotenv()
 
 logger = create_logger(__name__)
 
+STAGES = ["translate", "tts", "merge", "output", "mux", "subtitles"]
+
+
 def debug(data):
     logger.debug(data)
     print(data)
 
+def print_cache_stats(service: VideoTool):
+    print("Video.AI Cache:")
+    for name, stats in [
+        ("Translations", service.translation_cache.stats()),
+        ("TTS audio", service.audio_cache.stats()),
+    ]:
+        print(f"  {name:<13}: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+def service_options(args) -> dict:
+    """VideoTool settings from the CLI, picklable for worker processes"""
+    return dict(
+        tts_concurrency=args.tts_concurrency,
+        tts_retries=args.tts_retries,
+        tts_backend=args.tts_backend,
+        translator=args.translator,
+        translate_concurrency=args.translate_concurrency,
+        cache_dir=args.cache_dir,
+        merge_mode=args.merge_mode,
+        speech_fit=args.speech_fit,
+        cue_grouping=args.cue_grouping,
+        ffmpeg_concurrency=args.ffmpeg_concurrency,
+        ffmpeg_timeout=args.ffmpeg_timeout,
+        metrics_file=args.metrics_file,
+        subtitle_mode=args.subtitle_mode,
+        burn_preset=args.burn_preset,
+        burn_crf=args.burn_crf,
+        burn_threads=args.burn_threads,
+        duck_original=args.duck_original,
+        translate_rate=args.translate_rate,
+        tts_rate=args.tts_rate,
+        translate_url=args.translate_url,
+    )
+
+
 async def main(args):
+    if args.cache_stats:
+        service = VideoTool(cache_dir=args.cache_dir)
+        print_cache_stats(service)
+        service.cleanup()
+        return
+
     FILE_NAME = args.video_name or os.getenv("VIDEO_NAME")
     input_dir = Path(args.input_dir or os.getenv("INPUT_DIR"))
     output_dir = Path(args.output_dir or os.getenv("OUTPUT_DIR"))
 
-    if not FILE_NAME:
-        parser.error("Missing required: --video_name or VIDEO_NAME in .env")
+    if not FILE_NAME and not args.batch:
+        parser.error("Missing required: --video_name or VIDEO_NAME in .env (or use --batch)")
 
     print("Video.AI Configuration:")
-    print(f"  📼 Video Name : {FILE_NAME}")
+    print(f"  📼 Video Name : {'(batch)' if args.batch else FILE_NAME}")
     print(f"  📂 Input Dir  : {input_dir}")
     print(f"  💾 Output Dir : {output_dir}")
 
-    service = VideoTool()
+    service = VideoTool(**service_options(args))
+    if args.metrics_port:
+        service.metrics.serve(args.metrics_port)
 
-    en_sub_title_path = input_dir / f"{FILE_NAME}_en.srt"
-    km_sub_title_path = output_dir / f"{FILE_NAME}_km.srt"
+    try:
+        if args.batch:
+            await dub_batch(service, args, input_dir, output_dir)
+        elif args.languages:
+            await dub_languages(service, FILE_NAME, input_dir, output_dir, args.source_lang, args.languages)
+        else:
+            await dub_video(
+                service,
+                FILE_NAME,
+                input_dir,
+                output_dir,
+                args.source_lang,
+                args.target_lang,
+                args.force,
+                args.output_mode == "combined",
+            )
+    finally:
+        service.cleanup()
 
-    input_video_path = input_dir / f"{FILE_NAME}.mp4"
-    output_video_path = output_dir / input_video_path.name
-    audio_output_path = output_video_path.with_suffix(".wav")
-    ex_audio_output_path = output_video_path.with_suffix(".mp3")
 
-    video_subtitle_path = output_dir / f"{FILE_NAME}_km.mp4"
+def find_subtitle(input_dir: Path, file_name: str, lang: str) -> str:
+    """<name>_<lang>.srt, or a .vtt/.ass/.ssa with that name if there is one"""
+    for extension in SUBTITLE_FORMATS:
+        path = input_dir / f"{file_name}_{lang}{extension}"
+        if path.exists():
+            return str(path)
+    return str(input_dir / f"{file_name}_{lang}.srt")
 
-    os.makedirs(dirname(output_video_path), exist_ok=True)
-    
-    
-    try:
-        # voices = service.list_available_voices()
-        # print("Available voices:", pp(voices))
-        input_video_path = str(input_video_path)
-        km_sub_title_path = str(km_sub_title_path)
-        audio_output_path = str(audio_output_path)
-        ex_audio_output_path = str(ex_audio_output_path)
-        output_video_path = str(output_video_path)
-        video_subtitle_path = str(video_subtitle_path)
-
-        # if not os.path.exists(km_sub_title_path):
-        #     debug(f"Subtitle does not exist: {km_sub_title_path}")
-        #     text = await service.translate_sub_title(str(en_sub_title_path), km_sub_title_path)
-        #     debug(text)
-        
-        dd([
-            input_video_path,
-            ex_audio_output_path
-        ])
-        
-        await service.extract_audio(input_video_path, ex_audio_output_path)
-
-        if not os.path.exists(audio_output_path):
-            debug(f"Audio file does not exist: {audio_output_path}")
-            audio = await service.subtitle_to_voice(km_sub_title_path, audio_output_path)
-            debug(audio)
-
-        # if not os.path.exists(output_video_path):
-        #     debug(f"Video file does not exist: {audio_output_path}")
-        #     service.combine_video_audio(input_video_path, audio_output_path, output_video_path)
-
-        # if not os.path.exists(video_subtitle_path):
-        #     debug(f"Video with subtitle file does not exist: {video_subtitle_path}")
-        #     service.add_subtitles_to_video(input_video_path, km_sub_title_path, video_subtitle_path)
 
+def job_paths(file_name: str, input_dir: Path, output_dir: Path, source_lang: str, target_lang: str) -> dict:
+    return {
+        "source_srt": find_subtitle(input_dir, file_name, source_lang),
+        "target_srt": str(output_dir / f"{file_name}_{target_lang}.srt"),
+        "video": str(input_dir / f"{file_name}.mp4"),
+        "segments": str(output_dir / f"{file_name}_{target_lang}.segments.json"),
+        "audio": str(output_dir / f"{file_name}_{target_lang}.wav"),
+        "dubbed_video": str(output_dir / f"{file_name}_{target_lang}_dub.mp4"),
+        "subtitled_video": str(output_dir / f"{file_name}_{target_lang}.mp4"),
+        "manifest": str(output_dir / f"{file_name}_{target_lang}.manifest.json"),
+    }
+
+
+async def network_stages(service: VideoTool, paths: dict, pipeline: Pipeline, target_lang: str):
+    """translate → tts: bound by provider round trips, run on the event loop"""
+    # A hand-made target subtitle without a source is used as-is
+    if os.path.exists(paths["source_srt"]) or not os.path.exists(paths["target_srt"]):
+        await pipeline.stage(
+            "translate",
+            lambda: service.translate_sub_title(paths["source_srt"], paths["target_srt"]),
+            inputs=[paths["source_srt"]],
+            outputs=[paths["target_srt"]],
+            params={"translator": service.translator},
+        )
+
+    await pipeline.stage(
+        "tts",
+        lambda: service.synthesize_subtitles(paths["target_srt"], paths["segments"]),
+        inputs=[paths["target_srt"]],
+        outputs=[paths["segments"]],
+        params={
+            "backend": service.tts_backend.signature,
+            "voice": service.voice_for(target_lang),
+            "speech_fit": service.speech_fit,
+            "cue_grouping": service.cue_grouping,
+        },
+        # Clips evicted from the audio cache since are synthesized again
+        valid=lambda: not service.missing_clips(paths["segments"]),
+    )
+
+
+async def media_stages(service: VideoTool, paths: dict, pipeline: Pipeline, combined: bool = True):
+    """
+    merge → output (dub, ducked original and subtitles in one ffmpeg pass),
+    or merge → mux → subtitles writing separate dubbed and subtitled files
+    """
+    await pipeline.stage(
+        "merge",
+        # A forced merge renders the whole track instead of patching changed cues
+        lambda: service.merge_segments(
+            paths["segments"], paths["audio"], paths["video"], incremental="merge" not in pipeline.force
+        ),
+        inputs=[paths["segments"], paths["video"]],
+        outputs=[paths["audio"]],
+        params={"sample_rate": SAMPLE_RATE},
+    )
+
+    if combined:
+        await pipeline.stage(
+            "output",
+            lambda: service.render_output(paths["video"], paths["audio"], paths["dubbed_video"], paths["target_srt"]),
+            inputs=[paths["video"], paths["audio"], paths["target_srt"]],
+            outputs=[paths["dubbed_video"]],
+            params={
+                "mode": service.subtitle_mode,
+                "preset": service.burn_preset,
+                "crf": service.burn_crf,
+                "duck_original": service.duck_original,
+            },
+        )
+        return
+
+    await pipeline.stage(
+        "mux",
+        lambda: service.combine_video_audio(paths["video"], paths["audio"], paths["dubbed_video"]),
+        inputs=[paths["video"], paths["audio"]],
+        outputs=[paths["dubbed_video"]],
+    )
+
+    await pipeline.stage(
+        "subtitles",
+        lambda: service.add_subtitles_to_video(paths["video"], paths["target_srt"], paths["subtitled_video"]),
+        inputs=[paths["video"], paths["target_srt"]],
+        outputs=[paths["subtitled_video"]],
+        params={"mode": service.subtitle_mode, "preset": service.burn_preset, "crf": service.burn_crf},
+    )
+
+
+async def dub_video(
+        service: VideoTool,
+        file_name: str,
+        input_dir: Path,
+        output_dir: Path,
+        source_lang: str = "en",
+        target_lang: str = "km",
+        force=None,
+        combined: bool = True,
+) -> Pipeline:
+    """Run translate → tts → merge → output, skipping stages whose inputs are unchanged"""
+    paths = job_paths(file_name, input_dir, output_dir, source_lang, target_lang)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pipeline = Pipeline(paths["manifest"], force, service.metrics)
+    await network_stages(service, paths, pipeline, target_lang)
+    await media_stages(service, paths, pipeline, combined)
+    return pipeline
+
+
+async def dub_languages(
+        service: VideoTool, file_name: str, input_dir: Path, output_dir: Path, source_lang: str, languages: list
+):
+    """Dub one video into several languages, muxed as one multi-track MP4"""
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = str(output_dir / f"{file_name}_{'_'.join(languages)}.mp4")
+    # Without a subtitle file next to the video, its embedded track is used
+    subtitle_path = find_subtitle(input_dir, file_name, source_lang)
+    result = await service.translate_video(
+        str(input_dir / f"{file_name}.mp4"),
+        languages,
+        output_path,
+        subtitle_path=subtitle_path if os.path.exists(subtitle_path) else None,
+        source_lang=source_lang,
+    )
+    if not result["success"]:
+        raise SystemExit(f"Translation failed: {result['error']}")
+    print(f"  ✅ {output_path}")
+    return result
+
+
+def run_media_stages(options: dict, paths: dict, force=None, combined: bool = True):
+    """Process-pool entry point: merge and output for one video"""
+    service = VideoTool(**options)
+    try:
+        asyncio.run(media_stages(service, paths, Pipeline(paths["manifest"], force, service.metrics), combined))
     finally:
         service.cleanup()
 
 
+def discover_videos(input_dir: Path, source_lang: str = "en") -> list:
+    """(name, subtitle lang) for every <name>.mp4 with a <name>_<lang>.srt/.vtt/.ass next to it"""
+    extensions = "|".join(re.escape(extension.lstrip(".")) for extension in SUBTITLE_FORMATS)
+    names = sorted(path.name for path in input_dir.iterdir())
+    videos = []
+    for video in sorted(input_dir.glob("*.mp4")):
+        # Only <name>_<lang>.<ext>: ep1 must not pick up ep1_extra_en.srt
+        pattern = re.compile(rf"{re.escape(video.stem)}_([a-z]{{2,3}}(?:-[A-Z]{{2}})?)\.(?:{extensions})")
+        langs = [match.group(1) for match in map(pattern.fullmatch, names) if match]
+        if langs:
+            videos.append((video.stem, source_lang if source_lang in langs else langs[0]))
+        else:
+            logger.warning(f"Skipping {video.name}: no subtitle found")
+    return videos
+
+
+async def dub_batch(service: VideoTool, args, input_dir: Path, output_dir: Path):
+    """
+    Dub every video in input_dir. Translation and TTS for all videos share
+    this process's event loop and provider limits; merge/mux run on a
+    process pool so encodes scale with cores.
+    """
+    videos = discover_videos(input_dir, args.source_lang)
+    print(f"  🎞️  Videos     : {len(videos)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    loop = asyncio.get_running_loop()
+    options = service_options(args)
+    results = []
+
+    async def dub(file_name: str, source_lang: str, pool: ProcessPoolExecutor):
+        started = time.time()
+        paths = job_paths(file_name, input_dir, output_dir, source_lang, args.target_lang)
+        try:
+            await network_stages(service, paths, Pipeline(paths["manifest"], args.force, service.metrics), args.target_lang)
+            await loop.run_in_executor(
+                pool, run_media_stages, options, paths, args.force, args.output_mode == "combined"
+            )
+            status = "ok"
+        except Exception as e:
+            logger.error(f"Batch job {file_name} failed: {e}")
+            status = f"failed: {e}"
+        results.append((file_name, status, time.time() - started))
+        print(f"  {'✅' if status == 'ok' else '❌'} {file_name}: {status} ({time.time() - started:.1f}s)")
+
+    # Spawned, not forked: this process already runs translation threads
+    # and logging handlers whose locks a forked child could inherit held
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        await asyncio.gather(*(dub(name, lang, pool) for name, lang in videos))
+
+    print("Video.AI Batch Summary:")
+    for file_name, status, seconds in sorted(results):
+        print(f"  {file_name:<30} {status:<10} {seconds:>8.1f}s")
+
+    failed = sum(1 for _, status, _ in results if status != "ok")
+    if failed:
+        raise SystemExit(f"{failed} of {len(results)} videos failed")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="🎥 Video.AI - Process video input with AI options")
     parser.add_argument("--video_name", help="Vide file name")
     parser.add_argument("--input_dir", help="Input path", default=None)
     parser.add_argument("--output_dir", help="Output path", default=None)
+    parser.add_argument("--batch", help="Dub every <name>.mp4 + <name>_<lang>.srt/.vtt/.ass in the input dir", action="store_true")
+    parser.add_argument("--workers", help="Processes for merge/encode in batch mode", type=int, default=os.cpu_count())
+    parser.add_argument("--source_lang", help="Subtitle language to translate from", default="en")
+    parser.add_argument("--target_lang", help="Language to dub into", default="km")
+    parser.add_argument("--languages", help="Dub into several languages at once, muxed into one MP4", nargs="+")
+    parser.add_argument("--force", help="Re-run these stages even if up to date", nargs="*", choices=STAGES, default=[])
+    parser.add_argument("--cache_dir", help="Translation and TTS cache path", default="cache")
+    parser.add_argument("--cache_stats", help="Print cache statistics and exit", action="store_true")
+    parser.add_argument("--merge_mode", help="Render the dub track in memory or stream it to ffmpeg", choices=["auto", "memory", "stream"], default="auto")
+    parser.add_argument("--cue_grouping", help="Speak a sentence split over several subtitles as one clip", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--speech_fit", help="Stretch or speed up speech that overruns its subtitle", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--subtitle_mode", help="Attach subtitles as a track (soft) or burn them in, optionally in parallel segments", choices=SUBTITLE_MODES, default="burn")
+    parser.add_argument("--burn_preset", help="x264 preset when burning subtitles", default="medium")
+    parser.add_argument("--burn_crf", help="x264 CRF when burning subtitles", type=int, default=23)
+    parser.add_argument("--burn_threads", help="Encoder threads when burning (0 = auto)", type=int, default=0)
+    parser.add_argument("--output_mode", help="One pass writing dub + subtitles, or separate dubbed and subtitled files", choices=["combined", "separate"], default="combined")
+    parser.add_argument("--duck_original", help="Keep the original audio, lowered under the dub", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--ffmpeg_concurrency", help="Max ffmpeg processes at once", type=int, default=os.cpu_count())
+    parser.add_argument("--ffmpeg_timeout", help="Seconds before an ffmpeg call is killed", type=float, default=None)
+    parser.add_argument("--metrics_file", help="Append JSON lines metrics here (empty to disable)", default="logs/metrics.jsonl")
+    parser.add_argument("--metrics_port", help="Serve Prometheus metrics on this port while running", type=int, default=None)
+    parser.add_argument("--tts_concurrency", help="Max TTS requests in flight", type=int, default=8)
+    parser.add_argument("--tts_backend", help="Speech backend ('tone' runs offline)", choices=TTS_BACKENDS, default="edge")
+    parser.add_argument("--tts_retries", help="Retries per subtitle on TTS failure", type=int, default=3)
+    parser.add_argument("--translator", help="Translation provider ('fake' runs offline)", choices=TRANSLATORS, default="google")
+    parser.add_argument("--translate_concurrency", help="Max translation requests in flight", type=int, default=4)
+    parser.add_argument("--translate_rate", help="Max translation requests per second (0 = unlimited)", type=float, default=5.0)
+    parser.add_argument("--tts_rate", help="Max TTS requests per second (0 = unlimited)", type=float, default=0.0)
+    parser.add_argument("--translate_url", help="Google Translate endpoint, e.g. a local mock_server.py", default=None)
     asyncio.run(main(parser.parse_args()))
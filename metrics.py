@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "videoai"
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def metric_key(name: str, labels: Dict) -> MetricKey:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+    Pipeline measurements: counters (cues, bytes, cache lookups), gauges
+    (cues/sec, hit rates, ffmpeg fps) and stage timings. Every observation
+    is appended to a JSON lines file so runs can be compared afterwards,
+    and the current values can be served as Prometheus text.
+    """
+
+    def __init__(self, path: Optional[str] = "logs/metrics.jsonl"):
+        self.path = path
+        self.counters: Dict[MetricKey, float] = {}
+        self.gauges: Dict[MetricKey, float] = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def emit(self, event: str, **fields):
+        """Append one JSON line (several processes may share the file)"""
+        if not self.path:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, "pid": os.getpid(), **fields})
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[metric_key(name, labels)] = value
+
+    def throughput(self, name: str, items: int, seconds: float, **labels):
+        """Record `items` processed in `seconds`, e.g. cues translated or synthesized"""
+        rate = items / seconds if seconds > 0 else 0.0
+        self.inc(f"{name}_items_total", items, **labels)
+        self.inc(f"{name}_seconds_total", seconds, **labels)
+        self.set(f"{name}_items_per_second", rate, **labels)
+        self.emit(name, items=items, seconds=round(seconds, 3), per_second=round(rate, 2), **labels)
+
+    def cache(self, name: str, hits: int, misses: int):
+        """Cumulative hit rate of a cache"""
+        lookups = hits + misses
+        self.set("cache_hits", hits, cache=name)
+        self.set("cache_misses", misses, cache=name)
+        self.set("cache_hit_rate", hits / lookups if lookups else 0.0, cache=name)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Time a block as `name`; the yielded dict can carry extra fields
+        (e.g. bytes) into the JSON line.
+        """
+        extra = {}
+        started = time.time()
+        try:
+            yield extra
+        finally:
+            seconds = time.time() - started
+            self.inc(f"{name}_seconds_total", seconds, **labels)
+            self.inc(f"{name}_runs_total", 1, **labels)
+            self.set(f"{name}_last_seconds", seconds, **labels)
+            if "bytes" in extra:
+                self.inc(f"{name}_bytes_total", extra["bytes"], **labels)
+            self.emit(name, seconds=round(seconds, 3), **labels, **extra)
+
+    def render(self) -> str:
+        """Current values in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                by_name: Dict[str, list] = {}
+                for (name, labels), value in sorted(values.items()):
+                    by_name.setdefault(name, []).append((labels, value))
+
+                for name, samples in by_name.items():
+                    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+                    for labels, value in samples:
+                        label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                        lines.append(f"{PREFIX}_{name}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        """Serve /metrics from a background thread for the life of the process"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
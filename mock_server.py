@@ -0,0 +1,138 @@
+import argparse
+import html
+import logging
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from network import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class MockTranslateServer:
+    """
+    Local stand-in for the Google Translate mobile page, for measuring
+    throughput and backoff offline. Like the real service it answers 429
+    (with Retry-After) above `rate` requests per second or `max_in_flight`
+    concurrent requests, and fails `failure_rate` of requests with 503.
+    Translations tag every line with the target language.
+    """
+
+    def __init__(
+            self,
+            rate: float = 20.0,
+            burst: Optional[float] = None,
+            max_in_flight: int = 8,
+            latency: float = 0.05,
+            failure_rate: float = 0.0,
+            retry_after: float = 1.0,
+            seed: int = 0,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max_in_flight
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counts: Dict[int, int] = {}
+        self.server = None
+
+    def admit(self) -> int:
+        """Status for a new request: 200, or 429 / 503 if it is rejected"""
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                return 429
+            if self.bucket.rate > 0 and self.bucket.reserve() > 0:
+                self.bucket.tokens += 1  # not served, give the token back
+                return 429
+            if self.random.random() < self.failure_rate:
+                return 503
+            self.in_flight += 1
+            return 200
+
+    def respond(self, query: Dict) -> Tuple[int, str]:
+        status = self.admit()
+        if status == 200:
+            try:
+                time.sleep(self.latency * (0.5 + self.random.random()))
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+            target = query.get("tl", [""])[0]
+            text = query.get("q", [""])[0]
+            translated = "\n".join(f"[{target}] {line}" for line in text.split("\n"))
+            body = f'<html><body><div class="result-container">{html.escape(translated)}</div></body></html>'
+        else:
+            body = f"<html><body>HTTP {status}</body></html>"
+
+        with self.lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+        return status, body
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        """Serve from a background thread; returns the translate URL"""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/m":
+                    self.send_error(404)
+                    return
+                status, text = mock.respond(parse_qs(url.query))
+                body = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", f"{mock.retry_after:g}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://{host}:{self.server.server_address[1]}/m"
+        logger.info(f"Mock translate server on {url}")
+        return url
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"requests": sum(self.counts.values()), **{f"http_{status}": count for status, count in sorted(self.counts.items())}}
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="🧪 Video.AI - Mock translation provider")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8089)
+    parser.add_argument("--rate", help="Requests per second before answering 429", type=float, default=20.0)
+    parser.add_argument("--max_in_flight", help="Concurrent requests before answering 429", type=int, default=8)
+    parser.add_argument("--latency", help="Mean seconds per request", type=float, default=0.05)
+    parser.add_argument("--failure_rate", help="Fraction of requests answered with 503", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockTranslateServer(args.rate, max_in_flight=args.max_in_flight, latency=args.latency, failure_rate=args.failure_rate)
+    server.serve(args.port, "0.0.0.0")
+    print(f"Translate URL: http://localhost:{args.port}/m (use with main.py --translate_url)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import random
+import time
+
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import aiohttp
+import requests
+
+from deep_translator.exceptions import RequestError, TooManyRequests
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Outcomes of a provider call
+SUCCESS = "success"
+THROTTLED = "throttled"
+UNAVAILABLE = "unavailable"
+ERROR = "error"
+
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+    aiohttp.ClientConnectionError,
+    requests.ConnectionError,
+    requests.Timeout,
+    RequestError,
+)
+
+
+class ProviderError(RuntimeError):
+    """An HTTP provider answered with an error status"""
+
+    def __init__(self, provider: str, status: int, retry_after: Optional[float] = None):
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(f"{provider} returned HTTP {status}")
+
+
+class CircuitOpenError(RuntimeError):
+    """Calls to a provider are suspended after repeated failures"""
+
+    def __init__(self, provider: str, retry_in: float):
+        self.provider = provider
+        self.retry_in = retry_in
+        super().__init__(f"{provider} is unavailable, not retrying for {retry_in:.1f}s")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (the HTTP-date form is ignored)"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def classify(error: BaseException) -> str:
+    """THROTTLED for 429s, UNAVAILABLE for 5xx and connection problems, else ERROR"""
+    status = getattr(error, "status", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429 or isinstance(error, TooManyRequests):
+        return THROTTLED
+    if (isinstance(status, int) and status >= 500) or isinstance(error, TRANSIENT_ERRORS):
+        return UNAVAILABLE
+    return ERROR
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    if isinstance(error, ProviderError):
+        return error.retry_after
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    return parse_retry_after(headers.get("Retry-After")) if headers else None
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average and bursts of up to `burst`.
+    Callers reserve a token and sleep until it is due, so waiting callers
+    are released in order without polling. A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Hold back new callers for at least `seconds`, e.g. for a Retry-After"""
+        if self.rate > 0:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit tuned by additive increase / multiplicative decrease:
+    every success raises it by 1/limit (about +1 per round of requests),
+    a throttled response cuts it by `decrease`. Throttles from requests
+    started before the last cut are ignored, so one burst of 429s halves
+    the limit once rather than collapsing it.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, decrease: float = 0.5):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.in_flight = 0
+        self.last_cut = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to pass to release()"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, outcome: str):
+        async with self.condition:
+            self.in_flight -= 1
+            if outcome == THROTTLED and started >= self.last_cut:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.last_cut = time.monotonic()
+                logger.info(f"Throttled, concurrency limit down to {int(self.limit)}")
+            elif outcome == SUCCESS:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after `failure_threshold` consecutive
+    outages (5xx, connection errors). Throttling is left to the rate and
+    concurrency limits. After `reset_timeout` one trial call is let
+    through: success closes the circuit, an outage opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def check(self, provider: str):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return
+        raise CircuitOpenError(provider, max(remaining, 0.0))
+
+    def record(self, provider: str, outcome: str):
+        # A 429 or 4xx still means the provider is up
+        if outcome == UNAVAILABLE:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit for {provider} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+        else:
+            if self.state != "closed":
+                logger.info(f"Circuit for {provider} closed")
+            self.state = "closed"
+            self.failures = 0
+        self.trial_running = False
+
+
+class ProviderClient:
+    """
+    Guards every request to one provider (translation, TTS): a circuit
+    breaker, a token bucket for the request rate and an adaptive
+    concurrency limit. Throttled and unavailable calls are retried with
+    backoff, honouring Retry-After. Share one client per provider across
+    all videos so the limits apply to the whole process.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            rate: float = 0.0,
+            burst: Optional[float] = None,
+            concurrency: int = 4,
+            max_concurrency: Optional[int] = None,
+            adaptive: bool = True,
+            retries: int = 3,
+            backoff: float = 0.5,
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.0,
+            metrics: Optional[Metrics] = None,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        # Without `adaptive` the limit stays at `concurrency`, like a semaphore
+        self.limit = AdaptiveLimit(concurrency, max_concurrency or concurrency, decrease=0.5 if adaptive else 1.0)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self.counts: Dict[str, int] = {SUCCESS: 0, THROTTLED: 0, UNAVAILABLE: 0, ERROR: 0, "rejected": 0}
+
+    def record(self, outcome: str):
+        self.counts[outcome] += 1
+        if self.metrics:
+            self.metrics.inc("provider_requests_total", provider=self.name, outcome=outcome)
+            self.metrics.set("provider_concurrency_limit", int(self.limit.limit), provider=self.name)
+            self.metrics.set("provider_circuit_open", int(self.breaker.state != "closed"), provider=self.name)
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args, retries: Optional[int] = None) -> T:
+        """Await `fn(*args)` under the provider limits, retrying transient failures"""
+        retries = self.retries if retries is None else retries
+
+        for attempt in range(retries + 1):
+            try:
+                self.breaker.check(self.name)
+            except CircuitOpenError:
+                self.record("rejected")
+                raise
+
+            # Everything after check() runs under the finally, so a call
+            # cancelled while waiting for a token or a slot still hands back
+            # the half-open trial
+            started = None
+            outcome = "cancelled"
+            try:
+                await self.bucket.acquire()
+                started = await self.limit.acquire()
+                result = await fn(*args)
+                outcome = SUCCESS
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception as e:
+                outcome = classify(e)
+                if outcome == ERROR or attempt == retries:
+                    raise
+                delay = retry_after_of(e)
+                if delay is not None and outcome == THROTTLED:
+                    self.bucket.pause(delay)
+                else:
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"{self.name} {outcome}, retry {attempt + 1}/{retries} in {delay:.2f}s: {e}")
+            finally:
+                if started is not None:
+                    await self.limit.release(started, outcome)
+                if outcome == "cancelled":
+                    self.breaker.trial_running = False
+                else:
+                    self.breaker.record(self.name, outcome)
+                    self.record(outcome)
+
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            "concurrency_limit": int(self.limit.limit),
+            "circuit": self.breaker.state,
+        }
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Files above this size are fingerprinted by size + mtime instead of content
+MAX_HASH_BYTES = 64 * 1024 * 1024
+
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """Content hash of a file (size/mtime for very large media), None if missing"""
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    if stat.st_size > MAX_HASH_BYTES:
+        return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+class Pipeline:
+    """
+    Runs named stages in order and records, per stage, the fingerprints of
+    its inputs, its parameters and the outputs it produced in a JSON
+    manifest. A stage is skipped when all of those are unchanged, so after
+    a crash or a one-line subtitle fix only invalidated stages re-run.
+    """
+
+    def __init__(self, manifest_path: str, force: List[str] = None, metrics: Metrics = None):
+        self.manifest_path = manifest_path
+        self.force = set(force or [])
+        self.metrics = metrics
+        self.job = os.path.basename(manifest_path).split(".")[0]
+        self.manifest = {"stages": {}}
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        partial_path = f"{self.manifest_path}.part"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=4, ensure_ascii=False)
+        os.replace(partial_path, self.manifest_path)
+
+    def is_current(
+            self, name: str, inputs: Dict, params: Dict, outputs: List[str], valid: Callable[[], bool] = None
+    ) -> bool:
+        record = self.manifest["stages"].get(name)
+        if not record or name in self.force:
+            return False
+        if record["inputs"] != inputs or record["params"] != params:
+            return False
+        for path in outputs:
+            # An output never recorded, or deleted since, is not up to date
+            fingerprint = file_fingerprint(path)
+            if fingerprint is None or record["outputs"].get(path) != fingerprint:
+                return False
+        return valid is None or valid()
+
+    async def stage(
+            self,
+            name: str,
+            run: Callable[[], Union[Awaitable, None]],
+            inputs: List[str],
+            outputs: List[str],
+            params: Dict = None,
+            valid: Callable[[], bool] = None,
+    ) -> bool:
+        """
+        Run `run()` unless the stage is up to date; returns True if it ran.
+        `valid` can veto skipping when the outputs depend on files outside
+        them (e.g. cached clips a segments file points to).
+        """
+        params = params or {}
+        fingerprints = {path: file_fingerprint(path) for path in inputs}
+
+        missing = [path for path, fingerprint in fingerprints.items() if fingerprint is None]
+        if missing:
+            raise FileNotFoundError(f"Stage '{name}' is missing input: {', '.join(missing)}")
+
+        if self.is_current(name, fingerprints, params, outputs, valid):
+            logger.info(f"Stage {name}: up to date, skipped")
+            print(f"  ⏭️  {name}: up to date")
+            if self.metrics:
+                self.metrics.inc("stage_skipped_total", stage=name, job=self.job)
+                self.metrics.emit("stage_skipped", stage=name, job=self.job)
+            return False
+
+        print(f"  ▶️  {name}: running")
+        started = time.time()
+        result = run()
+        if asyncio.iscoroutine(result):
+            await result
+        seconds = time.time() - started
+
+        self.manifest["stages"][name] = {
+            "inputs": fingerprints,
+            "params": params,
+            "outputs": {path: file_fingerprint(path) for path in outputs},
+            "seconds": round(seconds, 3),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.save()
+
+        if self.metrics:
+            size = sum(os.path.getsize(path) for path in outputs if os.path.exists(path))
+            self.metrics.inc("stage_seconds_total", seconds, stage=name, job=self.job)
+            self.metrics.inc("stage_bytes_total", size, stage=name, job=self.job)
+            self.metrics.set("stage_last_seconds", seconds, stage=name, job=self.job)
+            self.metrics.emit("stage", stage=name, job=self.job, seconds=round(seconds, 3), bytes=size)
+        logger.info(f"Stage {name}: finished in {time.time() - started:.1f}s")
+        print(f"  ✅ {name}: done in {time.time() - started:.1f}s")
+        return True
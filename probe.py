@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import os
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ffmpeg_runner import FFmpegRunner
+from video import probe_keyframes
+
+logger = logging.getLogger(__name__)
+
+ProbeKey = Tuple[str, int, int]
+
+
+def parse_rate(rate: Optional[str]) -> float:
+    """ffprobe rational ("30000/1001", "25/1") as a float, 0 when unknown"""
+    if not rate:
+        return 0.0
+    numerator, _, denominator = rate.partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+class MediaInfo:
+    """
+    What ffprobe reports about one file: container duration, the first
+    video and audio streams, and every stream as returned by ffprobe.
+    """
+
+    def __init__(self, path: str, duration: float, streams: List[Dict], format_name: str = ""):
+        self.path = path
+        self.duration = duration
+        self.streams = streams
+        self.format_name = format_name
+
+    @classmethod
+    def from_ffprobe(cls, path: str, data: Dict) -> "MediaInfo":
+        fmt = data.get("format", {})
+        streams = data.get("streams", [])
+        duration = float(fmt.get("duration") or 0)
+        if not duration:
+            # Some containers only carry per-stream durations
+            duration = max((float(s.get("duration") or 0) for s in streams), default=0.0)
+        return cls(path, duration, streams, fmt.get("format_name", ""))
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def first_stream(self, codec_type: str) -> Optional[Dict]:
+        return next((s for s in self.streams if s.get("codec_type") == codec_type), None)
+
+    @property
+    def video_stream(self) -> Optional[Dict]:
+        return self.first_stream("video")
+
+    @property
+    def audio_stream(self) -> Optional[Dict]:
+        return self.first_stream("audio")
+
+    @property
+    def sample_rate(self) -> int:
+        stream = self.audio_stream
+        return int(stream.get("sample_rate") or 0) if stream else 0
+
+    @property
+    def channels(self) -> int:
+        stream = self.audio_stream
+        return int(stream.get("channels") or 0) if stream else 0
+
+    @property
+    def frame_rate(self) -> float:
+        stream = self.video_stream
+        if not stream:
+            return 0.0
+        return parse_rate(stream.get("avg_frame_rate")) or parse_rate(stream.get("r_frame_rate"))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        stream = self.video_stream
+        return (int(stream.get("width") or 0), int(stream.get("height") or 0)) if stream else (0, 0)
+
+    @property
+    def subtitle_streams(self) -> List[Dict]:
+        """Subtitle streams as {index, codec, language, title}, in stream order"""
+        return [
+            {
+                "index": s["index"],
+                "codec": s.get("codec_name"),
+                "language": s.get("tags", {}).get("language"),
+                "title": s.get("tags", {}).get("title"),
+            }
+            for s in self.streams
+            if s.get("codec_type") == "subtitle"
+        ]
+
+
+class MediaProbe:
+    """
+    Runs ffprobe once per input and remembers the result (and, when asked
+    for, the keyframe index) keyed on (path, size, mtime), so every stage
+    and language reuses one probe until the file changes. Concurrent
+    requests for the same file wait on a single ffprobe.
+    """
+
+    def __init__(self, runner: FFmpegRunner, max_entries: int = 256):
+        self.runner = runner
+        self.max_entries = max_entries
+        self.infos: "OrderedDict[ProbeKey, MediaInfo]" = OrderedDict()
+        self.keyframe_index: "OrderedDict[ProbeKey, List[float]]" = OrderedDict()
+        self.pending: Dict[Tuple[str, ProbeKey], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path: str) -> ProbeKey:
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    async def cached(self, kind: str, store: OrderedDict, path: str, load):
+        key = self.key(path)
+        if key in store:
+            store.move_to_end(key)
+            self.hits += 1
+            return store[key]
+
+        pending = self.pending.get((kind, key))
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[(kind, key)] = future
+        try:
+            value = await load(path)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here so an unawaited future does not warn
+            raise
+        finally:
+            del self.pending[(kind, key)]
+
+        future.set_result(value)
+        store[key] = value
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+        return value
+
+    async def load_info(self, path: str) -> MediaInfo:
+        output = await self.runner.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+            capture_stdout=True,
+        )
+        info = MediaInfo.from_ffprobe(path, json.loads(output or b"{}"))
+        logger.debug(f"Probed {path}: {info.duration:.2f}s, {len(info.streams)} streams")
+        return info
+
+    async def info(self, path: str) -> MediaInfo:
+        return await self.cached("info", self.infos, path, self.load_info)
+
+    async def keyframes(self, path: str) -> List[float]:
+        """Keyframe timestamps of the first video stream (decodes keyframes only, once per file)"""
+        return await self.cached("keyframes", self.keyframe_index, path, lambda p: probe_keyframes(self.runner, p))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.infos),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,414 @@
+import logging
+import os
+import re
+import numpy as np
+
+from itertools import chain
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+TIME = r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+
+# Timing line of a cue, with its optional index line; the cue text is
+# everything up to the next match
+TIMING_PATTERN = re.compile(rf"^(?:[ \t]*\d+[ \t]*\n)?[ \t]*{TIME}[ \t]*-->[ \t]*{TIME}[^\n]*$", re.MULTILINE)
+# A numbered block after a blank line whose timing line did not parse
+MALFORMED_BLOCK = re.compile(r"\n[ \t]*\n[ \t]*\d+[ \t]*(?:\n|$)")
+TIMING_FORMAT = "{} {} {} {:0<3} {} {} {} {:0<3}"
+
+VTT_TIME = r"(?:(\d+):)?(\d{1,2}):(\d{1,2})[.,](\d{1,3})"
+VTT_TIMING = re.compile(rf"^\s*{VTT_TIME}\s*-->\s*{VTT_TIME}")
+VTT_TAG = re.compile(r"</?[a-zA-Z][^>]*>")
+ASS_TIME = re.compile(r"(\d+):(\d{1,2}):(\d{1,2})[.,](\d{1,3})")
+ASS_OVERRIDE = re.compile(r"\{[^}]*\}")
+
+SUBTITLE_FORMATS = {".srt": "srt", ".vtt": "vtt", ".ass": "ass", ".ssa": "ass"}
+
+# Text ending a sentence (Latin, CJK and Khmer punctuation, then closing quotes)
+SENTENCE_END = re.compile(r"[.!?…。！？។៕][\"'”’»)\]]*$")
+# "- Hi" / "– Hi": a new speaker's line
+DIALOG_DASH = re.compile(r"^[-–—]\s*\S")
+# Speech units: cues further apart, longer or wordier than this are not joined
+GROUP_MAX_GAP_MS = 500
+GROUP_MAX_DURATION_MS = 10000
+GROUP_MAX_CHARS = 300
+
+# (start_ms, end_ms, text), the unit subtitle readers yield and writers take
+Cue = Tuple[int, int, str]
+
+
+class Cues:
+    """
+    Subtitle cues stored column-wise: start/end times in milliseconds as
+    int64 arrays plus one list of texts, instead of a dict per cue.
+    """
+
+    __slots__ = ("starts", "ends", "texts")
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, texts: List[str]):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.texts = list(texts)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[Cue]:
+        return zip(self.starts.tolist(), self.ends.tolist(), self.texts)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Cue]) -> "Cues":
+        """Collect streamed (start_ms, end_ms, text) cues"""
+        starts = []
+        ends = []
+        texts = []
+        for start, end, text in rows:
+            starts.append(start)
+            ends.append(end)
+            texts.append(clean_text(text))
+        return cls(np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), texts)
+
+    @property
+    def start_seconds(self) -> np.ndarray:
+        return self.starts / 1000
+
+    @property
+    def end_seconds(self) -> np.ndarray:
+        return self.ends / 1000
+
+    def with_texts(self, texts: List[str]) -> "Cues":
+        """Same timings with other (e.g. translated) texts"""
+        if len(texts) != len(self):
+            raise ValueError(f"Expected {len(self)} texts, got {len(texts)}")
+        return Cues(self.starts, self.ends, texts)
+
+
+def group_cues(
+        cues: Cues,
+        max_gap_ms: int = GROUP_MAX_GAP_MS,
+        max_duration_ms: int = GROUP_MAX_DURATION_MS,
+        max_chars: int = GROUP_MAX_CHARS,
+) -> Cues:
+    """
+    Join consecutive cues that continue one sentence into a single cue
+    spanning them all, so a sentence split over several subtitles is
+    spoken as one. A cue starts a new unit after sentence-ending
+    punctuation, a gap over `max_gap_ms` (or an overlap), a dialog dash,
+    or when the unit would exceed `max_duration_ms` or `max_chars`.
+    """
+    starts = []
+    ends = []
+    texts = []
+
+    for start, end, text in cues:
+        if (
+            texts
+            and 0 <= start - ends[-1] <= max_gap_ms
+            and end - starts[-1] <= max_duration_ms
+            and len(texts[-1]) + len(text) < max_chars
+            and not SENTENCE_END.search(texts[-1])
+            and not DIALOG_DASH.match(text)
+        ):
+            ends[-1] = end
+            texts[-1] = f"{texts[-1]} {text}".strip()
+        else:
+            starts.append(start)
+            ends.append(end)
+            texts.append(text)
+
+    return Cues(np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), texts)
+
+
+def to_ms(timings: List[str]) -> np.ndarray:
+    """(start, end) milliseconds from "h m s ms h m s ms" strings, one per cue"""
+    parts = np.fromstring(" ".join(timings), dtype=np.int64, sep=" ").reshape(-1, 2, 4)
+    return (parts[:, :, 0] * 3600 + parts[:, :, 1] * 60 + parts[:, :, 2]) * 1000 + parts[:, :, 3]
+
+
+def parse_srt_text(content: str) -> Cues:
+    """
+    Parse SRT text in a single regex pass. Handles CRLF/CR line endings, a
+    UTF-8 BOM, missing index lines and blank lines inside a cue; line
+    breaks inside a cue are kept. Blocks without a valid timing line,
+    without text or ending before they start are skipped.
+    """
+    content = content.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+    texts = []
+    timings = []
+    skipped = 0
+    previous = None
+
+    for match in chain(TIMING_PATTERN.finditer(content), [None]):
+        if previous is not None:
+            text = content[previous.end():match.start() if match else len(content)].strip()
+            if "\n\n" in text:
+                # Blank lines inside a cue are kept, a broken numbered block is not
+                text = MALFORMED_BLOCK.split(text, 1)[0]
+            text = clean_text(text)
+            if text:
+                texts.append(text)
+                # A short millis field is a fraction: ",5" means 500 ms
+                timings.append(TIMING_FORMAT.format(*previous.groups()))
+            else:
+                skipped += 1
+        previous = match
+
+    if skipped:
+        logger.debug(f"Skipped {skipped} subtitle blocks without text")
+    if not timings:
+        return Cues(np.zeros(0), np.zeros(0), [])
+
+    times = to_ms(timings)
+    # A cue ending before (or as) it starts has no time to be spoken in
+    keep = times[:, 1] > times[:, 0]
+    if not keep.all():
+        logger.debug(f"Dropped {np.count_nonzero(~keep)} subtitles that end before they start")
+    return Cues(times[keep, 0], times[keep, 1], [text for text, kept in zip(texts, keep.tolist()) if kept])
+
+
+def parse_srt(path: str) -> Cues:
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        return parse_srt_text(f.read())
+
+
+def time_to_ms(hours: str, minutes: str, seconds: str, fraction: str) -> int:
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction.ljust(3, "0"))
+
+
+def format_time(ms: int, separator: str = ",") -> str:
+    """HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT)"""
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+def format_ass_time(ms: int) -> str:
+    """H:MM:SS.cc, ASS counts centiseconds"""
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{ms // 10:02d}"
+
+
+def subtitle_format(path: str, first_line: str = "") -> str:
+    """srt, vtt or ass from the file extension, else from the first line"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in SUBTITLE_FORMATS:
+        return SUBTITLE_FORMATS[extension]
+    if first_line.lstrip("\ufeff").startswith("WEBVTT"):
+        return "vtt"
+    if first_line.lstrip("\ufeff").strip().lower() == "[script info]":
+        return "ass"
+    return "srt"
+
+
+def lines_of(f: TextIO) -> Iterator[str]:
+    """Lines without line endings or a BOM, read lazily"""
+    for i, line in enumerate(f):
+        line = line.rstrip("\r\n")
+        yield line.lstrip("\ufeff") if i == 0 else line
+
+
+def clean_text(text: str) -> str:
+    """Cue text with runs of whitespace collapsed and blank lines removed; line breaks are kept"""
+    return "\n".join(" ".join(line.split()) for line in text.split("\n") if line.strip())
+
+
+def cue_text(lines: List[str]) -> str:
+    """Text of a cue block, dropping a trailing broken numbered block"""
+    text = "\n".join(lines).strip()
+    if "\n\n" in text:
+        text = MALFORMED_BLOCK.split(text, 1)[0]
+    return clean_text(text)
+
+
+def iter_srt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Stream SRT cues; same rules as parse_srt_text"""
+    timing = None
+    text = []
+
+    for line in lines:
+        match = TIMING_PATTERN.match(line)
+        if not match:
+            text.append(line)
+            continue
+
+        # The line before a timing line, after a blank one, is the next cue's index
+        if len(text) >= 1 and text[-1].strip().isdigit() and (len(text) == 1 or not text[-2].strip()):
+            text.pop()
+        if timing:
+            body = cue_text(text)
+            if body and timing[1] > timing[0]:
+                yield timing[0], timing[1], body
+        groups = match.groups()
+        timing = (time_to_ms(*groups[:4]), time_to_ms(*groups[4:]))
+        text = []
+
+    if timing:
+        body = cue_text(text)
+        if body and timing[1] > timing[0]:
+            yield timing[0], timing[1], body
+
+
+def iter_vtt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Stream WebVTT cues, skipping the header, NOTE/STYLE/REGION blocks and cue settings"""
+    timing = None
+    text = []
+
+    for line in lines:
+        if timing is None:
+            match = VTT_TIMING.match(line)
+            if match:
+                groups = match.groups()
+                timing = (time_to_ms(*groups[:4]), time_to_ms(*groups[4:]))
+            continue
+
+        if line.strip():
+            text.append(VTT_TAG.sub("", line).strip())
+            continue
+
+        body = "\n".join(part for part in text if part)
+        if body and timing[1] > timing[0]:
+            yield timing[0], timing[1], body
+        timing = None
+        text = []
+
+    body = "\n".join(part for part in text if part)
+    if timing and body and timing[1] > timing[0]:
+        yield timing[0], timing[1], body
+
+
+def iter_ass(lines: Iterable[str]) -> Iterator[Cue]:
+    """Stream Dialogue events of an ASS/SSA script, override tags removed"""
+    fields = ["layer", "start", "end", "style", "name", "marginl", "marginr", "marginv", "effect", "text"]
+    in_events = False
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_events = stripped.lower() == "[events]"
+            continue
+        if not in_events or ":" not in stripped:
+            continue
+
+        kind, _, value = stripped.partition(":")
+        kind = kind.strip().lower()
+        if kind == "format":
+            fields = [field.strip().lower() for field in value.split(",")]
+            continue
+        if kind != "dialogue":
+            continue
+
+        values = dict(zip(fields, value.strip().split(",", len(fields) - 1)))
+        start = ASS_TIME.match(values.get("start", "").strip())
+        end = ASS_TIME.match(values.get("end", "").strip())
+        if not start or not end:
+            continue
+
+        text = ASS_OVERRIDE.sub("", values.get("text", ""))
+        text = text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+        text = "\n".join(part.strip() for part in text.split("\n") if part.strip())
+        start_ms, end_ms = time_to_ms(*start.groups()), time_to_ms(*end.groups())
+        if text and end_ms > start_ms:
+            yield start_ms, end_ms, text
+
+
+READERS = {"srt": iter_srt, "vtt": iter_vtt, "ass": iter_ass}
+
+
+def read_cues(path: str, fmt: str = None) -> Iterator[Cue]:
+    """
+    Stream (start_ms, end_ms, text) cues from an SRT, WebVTT or ASS file
+    without reading it whole; line breaks inside a cue are kept.
+    """
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        lines = lines_of(f)
+        first = next(lines, "")
+        reader = READERS[fmt or subtitle_format(path, first)]
+        yield from reader(chain([first], lines))
+
+
+def load_cues(path: str) -> Cues:
+    """All cues of a subtitle file in columnar form (SRT takes the fast path)"""
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        first = f.readline()
+    if subtitle_format(path, first) == "srt":
+        return parse_srt(path)
+    return Cues.from_rows(read_cues(path))
+
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, \
+Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, \
+MarginV, Encoding
+Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+class SubtitleWriter:
+    """
+    Write cues to an SRT, WebVTT or ASS file as they arrive. Output goes
+    to `<path>.part` and is moved into place on close, so a crashed run
+    never leaves a half-written subtitle behind.
+    """
+
+    def __init__(self, path: str, fmt: str = None):
+        self.path = path
+        self.format = fmt or subtitle_format(path)
+        self.count = 0
+        self.file = open(f"{path}.part", "w", encoding="utf-8")
+
+        if self.format == "vtt":
+            self.file.write("WEBVTT\n\n")
+        elif self.format == "ass":
+            self.file.write(ASS_HEADER)
+
+    def write(self, start: int, end: int, text: str):
+        self.count += 1
+        if self.format == "srt":
+            self.file.write(f"{self.count}\n{format_time(start)} --> {format_time(end)}\n{text}\n\n")
+        elif self.format == "vtt":
+            self.file.write(f"{format_time(start, '.')} --> {format_time(end, '.')}\n{text}\n\n")
+        else:
+            text = text.replace("\n", "\\N")
+            self.file.write(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}\n")
+
+    def write_many(self, cues: Iterable[Cue]):
+        for start, end, text in cues:
+            self.write(start, end, text)
+
+    def close(self):
+        self.file.close()
+        os.replace(f"{self.path}.part", self.path)
+
+    def __enter__(self) -> "SubtitleWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(f"{self.path}.part")
+
+
+def write_cues(cues: Iterable[Cue], path: str, fmt: str = None) -> str:
+    """Write cues (a Cues or any stream of them) in the format given by the extension"""
+    with SubtitleWriter(path, fmt) as writer:
+        writer.write_many(cues)
+    return path
+
+
+def convert_subtitles(input_path: str, output_path: str) -> str:
+    """Convert between SRT, WebVTT and ASS one cue at a time"""
+    return write_cues(read_cues(input_path), output_path)
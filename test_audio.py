@@ -0,0 +1,287 @@
+import asyncio
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from audio import (
+    SAMPLE_RATE,
+    clip_duration,
+    decode_pcm,
+    dirty_ranges,
+    encode_pcm,
+    load_pcm,
+    mix_hierarchical,
+    mp3_duration,
+    patch_timeline,
+    render_timeline,
+    stream_timeline,
+    time_stretch,
+)
+from ffmpeg_runner import FFmpegError
+from tts import ToneTTSBackend
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def tone(seconds: float, freq: float = 220.0, amplitude: float = 8000.0) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def rms(pcm: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(pcm.astype(np.float64) ** 2)))
+
+
+@pytest.mark.parametrize("tempo", [0.8, 1.1, 1.25, 1.3, 2.0])
+def test_time_stretch_keeps_tone_level_and_scales_length(tempo):
+    pcm = tone(1.0)
+    stretched = time_stretch(pcm, tempo)
+
+    assert len(stretched) == pytest.approx(len(pcm) / tempo, rel=0.03)
+    # Skip the fade-in/out of the first and last window
+    body = stretched[2048:-2048]
+    assert rms(body) == pytest.approx(rms(pcm), rel=0.05)
+
+
+def test_time_stretch_keeps_stereo_layout():
+    pcm = np.stack([tone(0.5), tone(0.5, 330.0)], axis=1).reshape(-1)
+    stretched = time_stretch(pcm, 1.25, channels=2)
+
+    assert len(stretched) % 2 == 0
+    assert rms(stretched[0::2][2048:-2048]) == pytest.approx(rms(pcm[0::2]), rel=0.05)
+
+
+def test_time_stretch_leaves_short_clips_and_unit_tempo_alone():
+    pcm = tone(0.01)
+    assert time_stretch(pcm, 1.25) is pcm
+    pcm = tone(0.5)
+    assert time_stretch(pcm, 1.0) is pcm
+
+
+@pytest.fixture
+def clips(tmp_path):
+    backend = ToneTTSBackend(sample_rate=SAMPLE_RATE)
+    paths = []
+    for i in range(4):
+        path = str(tmp_path / f"clip_{i}.wav")
+        asyncio.run(backend.synthesize("word " * (2 + i), f"voice {i}", path))
+        paths.append(path)
+    return paths
+
+
+def write_track(path: str, pcm: np.ndarray):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+
+def test_patch_timeline_matches_full_render(tmp_path, clips):
+    old = [
+        {"path": clips[i % 4], "start": i * 2.0, "duration": 1.5, "tempo": 1.0}
+        for i in range(10)
+    ]
+    new = [dict(af) for af in old]
+    new[2]["path"] = clips[3]
+    new[5]["start"] = 10.4
+    new[7]["tempo"] = 1.25
+    track_path = str(tmp_path / "track.wav")
+    write_track(track_path, run(render_timeline(old, 20000)))
+
+    ranges = dirty_ranges(old, new)
+    patched = run(patch_timeline(track_path, old, new, 20000))
+
+    assert len(ranges) == 3
+    assert patched == sum(end - start for start, end in ranges)
+    assert np.array_equal(load_pcm(track_path), run(render_timeline(new, 20000)))
+
+
+def test_patch_timeline_leaves_unchanged_track_alone(tmp_path, clips):
+    cues = [{"path": clips[0], "start": 1.0, "duration": 1.0}]
+    track_path = str(tmp_path / "track.wav")
+    write_track(track_path, run(render_timeline(cues, 5000)))
+
+    assert dirty_ranges(cues, cues) == []
+    assert run(patch_timeline(track_path, cues, cues, 5000)) == 0
+
+
+def test_patch_timeline_needs_full_render_when_length_or_most_cues_change(tmp_path, clips):
+    old = [{"path": clips[0], "start": float(i), "duration": 0.8} for i in range(4)]
+    new = [{**af, "path": clips[1]} for af in old]
+    track_path = str(tmp_path / "track.wav")
+    write_track(track_path, run(render_timeline(old, 5000)))
+
+    assert run(patch_timeline(track_path, old, old, 6000)) is None
+    assert run(patch_timeline(track_path, old, new, 5000)) is None
+
+
+def mp3_frames(count: int) -> bytes:
+    """Silent MPEG-2 layer III frames as edge-tts writes them: 24 kHz, 48 kbit/s, mono"""
+    header = bytes([0xFF, 0xF3, 0x64, 0xC4])
+    return (header + bytes(144 - 4)) * count
+
+
+def test_mp3_duration_walks_frame_headers(tmp_path):
+    path = tmp_path / "clip.mp3"
+    id3 = b"ID3\x04\x00\x00" + (20).to_bytes(4, "big") + bytes(20)
+    path.write_bytes(id3 + mp3_frames(100) + b"TAG" + bytes(125))
+
+    # 576 samples per frame at 24 kHz
+    assert mp3_duration(str(path)) == pytest.approx(2.4)
+    assert clip_duration(str(path)) == pytest.approx(2.4)
+
+
+def test_mp3_duration_reads_xing_frame_count(tmp_path):
+    info = bytearray(mp3_frames(1))
+    info[4 + 9:4 + 9 + 12] = b"Info" + (1).to_bytes(4, "big") + (500).to_bytes(4, "big")
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(bytes(info) + mp3_frames(10))
+
+    assert mp3_duration(str(path)) == pytest.approx(500 * 576 / 24000)
+
+
+def test_mp3_duration_rejects_other_files(tmp_path):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(b"not audio at all")
+
+    assert mp3_duration(str(path)) is None
+
+
+class RecordingRunner:
+    """FFmpegRunner stand-in: records commands, returns `stdout`, collects fed stdin"""
+
+    def __init__(self, stdout: bytes = b""):
+        self.stdout = stdout
+        self.commands = []
+        self.fed = bytearray()
+
+    async def run(self, cmd, feed=None, capture_stdout=False, nested=False, **kwargs):
+        self.commands.append(cmd)
+        if feed:
+            runner = self
+
+            class Writer:
+                def write(self, data):
+                    runner.fed.extend(data)
+
+                async def drain(self):
+                    pass
+
+            await feed(Writer())
+        return self.stdout if capture_stdout else b""
+
+
+def test_decode_pcm_reads_wavs_in_process_and_other_clips_through_the_runner(tmp_path, clips):
+    runner = RecordingRunner(tone(0.1).tobytes())
+    mp3 = tmp_path / "clip.mp3"
+    mp3.write_bytes(mp3_frames(10))
+
+    wav_pcm = run(decode_pcm(clips[0], runner=runner))
+    mp3_pcm = run(decode_pcm(str(mp3), runner=runner))
+
+    assert len(wav_pcm) > 0
+    assert np.array_equal(mp3_pcm, tone(0.1))
+    assert len(runner.commands) == 1
+    assert runner.commands[0][:5] == ["ffmpeg", "-loglevel", "error", "-i", str(mp3)]
+
+
+def test_encode_pcm_writes_wav_in_process_and_pipes_other_formats(tmp_path):
+    runner = RecordingRunner()
+    pcm = tone(0.5)
+
+    run(encode_pcm(pcm, str(tmp_path / "track.wav"), runner=runner))
+    run(encode_pcm(pcm, str(tmp_path / "track.mp3"), runner=runner))
+
+    assert np.array_equal(load_pcm(str(tmp_path / "track.wav")), pcm)
+    assert [cmd[-2] for cmd in runner.commands] == [str(tmp_path / "track.mp3")]
+    assert bytes(runner.fed) == pcm.tobytes()
+
+
+def test_stream_timeline_feeds_the_same_pcm_as_a_full_render(tmp_path, clips):
+    cues = [
+        {"path": clips[i % 4], "start": start, "duration": 1.2, "tempo": 1.0 + (i % 3) * 0.15}
+        for i, start in enumerate([4.0, 0.5, 2.0, 2.6, 7.25])
+    ]
+    runner = RecordingRunner()
+
+    output = run(stream_timeline(cues, str(tmp_path / "track.mp3"), 10000, chunk_frames=1000, runner=runner))
+
+    assert output == str(tmp_path / "track.mp3")
+    assert runner.commands[0][-2:] == [output, "-y"]
+    assert bytes(runner.fed) == run(render_timeline(cues, 10000)).tobytes()
+
+
+def test_stream_timeline_of_no_cues_is_silence(tmp_path):
+    runner = RecordingRunner()
+    run(stream_timeline([], str(tmp_path / "track.mp3"), 1500, runner=runner))
+    assert bytes(runner.fed) == bytes(int(1.5 * SAMPLE_RATE) * 2)
+
+
+class MixRunner(RecordingRunner):
+    """Records amix commands and creates their output files"""
+
+    async def run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        with open(cmd[-2], "wb") as f:
+            f.write(b"mix")
+        return b""
+
+
+def mix_inputs(cmd):
+    """(input path, adelay ms) of an amix_command"""
+    paths = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-i"]
+    delays = [int(part.split("adelay=")[1].split(":")[0]) for part in cmd[cmd.index("-filter_complex") + 1].split(";")[:-1]]
+    return list(zip(paths, delays))
+
+
+def test_mix_hierarchical_mixes_in_levels_of_fan_in(tmp_path):
+    cues = [{"path": f"cue_{i}.wav", "start": 10.0 - i} for i in range(10)]
+    runner = MixRunner()
+    temp_dir = tmp_path / "temp"
+    temp_dir.mkdir()
+    output = str(tmp_path / "mix.wav")
+
+    assert run(mix_hierarchical(cues, output, str(temp_dir), duration=12.5, fan_in=3, runner=runner)) == output
+
+    # 10 cues → 4 parts → 2 parts → final mix
+    assert [len(mix_inputs(cmd)) for cmd in runner.commands] == [3, 3, 3, 1, 3, 1, 2]
+    first_level = [inputs for cmd in runner.commands[:4] for inputs in mix_inputs(cmd)]
+    assert [path for path, _ in first_level] == [f"cue_{i}.wav" for i in range(9, -1, -1)]
+    # Each part is offset from its first cue
+    assert [delay for _, delay in first_level] == [0, 1000, 2000, 0, 1000, 2000, 0, 1000, 2000, 0]
+    assert mix_inputs(runner.commands[4])[1:] == [(runner.commands[1][-2], 3000), (runner.commands[2][-2], 6000)]
+
+    final = runner.commands[-1]
+    assert [delay for _, delay in mix_inputs(final)] == [1000, 10000]
+    assert final[-4:] == ["-t", "12.5", output, "-y"]
+    # Intermediate parts are removed
+    assert os.listdir(temp_dir) == []
+
+
+def test_mix_hierarchical_mixes_few_cues_directly(tmp_path):
+    runner = MixRunner()
+    cues = [{"path": "a.wav", "start": 1.5}, {"path": "b.wav", "start": 0.25}]
+
+    run(mix_hierarchical(cues, str(tmp_path / "mix.wav"), str(tmp_path), runner=runner))
+
+    assert len(runner.commands) == 1
+    assert mix_inputs(runner.commands[0]) == [("b.wav", 250), ("a.wav", 1500)]
+
+
+def test_mix_hierarchical_cleans_up_after_a_failed_mix(tmp_path):
+    class FailingRunner(MixRunner):
+        async def run(self, cmd, **kwargs):
+            if len(self.commands) == 2:
+                raise FFmpegError(cmd, 1, "amix failed")
+            return await super().run(cmd, **kwargs)
+
+    cues = [{"path": f"cue_{i}.wav", "start": float(i)} for i in range(10)]
+
+    with pytest.raises(FFmpegError):
+        run(mix_hierarchical(cues, str(tmp_path / "mix.wav"), str(tmp_path), fan_in=3, runner=FailingRunner()))
+    assert os.listdir(tmp_path) == []
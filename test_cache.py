@@ -0,0 +1,247 @@
+import hashlib
+import itertools
+import os
+
+import pytest
+
+import cache as cache_module
+from cache import AudioCache, TranslationCache, UploadStore
+
+
+@pytest.fixture
+def audio_cache(tmp_path):
+    return AudioCache(str(tmp_path / "tts"), max_bytes=1000)
+
+
+def write_clip(cache, text, size, mtime):
+    path = cache.path_for(text, "km-KH-PisethNeural", "tone:24000", "wav")
+    cache.lookup(path)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+    cache.add(path)
+    return path
+
+
+def test_audio_path_is_keyed_on_normalized_text_voice_and_backend(audio_cache):
+    path = audio_cache.path_for("Hello  world", "km-KH-PisethNeural", "edge:+0%:+0Hz")
+
+    assert path == audio_cache.path_for(" Hello world ", "km-KH-PisethNeural", "edge:+0%:+0Hz")
+    assert path != audio_cache.path_for("Hello world", "km-KH-SreymomNeural", "edge:+0%:+0Hz")
+    assert path != audio_cache.path_for("Hello world", "km-KH-PisethNeural", "edge:+10%:+0Hz")
+    assert path != audio_cache.path_for("Hello, world", "km-KH-PisethNeural", "edge:+0%:+0Hz")
+    assert path.endswith(".mp3")
+    assert os.path.dirname(path).startswith(audio_cache.root)
+
+
+def test_audio_lookup_counts_hits_and_misses(audio_cache):
+    path = audio_cache.path_for("Hello", "km-KH-PisethNeural", "tone:24000", "wav")
+
+    assert not audio_cache.lookup(path)
+    assert os.path.isdir(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"clip")
+    assert audio_cache.lookup(path)
+
+    assert (audio_cache.hits, audio_cache.misses) == (1, 1)
+    assert audio_cache.stats()["hit_rate"] == 0.5
+
+
+def test_audio_eviction_removes_least_recently_used_clips(audio_cache):
+    old = write_clip(audio_cache, "old", 400, 1000)
+    used = write_clip(audio_cache, "used", 400, 2000)
+    audio_cache.evict()
+    assert audio_cache.size() == 800
+
+    # A hit moves the clip to the back of the queue
+    audio_cache.lookup(old)
+    new = write_clip(audio_cache, "new", 400, 3000)
+    audio_cache.evict()
+
+    assert os.path.exists(old) and os.path.exists(new)
+    assert not os.path.exists(used)
+    assert audio_cache.size() == 800
+    assert audio_cache.stats()["bytes"] == 800
+
+
+def test_audio_eviction_goes_below_the_cap(tmp_path):
+    cache = AudioCache(str(tmp_path / "tts"), max_bytes=1000, evict_to=0.5)
+    paths = [write_clip(cache, f"clip {i}", 200, 1000 + i) for i in range(6)]
+
+    cache.evict()
+
+    assert [os.path.exists(path) for path in paths] == [False] * 4 + [True] * 2
+    assert cache.size() == 400
+
+
+def test_audio_eviction_walks_the_cache_only_when_over_the_cap(audio_cache, monkeypatch):
+    write_clip(audio_cache, "existing", 100, 1000)
+    walks = []
+    entries = AudioCache.entries
+    monkeypatch.setattr(AudioCache, "entries", lambda self: walks.append(1) or entries(self))
+
+    # A fresh instance counts the cache once, then keeps a running total
+    cache = AudioCache(audio_cache.root, max_bytes=1000)
+    for i in range(5):
+        write_clip(cache, f"clip {i}", 100, 2000 + i)
+        cache.evict()
+    assert len(walks) == 1
+    assert cache.size() == 600
+
+    write_clip(cache, "large", 500, 3000)
+    cache.evict()
+    assert len(walks) == 2
+    assert cache.size() <= 900
+
+
+def test_audio_size_counts_each_clip_once_when_writes_overlap(audio_cache):
+    paths = [audio_cache.path_for(f"clip {i}", "km-KH-PisethNeural", "tone:24000", "wav") for i in range(3)]
+    for path in paths:
+        audio_cache.lookup(path)
+        with open(path, "wb") as f:
+            f.write(b"\0" * 100)
+
+    # Clips synthesized concurrently are all on disk before the first is counted
+    for path in paths:
+        audio_cache.add(path)
+
+    assert audio_cache.size() == audio_cache.stats()["bytes"] == 300
+
+def test_audio_eviction_recounts_clips_written_by_other_processes(audio_cache):
+    write_clip(audio_cache, "mine", 600, 1000)
+    other = AudioCache(audio_cache.root, max_bytes=1000)
+    write_clip(other, "theirs", 600, 2000)
+
+    # Unaware of the other clip, this instance is under the cap...
+    audio_cache.evict()
+    assert audio_cache.size() == 600
+
+    # ...until its own writes push it over and the walk sees both
+    write_clip(audio_cache, "more", 600, 3000)
+    audio_cache.evict()
+    assert audio_cache.size() == 600
+    assert audio_cache.stats()["bytes"] == 600
+
+
+@pytest.fixture
+def translation_cache(tmp_path):
+    cache = TranslationCache(str(tmp_path / "translations.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_translation_hits_and_misses(translation_cache):
+    assert translation_cache.get_many("en", "km", ["Hello", "Bye"]) == {}
+
+    translation_cache.put_many("en", "km", [("Hello", "សួស្តី")])
+    assert translation_cache.get_many("en", "km", ["Hello", "Bye"]) == {"Hello": "សួស្តី"}
+
+    assert (translation_cache.hits, translation_cache.misses) == (1, 3)
+    assert translation_cache.stats()["entries"] == 1
+
+
+def test_translation_key_is_the_language_pair_and_normalized_text(translation_cache):
+    translation_cache.put_many("en", "km", [("Hello  world", "សួស្តី ពិភពលោក")])
+    translation_cache.put_many("en", "fr", [("Hello world", "Bonjour le monde")])
+    translation_cache.put_many(None, "km", [("Hello world", "auto")])
+
+    assert translation_cache.get_many("en", "km", [" Hello world"]) == {" Hello world": "សួស្តី ពិភពលោក"}
+    assert translation_cache.get_many("en", "fr", ["Hello world"]) == {"Hello world": "Bonjour le monde"}
+    assert translation_cache.get_many("auto", "km", ["Hello world"]) == {"Hello world": "auto"}
+    assert translation_cache.get_many("fr", "km", ["Hello world"]) == {}
+
+
+def test_translations_survive_reopening(tmp_path):
+    path = str(tmp_path / "translations.sqlite3")
+    cache = TranslationCache(path)
+    cache.put_many("en", "km", [("Hello", "សួស្តី")])
+    cache.close()
+
+    cache = TranslationCache(path)
+    assert cache.get_many("en", "km", ["Hello"]) == {"Hello": "សួស្តី"}
+    cache.close()
+
+
+def test_translation_eviction_drops_least_recently_used_rows(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(cache_module.time, "time", lambda: next(clock))
+    # Each row is 10 bytes: 5 of text, 5 of translation
+    cache = TranslationCache(str(tmp_path / "translations.sqlite3"), max_bytes=30)
+    for text in ["aaaaa", "bbbbb", "ccccc"]:
+        cache.put_many("en", "fr", [(text, text.upper())])
+    cache.get_many("en", "fr", ["aaaaa"])
+
+    cache.put_many("en", "fr", [("ddddd", "DDDDD")])
+
+    assert cache.get_many("en", "fr", ["aaaaa", "bbbbb", "ccccc", "ddddd"]) == {
+        "aaaaa": "AAAAA",
+        "ccccc": "CCCCC",
+        "ddddd": "DDDDD",
+    }
+    assert cache.stats()["bytes"] == 30
+    cache.close()
+
+
+def test_translation_cache_lookups_are_chunked(translation_cache):
+    pairs = [(f"line {i}", f"ligne {i}") for i in range(1200)]
+    translation_cache.put_many("en", "fr", pairs)
+
+    assert translation_cache.get_many("en", "fr", [text for text, _ in pairs]) == dict(pairs)
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return UploadStore(str(tmp_path / "uploads"), chunk_size=4)
+
+
+def test_upload_is_stored_once_by_content(uploads, tmp_path):
+    first = tmp_path / "talk.MP4"
+    first.write_bytes(b"video bytes")
+    second = tmp_path / "renamed.mp4"
+    second.write_bytes(b"video bytes")
+
+    digest, path = uploads.store(str(first))
+    assert digest == hashlib.sha256(b"video bytes").hexdigest()
+    assert path == os.path.join(uploads.root, digest[:2], f"{digest}.mp4")
+    assert open(path, "rb").read() == b"video bytes"
+
+    assert uploads.store(str(second)) == (digest, path)
+    assert (uploads.hits, uploads.misses) == (1, 1)
+
+
+def test_upload_on_the_same_filesystem_is_hardlinked(uploads, tmp_path):
+    source = tmp_path / "talk.mp4"
+    source.write_bytes(b"video bytes")
+
+    _, path = uploads.store(str(source))
+
+    assert os.path.samefile(path, source)
+
+
+def test_upload_is_copied_when_it_cannot_be_linked(uploads, tmp_path, monkeypatch):
+    def no_link(source, target):
+        raise OSError("hardlinks unsupported")
+
+    monkeypatch.setattr(cache_module.os, "link", no_link)
+    source = tmp_path / "talk.mp4"
+    source.write_bytes(b"video bytes, copied in chunks")
+
+    digest, path = uploads.store(str(source))
+    assert digest == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert not os.path.samefile(path, source)
+    assert open(path, "rb").read() == source.read_bytes()
+
+    # A known upload is not written again, and no partial file is left behind
+    assert uploads.store(str(source)) == (digest, path)
+    assert os.listdir(uploads.root) == [digest[:2]]
+    assert (uploads.hits, uploads.misses) == (1, 1)
+
+
+def test_different_uploads_are_kept_apart(uploads, tmp_path):
+    a = tmp_path / "a.mp4"
+    a.write_bytes(b"first video")
+    b = tmp_path / "b.mp4"
+    b.write_bytes(b"second video")
+
+    assert uploads.store(str(a))[1] != uploads.store(str(b))[1]
+    assert uploads.misses == 2
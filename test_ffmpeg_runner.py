@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from ffmpeg_runner import FFmpegError, FFmpegRunner
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def python(code: str):
+    return [sys.executable, "-c", code]
+
+
+def test_captures_stdout_and_feeds_stdin():
+    async def feed(stdin):
+        stdin.write(b"hello ")
+        stdin.write(b"world")
+        await stdin.drain()
+
+    async def main():
+        runner = FFmpegRunner(2)
+        echoed = await runner.run(python("import sys; sys.stdout.write(sys.stdin.read().upper())"), feed=feed, capture_stdout=True)
+        return echoed
+
+    assert run(main()) == b"HELLO WORLD"
+
+
+def test_failure_carries_returncode_and_stderr():
+    with pytest.raises(FFmpegError) as error:
+        run(FFmpegRunner().run(python("import sys; sys.stderr.write('bad input'); sys.exit(3)")))
+
+    assert error.value.returncode == 3
+    assert "bad input" in error.value.stderr
+
+
+def test_limits_processes_in_flight(tmp_path):
+    log = tmp_path / "log"
+    code = f"import os, time; f = open({str(log)!r}, 'a'); f.write(f'start {{time.time()}}\\n'); f.flush(); time.sleep(0.2); f.write(f'end {{time.time()}}\\n')"
+
+    async def main():
+        runner = FFmpegRunner(2)
+        await asyncio.gather(*(runner.run(python(code)) for _ in range(5)))
+
+    run(main())
+
+    events = sorted((float(t), kind) for kind, t in (line.split() for line in log.read_text().splitlines()))
+    running = peak = 0
+    for _, kind in events:
+        running += 1 if kind == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+
+
+def test_nested_call_does_not_wait_for_a_slot():
+    async def main():
+        runner = FFmpegRunner(1)
+
+        async def feed(stdin):
+            # Runs while the outer process holds the only slot
+            stdin.write(await runner.run(python("print('inner', end='')"), capture_stdout=True, nested=True))
+
+        return await runner.run(python("import sys; sys.stdout.write(sys.stdin.read())"), feed=feed, capture_stdout=True)
+
+    assert run(asyncio.wait_for(main(), 10)) == b"inner"
+
+
+def test_timeout_kills_the_process():
+    started = time.monotonic()
+    with pytest.raises(FFmpegError) as error:
+        run(FFmpegRunner(timeout=0.2).run(python("import time; time.sleep(30)")))
+
+    assert error.value.returncode is None
+    assert time.monotonic() - started < 10
+
+
+def test_cancel_kills_the_process(tmp_path):
+    pid_file = tmp_path / "pid"
+
+    async def main():
+        task = asyncio.create_task(FFmpegRunner().run(python(
+            f"import os, time; open({str(pid_file)!r}, 'w').write(str(os.getpid())); time.sleep(30)"
+        )))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(main())
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def test_reports_ffmpeg_progress_blocks(tmp_path, monkeypatch):
+    # A stand-in ffmpeg that prints -progress blocks to stdout
+    fake = tmp_path / "ffmpeg"
+    fake.write_text(f"#!{sys.executable}\nprint('out_time=00:00:01\\nspeed=2x\\nprogress=continue\\nout_time=00:00:02\\nprogress=end')\n")
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    updates = []
+
+    run(FFmpegRunner().run(["ffmpeg", "-i", "in.mp4", "out.mp4"], on_progress=updates.append))
+
+    assert [update["out_time"] for update in updates] == ["00:00:01", "00:00:02"]
+    assert updates[-1]["progress"] == "end"
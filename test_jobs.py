@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue, JobWorkers
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield queue
+    queue.close()
+
+
+def test_job_moves_from_queued_to_running_to_done(queue):
+    job_id = queue.submit("a.mp4", languages=["km"])
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.counts() == {"queued": 1, "running": 0, "done": 0, "failed": 0}
+
+    claimed = queue.claim()
+    assert claimed["id"] == job_id
+    assert claimed["params"] == {"languages": ["km"]}
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.claim() is None
+
+    queue.progress(job_id, 0.5, "Halfway")
+    assert queue.get(job_id)["progress"] == 0.5
+    assert queue.get(job_id)["message"] == "Halfway"
+
+    queue.finish(job_id, {"success": True, "files_created": []})
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["progress"] == 1
+    assert job["result"] == {"success": True, "files_created": []}
+
+
+def test_failed_and_interrupted_jobs(queue):
+    failed = queue.submit("a.mp4")
+    interrupted = queue.submit("b.mp4")
+    queue.claim()
+    queue.claim()
+
+    queue.fail(failed, "boom")
+    assert queue.get(failed)["status"] == "failed"
+    assert queue.get(failed)["error"] == "boom"
+
+    assert queue.requeue_running() == 1
+    assert queue.get(interrupted)["status"] == "queued"
+    assert queue.claim()["id"] == interrupted
+
+
+def test_claim_is_oldest_first_and_never_hands_out_a_job_twice(queue):
+    ids = [queue.submit(f"{i}.mp4") for i in range(40)]
+    claimed = []
+
+    def claim_all():
+        while (job := queue.claim()) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=claim_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(ids)
+    assert queue.counts()["running"] == 40
+
+
+def test_reads_from_many_threads_while_jobs_change(queue):
+    errors = []
+
+    def read():
+        seen = 0
+        try:
+            for _ in range(200):
+                total = sum(queue.counts().values())
+                assert total >= seen
+                seen = total
+                assert all(job["status"] == "queued" for job in queue.recent(limit=1000))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    for i in range(100):
+        queue.submit(f"{i}.mp4")
+    for thread in readers:
+        thread.join()
+
+    assert not errors
+    assert len(queue.recent(limit=1000)) == 100
+
+
+def test_submit_reuses_a_finished_job_while_its_outputs_exist(queue, tmp_path):
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"video")
+    first = queue.submit("a.mp4", input_key="key")
+    queue.claim()
+    queue.finish(first, {"success": True, "files_created": [str(output)]})
+
+    reused = queue.get(queue.submit("a.mp4", input_key="key"))
+    assert reused["status"] == "done"
+    assert reused["result"]["files_created"] == [str(output)]
+
+    output.unlink()
+    assert queue.get(queue.submit("a.mp4", input_key="key"))["status"] == "queued"
+
+
+class FakeVideoTool:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.videos = []
+
+    async def translate_video(self, video_path, languages, output_path, on_progress=None, **options):
+        self.videos.append(video_path)
+        on_progress(0.5, "Working")
+        if self.fail:
+            raise RuntimeError("ffmpeg failed")
+        return {"success": True, "files_created": [output_path]}
+
+    def cleanup(self):
+        pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_workers_pick_up_queued_jobs(queue, tmp_path, monkeypatch, fail):
+    service = FakeVideoTool(fail)
+    monkeypatch.setattr(jobs, "VideoTool", lambda **options: service)
+    job_ids = [queue.submit(f"{i}.mp4", languages=["km", "fr"]) for i in range(3)]
+
+    workers = JobWorkers(queue, str(tmp_path / "out"), workers=2, poll_interval=0.01)
+    workers.start()
+    try:
+        wait_for(lambda: queue.counts()["queued"] == queue.counts()["running"] == 0)
+    finally:
+        workers.stop()
+
+    assert sorted(service.videos) == ["0.mp4", "1.mp4", "2.mp4"]
+    for job_id in job_ids:
+        job = queue.get(job_id)
+        if fail:
+            assert job["status"] == "failed"
+            assert job["error"] == "ffmpeg failed"
+        else:
+            assert job["status"] == "done"
+            assert job["result"]["files_created"] == [str(tmp_path / "out" / f"{job_id}_km_fr.mp4")]
+
+
+def test_workers_requeue_jobs_interrupted_by_a_restart(queue, tmp_path, monkeypatch):
+    service = FakeVideoTool()
+    monkeypatch.setattr(jobs, "VideoTool", lambda **options: service)
+    job_id = queue.submit("a.mp4")
+    queue.claim()
+
+    workers = JobWorkers(queue, str(tmp_path / "out"), workers=1, poll_interval=0.01)
+    workers.start()
+    try:
+        wait_for(lambda: queue.get(job_id)["status"] == "done")
+    finally:
+        workers.stop()
+
+    assert service.videos == ["a.mp4"]
@@ -0,0 +1,15 @@
+from pathlib import Path
+
+from main import discover_videos
+
+
+def test_discover_videos_matches_only_language_suffixes(tmp_path: Path):
+    for name in [
+        "ep1.mp4", "ep1_en.srt", "ep1_extra.mp4", "ep1_extra_en.srt", "ep1_extra_fr.srt",
+        "ep2.mp4", "ep2_notes.txt", "ep2_director_cut.srt",
+        "ep3.mp4", "ep3_zh-TW.vtt",
+    ]:
+        (tmp_path / name).touch()
+
+    assert discover_videos(tmp_path, "fr") == [("ep1", "en"), ("ep1_extra", "fr"), ("ep3", "zh-TW")]
+    assert discover_videos(tmp_path, "en") == [("ep1", "en"), ("ep1_extra", "en"), ("ep3", "zh-TW")]
@@ -0,0 +1,115 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Metrics
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    metrics = Metrics(str(tmp_path / "logs" / "metrics.jsonl"))
+    yield metrics
+    metrics.close()
+
+
+def events(metrics):
+    with open(metrics.path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_counters_add_up_per_label_set(metrics):
+    metrics.inc("cues_total", 3, lang="km")
+    metrics.inc("cues_total", 2, lang="km")
+    metrics.inc("cues_total", lang="fr")
+
+    assert metrics.counters == {
+        ("cues_total", (("lang", "km"),)): 5,
+        ("cues_total", (("lang", "fr"),)): 1,
+    }
+
+
+def test_throughput_records_totals_rate_and_a_json_line(metrics):
+    metrics.throughput("tts", 40, 2.0, backend="edge")
+    metrics.throughput("tts", 10, 3.0, backend="edge")
+
+    key = (("backend", "edge"),)
+    assert metrics.counters[("tts_items_total", key)] == 50
+    assert metrics.counters[("tts_seconds_total", key)] == 5.0
+    assert metrics.gauges[("tts_items_per_second", key)] == pytest.approx(10 / 3)
+    assert [(e["event"], e["items"], e["per_second"], e["backend"]) for e in events(metrics)] == [
+        ("tts", 40, 20.0, "edge"),
+        ("tts", 10, 3.33, "edge"),
+    ]
+
+
+def test_cache_hit_rate(metrics):
+    metrics.cache("audio", 0, 0)
+    assert metrics.gauges[("cache_hit_rate", (("cache", "audio"),))] == 0.0
+
+    metrics.cache("audio", 3, 1)
+    assert metrics.gauges[("cache_hits", (("cache", "audio"),))] == 3
+    assert metrics.gauges[("cache_hit_rate", (("cache", "audio"),))] == 0.75
+
+
+def test_timer_records_runs_and_extra_fields_even_on_error(metrics):
+    with metrics.timer("mux", lang="km") as extra:
+        extra["bytes"] = 1024
+    with pytest.raises(ValueError):
+        with metrics.timer("mux", lang="km"):
+            raise ValueError("failed")
+
+    key = (("lang", "km"),)
+    assert metrics.counters[("mux_runs_total", key)] == 2
+    assert metrics.counters[("mux_bytes_total", key)] == 1024
+    assert ("mux_last_seconds", key) in metrics.gauges
+    assert [e.get("bytes") for e in events(metrics)] == [1024, None]
+
+
+def test_emit_is_disabled_without_a_path():
+    metrics = Metrics(None)
+    metrics.throughput("translate", 1, 1.0)
+    assert metrics.counters[("translate_items_total", ())] == 1
+
+
+def test_concurrent_increments_are_not_lost(metrics):
+    def work():
+        for _ in range(1000):
+            metrics.inc("requests_total", provider="google")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.counters[("requests_total", (("provider", "google"),))] == 4000
+
+
+def test_render_prometheus_text(metrics):
+    metrics.inc("stage_bytes_total", 2048, stage="tts", job="a")
+    metrics.set("ffmpeg_fps", 240.5, task="mux")
+    metrics.set("ffmpeg_fps", 30, task="extract")
+
+    assert metrics.render() == (
+        "# TYPE videoai_stage_bytes_total counter\n"
+        'videoai_stage_bytes_total{job="a",stage="tts"} 2048\n'
+        "# TYPE videoai_ffmpeg_fps gauge\n"
+        'videoai_ffmpeg_fps{task="extract"} 30\n'
+        'videoai_ffmpeg_fps{task="mux"} 240.5\n'
+    )
+
+
+def test_serve_metrics_over_http(metrics):
+    metrics.inc("cues_total", 7)
+    metrics.serve(0, host="127.0.0.1")
+    url = f"http://127.0.0.1:{metrics.server.server_address[1]}"
+
+    with urllib.request.urlopen(f"{url}/metrics") as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert "videoai_cues_total{} 7" in response.read().decode("utf-8")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{url}/other")
+    assert error.value.code == 404
@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import pytest
+
+from mock_server import MockTranslateServer
+from network import (
+    SUCCESS,
+    THROTTLED,
+    UNAVAILABLE,
+    AdaptiveLimit,
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderClient,
+    ProviderError,
+    TokenBucket,
+)
+from translate import GoogleTranslator, _executor
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def server():
+    mock = MockTranslateServer(rate=0, max_in_flight=64, latency=0.005)
+    yield mock
+    mock.close()
+
+
+async def translate(client: ProviderClient, translator: GoogleTranslator, text: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await client.call(loop.run_in_executor, _executor, translator.translate, text)
+
+
+def test_mock_server_translates(server):
+    translator = GoogleTranslator("en", "km", base_url=server.serve())
+
+    assert run(translate(ProviderClient("test"), translator, "hello\nworld")) == "[km] hello\n[km] world"
+
+
+def test_token_bucket_spaces_out_calls_after_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert [round(bucket.reserve(), 2) for _ in range(4)] == [0.0, 0.0, 0.1, 0.2]
+
+    bucket = TokenBucket(rate=10)
+    bucket.pause(0.5)
+    assert bucket.reserve() == pytest.approx(0.6, abs=0.01)
+
+
+def test_token_bucket_without_rate_never_waits():
+    async def main():
+        bucket = TokenBucket(rate=0)
+        for _ in range(100):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    run(main())
+    assert time.monotonic() - started < 0.1
+
+
+def test_token_bucket_keeps_client_under_server_rate():
+    mock = MockTranslateServer(rate=20, burst=1, max_in_flight=64, latency=0.001)
+    translator = GoogleTranslator("en", "km", base_url=mock.serve())
+    client = ProviderClient("test", rate=15, burst=1, concurrency=8, retries=0)
+
+    async def main():
+        return await asyncio.gather(*(translate(client, translator, f"line {i}") for i in range(12)))
+
+    started = time.monotonic()
+    try:
+        assert len(run(main())) == 12
+    finally:
+        mock.close()
+
+    assert time.monotonic() - started >= 11 / 15 * 0.9
+    assert mock.stats() == {"requests": 12, "http_200": 12}
+
+
+def test_adaptive_limit_halves_once_per_burst_of_throttles():
+    async def main():
+        limit = AdaptiveLimit(8, 8)
+        slots = [await limit.acquire() for _ in range(8)]
+        for started in slots:
+            await limit.release(started, THROTTLED)
+        after_burst = limit.limit
+        for _ in range(20):
+            await limit.release(await limit.acquire(), SUCCESS)
+        return after_burst, limit.limit
+
+    after_burst, recovered = run(main())
+
+    assert after_burst == 4
+    assert 4 < recovered <= 8
+
+
+def test_adaptive_limit_backs_off_from_a_throttling_server():
+    mock = MockTranslateServer(rate=0, max_in_flight=2, latency=0.02, retry_after=0.01)
+    translator = GoogleTranslator("en", "km", base_url=mock.serve())
+    client = ProviderClient("test", concurrency=8, retries=8, backoff=0.01)
+
+    async def main():
+        return await asyncio.gather(*(translate(client, translator, f"line {i}") for i in range(24)))
+
+    try:
+        results = run(main())
+    finally:
+        mock.close()
+
+    assert results == [f"[km] line {i}" for i in range(24)]
+    assert client.counts[THROTTLED] > 0
+    assert client.limit.limit < 8
+
+
+def test_circuit_breaker_opens_after_outages_and_closes_after_a_good_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record("test", THROTTLED)
+    breaker.record("test", UNAVAILABLE)
+    breaker.check("test")
+    breaker.record("test", UNAVAILABLE)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.check("test")
+
+    time.sleep(0.06)
+    breaker.check("test")
+    # Only one trial call while half open
+    with pytest.raises(CircuitOpenError):
+        breaker.check("test")
+    breaker.record("test", SUCCESS)
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_stops_calling_a_failing_server():
+    mock = MockTranslateServer(rate=0, latency=0.001, failure_rate=1.0)
+    translator = GoogleTranslator("en", "km", base_url=mock.serve())
+    client = ProviderClient("test", retries=0, failure_threshold=3, reset_timeout=0.1)
+
+    async def attempt():
+        try:
+            await translate(client, translator, "hello")
+        except (ProviderError, CircuitOpenError) as e:
+            return type(e).__name__
+
+    try:
+        outcomes = [run(attempt()) for _ in range(5)]
+        assert outcomes == ["ProviderError"] * 3 + ["CircuitOpenError"] * 2
+        assert mock.stats()["requests"] == 3
+
+        mock.failure_rate = 0.0
+        time.sleep(0.11)
+        assert run(attempt()) is None
+        assert client.breaker.state == "closed"
+    finally:
+        mock.close()
+
+
+def test_cancelled_trial_call_does_not_leave_the_circuit_stuck(server):
+    translator = GoogleTranslator("en", "km", base_url=server.serve())
+    client = ProviderClient("test", rate=1, burst=1, retries=0, failure_threshold=1, reset_timeout=0.01)
+    client.breaker.record("test", UNAVAILABLE)
+    time.sleep(0.02)
+
+    async def main():
+        client.bucket.reserve()  # the next token is a second away
+        call = asyncio.create_task(translate(client, translator, "hello"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        client.bucket = TokenBucket(0)
+        return await translate(client, translator, "hello")
+
+    assert run(main()) == "[km] hello"
+    assert client.breaker.state == "closed"
+    assert client.limit.in_flight == 0
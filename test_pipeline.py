@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from pipeline import Pipeline, file_fingerprint
+
+
+def run_stage(pipeline, run, inputs, outputs, params=None, valid=None):
+    return asyncio.run(pipeline.stage("build", run, inputs, outputs, params, valid))
+
+
+@pytest.fixture
+def files(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("hello")
+    return str(source), str(tmp_path / "out.txt"), str(tmp_path / "job.manifest.json")
+
+
+def build(source, output):
+    def run():
+        with open(source) as f, open(output, "w") as out:
+            out.write(f.read().upper())
+    return run
+
+
+def test_stage_is_skipped_until_inputs_params_or_outputs_change(files):
+    source, output, manifest = files
+
+    assert run_stage(Pipeline(manifest), build(source, output), [source], [output])
+    assert not run_stage(Pipeline(manifest), build(source, output), [source], [output])
+
+    # Parameters
+    assert run_stage(Pipeline(manifest), build(source, output), [source], [output], {"mode": "fast"})
+    assert not run_stage(Pipeline(manifest), build(source, output), [source], [output], {"mode": "fast"})
+
+    # Inputs
+    with open(source, "w") as f:
+        f.write("changed")
+    assert run_stage(Pipeline(manifest), build(source, output), [source], [output], {"mode": "fast"})
+
+    # Outputs edited by hand
+    with open(output, "w") as f:
+        f.write("edited")
+    assert run_stage(Pipeline(manifest), build(source, output), [source], [output], {"mode": "fast"})
+
+
+def test_missing_or_unrecorded_outputs_are_not_current(files, tmp_path):
+    source, output, manifest = files
+    run_stage(Pipeline(manifest), build(source, output), [source], [output])
+    inputs = {source: file_fingerprint(source)}
+    pipeline = Pipeline(manifest)
+
+    assert pipeline.is_current("build", inputs, {}, [output])
+    assert not pipeline.is_current("build", inputs, {}, [output, str(tmp_path / "never_written.txt")])
+
+    (tmp_path / "out.txt").unlink()
+    assert not pipeline.is_current("build", inputs, {}, [output])
+
+
+def test_stage_that_writes_nothing_runs_again(files, tmp_path):
+    source, _, manifest = files
+    missing = str(tmp_path / "not_written.txt")
+
+    assert run_stage(Pipeline(manifest), lambda: None, [source], [missing])
+    assert run_stage(Pipeline(manifest), lambda: None, [source], [missing])
+
+
+def test_forced_and_invalid_stages_run(files):
+    source, output, manifest = files
+    run_stage(Pipeline(manifest), build(source, output), [source], [output])
+
+    assert run_stage(Pipeline(manifest, force=["build"]), build(source, output), [source], [output])
+    assert run_stage(Pipeline(manifest), build(source, output), [source], [output], valid=lambda: False)
+    assert not run_stage(Pipeline(manifest), build(source, output), [source], [output], valid=lambda: True)
+
+
+def test_missing_input_raises(files, tmp_path):
+    _, output, manifest = files
+
+    with pytest.raises(FileNotFoundError):
+        run_stage(Pipeline(manifest), lambda: None, [str(tmp_path / "nope.srt")], [output])
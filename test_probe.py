@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from ffmpeg_runner import FFmpegError
+from probe import MediaInfo, MediaProbe, parse_rate
+
+FFPROBE_OUTPUT = {
+    "format": {"duration": "12.500000", "format_name": "mov,mp4,m4a,3gp,3g2,mj2"},
+    "streams": [
+        {"index": 0, "codec_type": "video", "width": 1280, "height": 720, "avg_frame_rate": "30000/1001"},
+        {"index": 1, "codec_type": "audio", "sample_rate": "48000", "channels": 2},
+        {"index": 2, "codec_type": "subtitle", "codec_name": "mov_text", "tags": {"language": "eng"}},
+    ],
+}
+
+
+class ProbeRunner:
+    """FFmpegRunner stand-in answering ffprobe; counts calls and can be slowed down or fail"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.commands = []
+
+    async def run(self, cmd, capture_stdout=False, **kwargs):
+        self.commands.append(cmd)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise FFmpegError(cmd, 1, "Invalid data found when processing input")
+        if "-skip_frame" in cmd:
+            return b"4.004\n0.000\n2.002,\n"
+        return json.dumps(FFPROBE_OUTPUT).encode()
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "talk.mp4"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def test_media_info_from_ffprobe():
+    info = MediaInfo.from_ffprobe("talk.mp4", FFPROBE_OUTPUT)
+
+    assert info.duration_ms == 12500
+    assert info.frame_rate == pytest.approx(29.97, abs=0.01)
+    assert info.size == (1280, 720)
+    assert (info.sample_rate, info.channels) == (48000, 2)
+    assert info.subtitle_streams == [{"index": 2, "codec": "mov_text", "language": "eng", "title": None}]
+
+
+def test_media_info_falls_back_to_stream_durations():
+    info = MediaInfo.from_ffprobe("clip.ts", {"format": {}, "streams": [{"duration": "3.5"}, {"duration": "4.0"}]})
+
+    assert info.duration == 4.0
+    assert info.video_stream is None
+    assert info.size == (0, 0)
+    assert info.frame_rate == 0.0
+
+
+@pytest.mark.parametrize("rate, expected", [("25/1", 25.0), ("24", 24.0), ("0/0", 0.0), (None, 0.0), ("n/a", 0.0)])
+def test_parse_rate(rate, expected):
+    assert parse_rate(rate) == expected
+
+
+def test_info_is_probed_once_until_the_file_changes(video):
+    runner = ProbeRunner()
+    probe = MediaProbe(runner)
+
+    async def probe_twice():
+        return await probe.info(video), await probe.info(video)
+
+    first, second = asyncio.run(probe_twice())
+    assert first is second
+    assert len(runner.commands) == 1
+    assert probe.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    with open(video, "ab") as f:
+        f.write(b" edited")
+    asyncio.run(probe.info(video))
+    assert len(runner.commands) == 2
+
+
+def test_concurrent_requests_share_one_ffprobe(video):
+    runner = ProbeRunner(delay=0.05)
+    probe = MediaProbe(runner)
+
+    async def probe_all():
+        return await asyncio.gather(*(probe.info(video) for _ in range(5)), probe.keyframes(video))
+
+    *infos, keyframes = asyncio.run(probe_all())
+
+    assert all(info is infos[0] for info in infos)
+    assert keyframes == [0.0, 2.002, 4.004]
+    assert len(runner.commands) == 2
+    assert (probe.hits, probe.misses) == (4, 2)
+
+
+def test_failed_probe_is_raised_to_every_waiter_and_not_cached(video):
+    runner = ProbeRunner(delay=0.05, fail=True)
+    probe = MediaProbe(runner)
+
+    async def probe_all():
+        return await asyncio.gather(probe.info(video), probe.info(video), return_exceptions=True)
+
+    assert all(isinstance(result, FFmpegError) for result in asyncio.run(probe_all()))
+
+    runner.fail = False
+    assert asyncio.run(probe.info(video)).duration == 12.5
+    assert len(runner.commands) == 2
+
+
+def test_least_recently_used_entries_are_dropped(tmp_path):
+    paths = []
+    for name in "abc":
+        path = tmp_path / f"{name}.mp4"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    runner = ProbeRunner()
+    probe = MediaProbe(runner, max_entries=2)
+
+    async def probe_paths(*indexes):
+        for i in indexes:
+            await probe.info(paths[i])
+
+    asyncio.run(probe_paths(0, 1, 0, 2))
+    assert [key[0] for key in probe.infos] == [os.path.abspath(paths[0]), os.path.abspath(paths[2])]
+
+    asyncio.run(probe_paths(1))
+    assert len(runner.commands) == 4
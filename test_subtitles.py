@@ -0,0 +1,130 @@
+import pytest
+
+from subtitles import Cues, group_cues, load_cues, parse_srt_text, read_cues, write_cues
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+Hello there.
+
+2
+00:00:03,000 --> 00:00:04,000
+Two
+lines
+
+3
+00:00:05,000 --> 00:00:06,000
+
+4
+00:01:00,5 --> 00:01:01,000
+Short millis
+"""
+
+VTT = """WEBVTT
+
+NOTE a comment
+
+cue-1
+00:00:01.000 --> 00:00:02.500 align:start
+<i>Hello</i> there.
+
+00:03.000 --> 00:04.000
+Two
+lines
+"""
+
+ASS = """[Script Info]
+Title: test
+
+[V4+ Styles]
+Format: Name, Fontname
+Style: Default,Arial
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,{\\i1}Hello{\\i0} there.
+Dialogue: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,Two\\Nlines, with a comma
+"""
+
+
+def test_parse_srt_text():
+    cues = parse_srt_text(SRT)
+
+    assert cues.starts.tolist() == [1000, 3000, 60500]
+    assert cues.ends.tolist() == [2500, 4000, 61000]
+    assert cues.texts == ["Hello there.", "Two\nlines", "Short millis"]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_parse_srt_text_handles_bom_and_line_endings(newline):
+    cues = parse_srt_text("\ufeff" + SRT.replace("\n", newline))
+
+    assert list(cues) == list(parse_srt_text(SRT))
+
+
+@pytest.mark.parametrize(
+    "name, content, expected",
+    [
+        ("a.srt", SRT, [(1000, 2500, "Hello there."), (3000, 4000, "Two\nlines"), (60500, 61000, "Short millis")]),
+        ("a.vtt", VTT, [(1000, 2500, "Hello there."), (3000, 4000, "Two\nlines")]),
+        ("a.ass", ASS, [(1000, 2500, "Hello there."), (3000, 4000, "Two\nlines, with a comma")]),
+    ],
+)
+@pytest.mark.parametrize("bom, newline", [(False, "\n"), (True, "\r\n")])
+def test_read_cues(tmp_path, name, content, expected, bom, newline):
+    path = tmp_path / name
+    path.write_bytes((b"\xef\xbb\xbf" if bom else b"") + content.replace("\n", newline).encode("utf-8"))
+
+    assert list(read_cues(str(path))) == expected
+    assert list(load_cues(str(path))) == expected
+
+
+@pytest.mark.parametrize("extension", ["srt", "vtt", "ass"])
+def test_write_then_read_round_trips(tmp_path, extension):
+    rows = [(1000, 2500, "Hello there."), (3000, 4000, "Two\nlines")]
+    path = write_cues(rows, str(tmp_path / f"out.{extension}"))
+
+    assert list(read_cues(path)) == rows
+
+
+def test_group_cues_joins_sentences_split_over_cues():
+    cues = Cues.from_rows([
+        (0, 1000, "This sentence"),
+        (1100, 2000, "goes on."),
+        (2100, 3000, "- Next speaker"),
+        (5000, 6000, "after a pause"),
+    ])
+
+    grouped = group_cues(cues)
+
+    assert list(grouped) == [(0, 2000, "This sentence goes on."), (2100, 3000, "- Next speaker"), (5000, 6000, "after a pause")]
+
+
+BACKWARDS = """1
+00:00:05,000 --> 00:00:04,000
+Ends before it starts
+
+2
+00:00:06,000 --> 00:00:06,000
+Zero length
+
+3
+00:00:07,000 --> 00:00:08,000
+Kept
+"""
+
+
+def test_cues_ending_before_they_start_are_dropped(tmp_path):
+    path = tmp_path / "a.srt"
+    path.write_text(BACKWARDS, encoding="utf-8")
+    vtt = write_cues([(5000, 4000, "backwards"), (7000, 8000, "Kept")], str(tmp_path / "a.vtt"))
+
+    assert list(parse_srt_text(BACKWARDS)) == [(7000, 8000, "Kept")]
+    assert list(read_cues(str(path))) == [(7000, 8000, "Kept")]
+    assert list(read_cues(vtt)) == [(7000, 8000, "Kept")]
+
+
+def test_line_breaks_survive_a_round_trip(tmp_path):
+    source = "1\n00:00:01,000 --> 00:00:02,000\nFirst  line\nsecond line\n"
+    path = write_cues(parse_srt_text(source), str(tmp_path / "out.srt"))
+
+    assert list(parse_srt_text(open(path, encoding="utf-8").read())) == [(1000, 2000, "First line\nsecond line")]
@@ -0,0 +1,79 @@
+import asyncio
+
+from translate import DELIMITER, FakeTranslator, pack_batches, translate_batch, translate_texts
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Provider:
+    """Tags lines like FakeTranslator, but merges or splits some of them"""
+
+    def __init__(self, merge=(), split=()):
+        self.merge = set(merge)
+        self.split = set(split)
+        self.requests = []
+
+    async def __call__(self, text):
+        self.requests.append(text)
+        lines = []
+        for line in text.split(DELIMITER):
+            if lines and line in self.merge:
+                lines[-1] += f" [km] {line}"
+            elif line in self.split:
+                lines.extend(f"[km] {part}" for part in line.split(", "))
+            else:
+                lines.append(f"[km] {line}")
+        return DELIMITER.join(lines)
+
+
+def test_translate_batch_uses_one_request_when_lines_line_up():
+    provider = Provider()
+    texts = [f"line {i}" for i in range(8)]
+
+    assert run(translate_batch(provider, texts)) == [f"[km] {text}" for text in texts]
+    assert len(provider.requests) == 1
+
+
+def test_translate_batch_bisects_when_provider_merges_lines():
+    provider = Provider(merge=["line 5"])
+    texts = [f"line {i}" for i in range(8)]
+
+    result = run(translate_batch(provider, texts))
+
+    assert result[:5] == [f"[km] line {i}" for i in range(5)]
+    assert result[6:] == ["[km] line 6", "[km] line 7"]
+    # Alone, the merged line can only map back to itself
+    assert result[5] == "[km] line 5"
+    assert len(provider.requests) > 1
+
+
+def test_translate_batch_bisects_when_provider_splits_lines():
+    provider = Provider(split=["yes, sir"])
+    texts = ["one", "two", "yes, sir", "four"]
+
+    result = run(translate_batch(provider, texts))
+
+    assert len(result) == len(texts)
+    assert result[:2] == ["[km] one", "[km] two"]
+    assert result[3] == "[km] four"
+    # A single line is taken whole, however the provider broke it
+    assert result[2] == "[km] yes\n[km] sir"
+
+
+def test_translate_batch_keeps_source_when_nothing_comes_back():
+    async def empty(text):
+        return ""
+
+    assert run(translate_batch(empty, ["a", "b"])) == ["a", "b"]
+
+
+def test_translate_texts_dedupes_and_keeps_order():
+    translator = FakeTranslator(target="km")
+    texts = ["hello", "bye", "", "hello", "two  spaced\nlines"]
+
+    result = run(translate_texts(translator, texts, max_chars=12))
+
+    assert result == ["[km] hello", "[km] bye", "", "[km] hello", "[km] two spaced lines"]
+    assert translator.calls == len(pack_batches(["hello", "bye", "two spaced lines"], 12))
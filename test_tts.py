@@ -0,0 +1,77 @@
+import asyncio
+import os
+import random
+import wave
+
+import pytest
+
+from tts import FakeTTSBackend, SynthesisError, ToneTTSBackend, synthesize_all
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def jobs(tmp_path, count):
+    return [(f"line {i}", "voice", str(tmp_path / f"clip_{i}.wav")) for i in range(count)]
+
+
+def test_synthesize_all_keeps_job_order(tmp_path):
+    backend = FakeTTSBackend(latency=0.01, seed=3)
+    speech = jobs(tmp_path, 30)
+
+    results = run(synthesize_all(speech, backend, concurrency=5))
+
+    assert results == [path for _, _, path in speech]
+    assert backend.calls == 30
+    assert backend.max_in_flight <= 5
+
+
+def test_synthesize_all_retries_failed_cues(tmp_path):
+    backend = FakeTTSBackend(latency=0.001, failure_rate=0.3, seed=1)
+    speech = jobs(tmp_path, 20)
+
+    results = run(synthesize_all(speech, backend, retries=10, backoff=0))
+
+    assert results == [path for _, _, path in speech]
+    assert backend.calls > 20
+
+
+def test_synthesize_all_reports_cues_out_of_retries(tmp_path):
+    attempts = {}
+
+    async def synthesize(text, voice, output_path):
+        attempts[text] = attempts.get(text, 0) + 1
+        if text in ("line 1", "line 4"):
+            raise ConnectionError("down")
+        await asyncio.sleep(random.random() / 1000)
+
+    with pytest.raises(SynthesisError) as error:
+        run(synthesize_all(jobs(tmp_path, 6), synthesize, retries=2, backoff=0))
+
+    assert [index for index, _ in error.value.failures] == [1, 4]
+    assert attempts["line 1"] == 3
+    assert attempts["line 0"] == 1
+
+
+def test_synthesize_all_counts_progress(tmp_path):
+    progress = []
+
+    run(synthesize_all(jobs(tmp_path, 4), FakeTTSBackend(latency=0), on_done=lambda done, total: progress.append((done, total))))
+
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_tone_backend_is_deterministic_and_scales_with_text(tmp_path):
+    backend = ToneTTSBackend()
+    short, long, again = (str(tmp_path / f"{name}.wav") for name in ("short", "long", "again"))
+
+    run(backend.synthesize("one two", "voice", short))
+    run(backend.synthesize("one two three four five six", "voice", long))
+    run(backend.synthesize("one two", "voice", again))
+
+    assert open(short, "rb").read() == open(again, "rb").read()
+    with wave.open(short) as s, wave.open(long) as l:
+        assert s.getframerate() == backend.sample_rate
+        assert l.getnframes() > 2.5 * s.getnframes()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
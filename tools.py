@@ -1,19 +1,50 @@
+import asyncio
 import os
 import re
-import subprocess
 import sys
+import time
 import json
 import logging
-import edge_tts
+import math
+import shutil
+import tempfile
 import unicodedata
+import numpy as np
 
-from deep_translator import GoogleTranslator
-from pydub import AudioSegment
-from pydub.utils import mediainfo
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple, Union
 from pathlib import Path
-
-from config import EDGE_TTS_VOICES, GOOGLE_LANGUAGES
+from collections import deque
+
+from audio import (
+    MAX_BUFFER_BYTES,
+    SAMPLE_RATE,
+    clip_duration,
+    encode_pcm,
+    fit_cues,
+    mix_hierarchical,
+    patch_timeline,
+    render_timeline,
+    stream_timeline,
+    timeline_frames,
+)
+from cache import AudioCache, TranslationCache
+from ffmpeg_runner import FFmpegError, FFmpegRunner
+from metrics import Metrics
+from network import ProviderClient
+from pipeline import file_fingerprint
+from probe import MediaInfo, MediaProbe
+from subtitles import Cues, SubtitleWriter, group_cues, load_cues, parse_srt_text, read_cues, write_cues
+from config import EDGE_TTS_VOICES, GOOGLE_LANGUAGES, LANGUAGE_TAGS
+from translate import create_translator, translate_texts
+from tts import TTSBackend, create_tts_backend, synthesize_all
+from video import (
+    burn_parallel,
+    encoder_options,
+    output_command,
+    pick_subtitle_stream,
+    soft_subtitle_codec,
+    subtitle_filter,
+)
 
 
 def dd(data):
@@ -47,6 +78,14 @@ def file_log(text):
     logger.debug(text)
 
 
+def progress_number(value: Optional[str]) -> float:
+    """Numeric value of an ffmpeg -progress field ("1.5x", "N/A", ...)"""
+    try:
+        return float((value or "0").rstrip("x"))
+    except ValueError:
+        return 0.0
+
+
 def create_logger(name, file="logs/app.log"):
     if not os.path.exists('logs'):
         os.mkdir('logs')
@@ -54,7 +93,7 @@ def create_logger(name, file="logs/app.log"):
     logging.basicConfig(
         level=logging.DEBUG,  # INFO or DEBUG, WARNING, etc.
         filename=file,  # your log file path
-        filemode="w",  # 'w' = overwrite, 'a' = append
+        filemode="a",  # 'w' = overwrite, 'a' = append
         format="%(asctime)s - %(levelname)s - %(message)s",
     )
 
@@ -65,7 +104,29 @@ logger = create_logger(__name__)
 
 
 class VideoTool:
-    def __init__(self):
+    def __init__(
+            self,
+            tts_concurrency: int = 8,
+            tts_retries: int = 3,
+            tts_backend: Union[str, TTSBackend] = "edge",
+            translator: str = "google",
+            translate_concurrency: int = 4,
+            cache_dir: str = "cache",
+            merge_mode: str = "auto",
+            speech_fit: bool = True,
+            ffmpeg_concurrency: int = os.cpu_count() or 1,
+            ffmpeg_timeout: Optional[float] = None,
+            metrics_file: Optional[str] = "logs/metrics.jsonl",
+            subtitle_mode: str = "burn",
+            burn_preset: str = "medium",
+            burn_crf: int = 23,
+            burn_threads: int = 0,
+            duck_original: bool = False,
+            translate_rate: float = 5.0,
+            tts_rate: float = 0.0,
+            translate_url: Optional[str] = None,
+            cue_grouping: bool = True,
+    ):
         # self.temp_dir = tempfile.mkdtemp()
 
         self.temp_dir = "tmp"
@@ -77,47 +138,137 @@ class VideoTool:
         self.supported_voices = EDGE_TTS_VOICES
         self.supported_languages = GOOGLE_LANGUAGES
 
-    def extract_subtitles(self, video_path: str) -> Optional[str]:
-        """Extract existing subtitles from video file"""
-        subtitle_path = os.path.join(self.temp_dir, "original.srt")
+        self.tts_concurrency = tts_concurrency
+        self.tts_retries = tts_retries
+        if isinstance(tts_backend, str):
+            tts_backend = create_tts_backend(tts_backend)
+        self.tts_backend = tts_backend
+
+        self.translator = translator
+        self.translate_concurrency = translate_concurrency
+        # Shared by every video this tool processes, so batch runs respect
+        # one provider-wide limit instead of one limit per video
+        self.tts_semaphore = asyncio.Semaphore(max(1, tts_concurrency))
+        self.translate_semaphore = asyncio.Semaphore(max(1, translate_concurrency))
+        self.translation_cache = TranslationCache(os.path.join(cache_dir, "translations.sqlite3"))
+        self.audio_cache = AudioCache(os.path.join(cache_dir, "tts"))
+        # Clips being synthesized right now, by path, so concurrent videos
+        # speaking the same line wait for one request instead of sending two
+        self.speech_in_flight: Dict[str, asyncio.Future] = {}
+
+        # "memory" renders the dub track in RAM, "stream" pipes it to ffmpeg,
+        # "auto" streams only when the track would not fit MAX_BUFFER_BYTES
+        self.merge_mode = merge_mode
+        # Fit overrunning speech into its cue instead of cutting it off
+        self.speech_fit = speech_fit
+        # Speak a sentence split across several cues as one clip
+        self.cue_grouping = cue_grouping
+
+        # Every ffmpeg call goes through one runner so encodes share a limit
+        # and never block the event loop driving TTS
+        self.ffmpeg = FFmpegRunner(ffmpeg_concurrency, ffmpeg_timeout)
+        # One ffprobe per input file, shared by every stage and language
+        self.media = MediaProbe(self.ffmpeg)
+        self.metrics = Metrics(metrics_file)
+
+        # Requests per second (0 = unlimited) and adaptive concurrency per
+        # provider; both back off on 429/5xx and stop calling a provider
+        # that keeps failing. The semaphores above stay the hard cap.
+        self.translate_url = translate_url
+        self.translate_client = ProviderClient(
+            "translate", rate=translate_rate, concurrency=translate_concurrency, metrics=self.metrics
+        )
+        # synthesize_all retries failed cues itself
+        self.tts_client = ProviderClient(
+            "tts", rate=tts_rate, concurrency=tts_concurrency, retries=0, metrics=self.metrics
+        )
 
+        # "soft" attaches a subtitle stream (no video re-encode), "burn"
+        # renders it into the picture, "parallel" burns keyframe-aligned
+        # segments on separate cores
+        self.subtitle_mode = subtitle_mode
+        self.burn_preset = burn_preset
+        self.burn_crf = burn_crf
+        self.burn_threads = burn_threads
+        # Keep the original soundtrack under the dub, lowered while speech plays
+        self.duck_original = duck_original
+
+    async def extract_subtitles(self, video_path: str, lang: str = None) -> Tuple[Optional[Cues], Optional[str]]:
+        """
+        Extract embedded subtitles, preferring the stream tagged `lang`.
+        The track is converted to SRT on ffmpeg's stdout and parsed from
+        memory, so concurrent jobs share no temp file. Returns the cues and
+        the stream's language code, or (None, None) without a text track.
+        """
         try:
-            cmd = [
-                "ffmpeg",
-                "-i",
-                video_path,
-                "-map",
-                "0:s:0",
-                "-c:s",
-                "srt",
-                subtitle_path,
-                "-y",
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            return subtitle_path
-        except subprocess.CalledProcessError:
+            info = await self.probe(video_path)
+        except FFmpegError as e:
+            logger.warning(f"Could not probe subtitle streams: {e}")
+            return None, None
+
+        stream = pick_subtitle_stream(info.subtitle_streams, [lang, LANGUAGE_TAGS.get(lang)])
+        if stream is None:
             logger.warning("No subtitles found in video")
-            return None
+            return None, None
+
+        cmd = [
+            "ffmpeg",
+            "-loglevel", "error",
+            "-i", video_path,
+            "-map", f"0:{stream['index']}",
+            "-c:s", "srt",
+            "-f", "srt",
+            "pipe:1",
+        ]
+        output = await self.ffmpeg.run(cmd, capture_stdout=True)
+        cues = parse_srt_text(output.decode("utf-8", errors="replace"))
 
-    async def extract_audio(video_path: str, audio_output: str):
-        process = await asyncio.create_subprocess_exec(
+        tags = {tag: code for code, tag in LANGUAGE_TAGS.items()}
+        stream_lang = stream["language"] if stream["language"] != "und" else None
+        logger.info(f"Extracted {len(cues)} cues from subtitle stream {stream['index']} ({stream_lang or 'untagged'})")
+        return cues, tags.get(stream_lang, stream_lang)
+
+    async def extract_audio(self, video_path: str, audio_output: str):
+        """Extract the original audio track without re-encoding"""
+        cmd = [
             'ffmpeg',
             '-y',                   # overwrite output if exists
             '-i', video_path,       # input video file
             '-vn',                  # remove video
             '-acodec', 'copy',      # copy audio codec
             audio_output,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        ]
+        await self.ffmpeg.run(cmd, on_progress=self.progress_logger("Extract audio"))
+        print(f"Audio saved to: {audio_output}")
+        return audio_output
+
+    def progress_logger(self, label: str):
+        """ffmpeg -progress callback printing position, fps and speed, and recording them as metrics"""
+        started = time.time()
+        last = {"fps": 0.0, "speed": 0.0, "total_size": 0.0}
+
+        def on_progress(progress: Dict[str, str]):
+            out_time = progress.get("out_time", "").split(".")[0]
+            live_log(f"{label}: {out_time} fps={progress.get('fps', '-')} speed={progress.get('speed', '-')}")
+
+            for field in last:
+                if field in progress:
+                    last[field] = progress_number(progress[field])
+            self.metrics.set("ffmpeg_fps", last["fps"], task=label)
+            self.metrics.set("ffmpeg_speed", last["speed"], task=label)
+            if progress.get("progress") == "end":
+                size = int(last["total_size"])
+                self.metrics.inc("ffmpeg_bytes_total", size, task=label)
+                self.metrics.emit(
+                    "ffmpeg",
+                    task=label,
+                    seconds=round(time.time() - started, 3),
+                    fps=last["fps"],
+                    speed=last["speed"],
+                    bytes=size,
+                )
+        return on_progress
 
-        if process.returncode != 0:
-            raise RuntimeError(f"ffmpeg failed:\n{stderr.decode()}")
-        else:
-            print(f"Audio saved to: {audio_output}")
-            
-            
     def temp_path(self, path, name=None):
             tmp_path = Path(self.temp_dir) / Path(path).stem
             if name:
@@ -125,203 +276,393 @@ class VideoTool:
             Path(tmp_path).mkdir(parents=True, exist_ok=True)
             return tmp_path
 
-    def parse_srt(self, srt_path: str) -> List[Dict]:
-        """Parse SRT subtitle file"""
-        subtitles = []
-
-        with open(srt_path, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-
-        blocks = content.split("\n\n")
-
-        for block in blocks:
-            lines = block.strip().split("\n")
-            if len(lines) >= 3:
-                index = lines[0]
-                timestamp = lines[1]
-                text = "\n".join(lines[2:])
-
-                # Parse timestamp
-                start_end = timestamp.split(" --> ")
-                start_time = self.srt_time_to_seconds(start_end[0])
-                end_time = self.srt_time_to_seconds(start_end[1])
-                clean_text = re.sub(r'\s+', ' ', text).strip()
-                subtitles.append(
-                    {
-                        "index": int(index),
-                        "start": start_time,
-                        "end": end_time,
-                        # "text": text.strip(),
-                        "text": clean_text,
-                    }
-                )
-
-        return subtitles
+    def parse_srt(self, srt_path: str) -> Cues:
+        """Parse an SRT, WebVTT or ASS subtitle file"""
+        return load_cues(srt_path)
 
-    def srt_time_to_seconds(self, time_str: str) -> float:
-        """Convert SRT timestamp to seconds"""
-        time_str = time_str.replace(",", ".")
-        parts = time_str.split(":")
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        seconds = float(parts[2])
-        return hours * 3600 + minutes * 60 + seconds
+    async def probe(self, path: str) -> MediaInfo:
+        """ffprobe metadata of a file, probed once until the file changes"""
+        info = await self.media.info(path)
+        self.metrics.cache("probe", self.media.hits, self.media.misses)
+        return info
 
-    def seconds_to_srt_time(self, seconds: float) -> str:
-        """Convert seconds to SRT timestamp format"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{secs:06.3f}".replace(".", ",")
+    async def video_duration_ms(self, video_path: str) -> float:
+        return (await self.probe(video_path)).duration_ms
 
     def extract_lang_code(self, file_name: str) -> str:
         """
         Extract language code from filename like:
-        'video_en.srt' → 'en', 'video_km.srt' → 'km'
+        'video_en.srt' → 'en', 'video_km.vtt' → 'km'
         """
-        match = re.search(r'[_\.]([a-z]{2,}(?:-[A-Z]{2})?)\.srt$', file_name)
+        match = re.search(r'[_\.]([a-z]{2,}(?:-[A-Z]{2})?)\.(?:srt|vtt|ass|ssa)$', file_name)
         return match.group(1) if match else None
 
-    async def merge_with_timing(self, audio_files: List[Dict], output_path: str, input_path: str = None):
-        final_audio = AudioSegment.silent(duration=0)
+    async def merge_with_timing(
+            self, audio_files: List[Dict], output_path: str, input_path: str = None, total_ms: float = None
+    ):
+        """Render timed audio clips into one track covering the whole video"""
+        if total_ms is None:
+            total_ms = await self.video_duration_ms(input_path) if input_path else 0
+
+        total_video_duration_ms = total_ms
+
+        frames = timeline_frames(audio_files, total_video_duration_ms, SAMPLE_RATE)
+        stream = self.merge_mode == "stream" or (
+            self.merge_mode == "auto" and frames * 2 > MAX_BUFFER_BYTES
+        )
+
+        live_log(f"Merge {len(audio_files)} audio segments ({'stream' if stream else 'memory'})")
+        if stream:
+            await stream_timeline(
+                audio_files,
+                output_path,
+                total_video_duration_ms,
+                SAMPLE_RATE,
+                runner=self.ffmpeg,
+                on_progress=self.progress_logger("Encode audio"),
+            )
+            file_log(f"Merged audio segment {frames * 1000 // SAMPLE_RATE}")
+            return output_path
 
-        bitrate = "44100"
-        duration = 0
+        # Clip decodes and the encode go through the shared ffmpeg runner
+        track = await render_timeline(audio_files, total_video_duration_ms, SAMPLE_RATE, runner=self.ffmpeg)
+        file_log(f"Merged audio segment {frames * 1000 // SAMPLE_RATE}")
 
-        if input_path:
-            info = mediainfo(input_path)
-            bitrate = info.get("bit_rate", bitrate)
-            duration = info.get("duration", duration)
+        await encode_pcm(track, output_path, SAMPLE_RATE, runner=self.ffmpeg)
+        return output_path
 
-        total_video_duration_ms = float(duration) * 1000
+    async def translate_sub_title(self, input_path: str, output_path: str, chunk_size: int = 200) -> int:
+        """
+        Translate a subtitle file (SRT, WebVTT or ASS; the output format
+        follows output_path) while it is being read: each chunk of cues is
+        sent to the translator as soon as it is parsed, and finished chunks
+        are written out in order. Returns the number of cues written.
+        """
+        source_lang = self.extract_lang_code(input_path)
+        target_lang = self.extract_lang_code(output_path)
+        pending = deque()
 
-        for segment in audio_files:
-            start_ms = int(segment["start"] * 1000)
-            duration_ms = int(segment["duration"] * 1000)
+        def translate(chunk: List[Tuple[int, int, str]]):
+            texts = [text for _, _, text in chunk]
+            return chunk, asyncio.ensure_future(self.translate_lines(texts, source_lang, target_lang))
 
-            # Load audio file
-            audio = AudioSegment.from_file(segment["path"])
+        def write(writer: SubtitleWriter, chunk, texts: List[str]):
+            writer.write_many((start, end, text) for (start, end, _), text in zip(chunk, texts))
 
-            # Trim or pad to exact duration
-            audio = audio[:duration_ms].set_frame_rate(int(bitrate))
-            if len(audio) < duration_ms:
-                silence_padding = AudioSegment.silent(duration=duration_ms - len(audio))
-                audio += silence_padding
+        try:
+            with SubtitleWriter(output_path) as writer:
+                chunk = []
+                for cue in read_cues(input_path):
+                    chunk.append(cue)
+                    if len(chunk) == chunk_size:
+                        pending.append(translate(chunk))
+                        chunk = []
+                        # Let the request start and flush chunks that already came back
+                        await asyncio.sleep(0)
+                        while pending and pending[0][1].done():
+                            write(writer, pending[0][0], pending.popleft()[1].result())
+                if chunk:
+                    pending.append(translate(chunk))
+
+                while pending:
+                    chunk, task = pending[0]
+                    write(writer, chunk, await task)
+                    pending.popleft()
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+        return writer.count
+
+    async def translate_lines(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """Translate subtitle texts through the translation cache, batching misses"""
+        started = time.time()
+        cached = self.translation_cache.get_many(source_lang, target_lang, texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in cached))
+        file_log(f"Translation cache: {len(texts) - len(missing)} hits, {len(missing)} to translate")
+        self.metrics.cache("translation", self.translation_cache.hits, self.translation_cache.misses)
+
+        if missing:
+            options = {"base_url": self.translate_url} if self.translate_url else {}
+            translator = create_translator(self.translator, source_lang, target_lang, **options)
+            results = await translate_texts(
+                translator,
+                missing,
+                semaphore=self.translate_semaphore,
+                client=self.translate_client,
+                on_done=lambda done, total: live_log(f"Translated {done} / {total} lines ({done * 100 // total}%)"),
+            )
+            self.translation_cache.put_many(source_lang, target_lang, list(zip(missing, results)))
+            cached.update(zip(missing, results))
 
-            # Pad with silence if needed to reach correct start time
-            gap = start_ms - len(final_audio)
-            if gap > 0:
-                final_audio += AudioSegment.silent(duration=gap)
+        self.metrics.throughput("translate", len(texts), time.time() - started, target=target_lang)
+        return [cached[text] for text in texts]
 
-            final_audio += audio
-            live_log(f"Merge audio segment {len(final_audio)}")
+    async def subtitle_to_voice(self, subtitle_path: str, output_path: str) -> str:
+        audio_files = await self.synthesize_subtitles(subtitle_path)
 
-        if len(final_audio) < total_video_duration_ms:
-            final_audio += AudioSegment.silent(duration=total_video_duration_ms - len(final_audio))
+        file_log(f"Merge audio clips to {output_path}")
+        await self.merge_with_timing(audio_files, output_path)
+        print(output_path)
+        return output_path
 
-        file_log(f"Merged audio segment {len(final_audio)}")
+    async def synthesize_subtitles(self, subtitle_path: str, segments_path: str = None) -> List[Dict]:
+        """
+        Generate (or reuse cached) speech for every subtitle and fit it to
+        its cue. The timed audio files are optionally saved as JSON for a
+        separate merge stage.
+        """
+        target_lang = self.extract_lang_code(subtitle_path)
+        voice = self.voice_for(target_lang)
 
-        return final_audio.export(output_path, format="mp3")
+        cues = self.speech_units(self.parse_srt(subtitle_path))
+        audio_files, jobs = self.plan_speech(cues, voice)
 
-    async def translate_sub_title(self, input_path: str, output_path: str):
-        source_lang = self.extract_lang_code(input_path)
-        target_lang = self.extract_lang_code(output_path)
+        live_log(f"Generate [{target_lang}] audio for {len(jobs)}/{len(cues)} subtitles")
+        await self.synthesize_speech(
+            jobs,
+            lambda done, total: live_log(f"Generated [{target_lang}] audio {done}/{total}"),
+        )
+        file_log(f"Generated audio for subtitle {len(cues)}")
 
-        with open(input_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        if self.speech_fit:
+            with self.metrics.timer("speech_fit", voice=voice):
+                await self.fit_speech(audio_files, voice)
 
-        # Count how many lines need translation (non-empty, non-time/index)
-        translatable_lines = [
-            line for line in lines
-            if line.strip() and not line.strip().isdigit() and '-->' not in line
-        ]
-        total = len(translatable_lines)
-        progress = 0
+        if segments_path:
+            with open(segments_path, "w", encoding="utf-8") as f:
+                json.dump(audio_files, f, indent=2, ensure_ascii=False)
+        return audio_files
 
-        translated_lines = []
-        translator = GoogleTranslator(source=source_lang, target=target_lang)
+    async def merge_segments(
+            self, segments_path: str, output_path: str, input_path: str = None, incremental: bool = True
+    ) -> str:
+        """
+        Merge audio files saved by synthesize_subtitles. When the existing
+        WAV was rendered from an earlier version of these segments, only
+        the time ranges of changed cues are re-rendered, in place.
+        """
+        with open(segments_path, "r", encoding="utf-8") as f:
+            audio_files = json.load(f)
 
-        for line in lines:
-            stripped = line.strip()
-            if stripped == '' or stripped.isdigit() or '-->' in line:
-                translated_lines.append(line)
-            else:
-                translated_text = translator.translate(stripped)
-                translated_lines.append(translated_text + '\n')
-                progress += 1
+        missing = self.missing_clips(segments_path, audio_files)
+        if missing:
+            raise FileNotFoundError(
+                f"{len(missing)} audio clips were evicted from the cache (e.g. {missing[0]}), run again to re-synthesize them"
+            )
 
-                live_log(f"Translated {progress} / {total} lines ({progress * 100 // total}%)")
+        # Segments the current output was rendered from, and its fingerprint then
+        rendered_path = f"{output_path}.rendered.json"
+        total_ms = await self.video_duration_ms(input_path) if input_path else 0
+        patched = None
+
+        if incremental and os.path.exists(rendered_path) and os.path.exists(output_path):
+            with open(rendered_path, "r", encoding="utf-8") as f:
+                rendered = json.load(f)
+            if rendered["fingerprint"] == file_fingerprint(output_path):
+                patched = await patch_timeline(
+                    output_path, rendered["segments"], audio_files, total_ms, SAMPLE_RATE, runner=self.ffmpeg
+                )
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.writelines(translated_lines)
-        return translated_lines
+        if patched is None:
+            await self.merge_with_timing(audio_files, output_path, total_ms=total_ms)
+        else:
+            print(f"  🩹 Patched {patched / SAMPLE_RATE:.1f}s of audio in place")
 
-    async def subtitle_to_voice(self, subtitle_path: str, output_path: str) -> str:
-        target_lang = self.extract_lang_code(subtitle_path)
-        voice = self.supported_voices.get(target_lang, "km-KH-PisethNeural")
+        with open(rendered_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": file_fingerprint(output_path), "segments": audio_files}, f, ensure_ascii=False)
+        return output_path
 
+    def missing_clips(self, segments_path: str, audio_files: List[Dict] = None) -> List[str]:
+        """Clips a segments file refers to that are no longer on disk"""
+        if audio_files is None:
+            with open(segments_path, "r", encoding="utf-8") as f:
+                audio_files = json.load(f)
+        return list(dict.fromkeys(af["path"] for af in audio_files if not os.path.exists(af["path"])))
+
+    def voice_for(self, lang: str) -> str:
+        return self.supported_voices.get(lang, "km-KH-PisethNeural")
+
+    def speech_units(self, cues: Cues) -> Cues:
+        """Cues to synthesize: sentence-level groups of cues unless cue_grouping is off"""
+        if not self.cue_grouping:
+            return cues
+        units = group_cues(cues)
+        file_log(f"Grouped {len(cues)} subtitles into {len(units)} speech units")
+        self.metrics.emit("cue_grouping", cues=len(cues), units=len(units))
+        return units
+
+    def plan_speech(self, cues: Cues, voice: str, backend: TTSBackend = None):
+        """
+        Map each subtitle to its cached audio clip. Returns the timed audio
+        files plus the (text, voice, path) jobs for clips not cached yet;
+        identical lines share one clip and one job.
+        """
+        backend = backend or self.tts_backend
         audio_files = []
-        subtitles = self.parse_srt(subtitle_path)
-        audio_temp = self.temp_path(output_path)
-
-        for i, subtitle in enumerate(subtitles):
-            live_log(f"Translate subtitle to [{target_lang}]")
-            audio_path = os.path.join(audio_temp, f"{i:04d}.wav")
+        jobs = {}
 
-            if not os.path.exists(audio_path):
-                live_log(f"Generate [{target_lang}] audio {i:04d}.wav")
-                await self.generate_speech(subtitle["text"], voice, audio_path)
+        for text, start, end in zip(cues.texts, cues.start_seconds.tolist(), cues.end_seconds.tolist()):
+            audio_path = self.audio_cache.path_for(text, voice, backend.signature, backend.extension)
+            if audio_path not in jobs and not self.audio_cache.lookup(audio_path):
+                jobs[audio_path] = (text, voice, audio_path)
 
             audio_files.append(
                 {
+                    "text": text,
                     "path": audio_path,
-                    "start": subtitle["start"],
-                    "end": subtitle["end"],
-                    "duration": subtitle["end"] - subtitle["start"],
+                    "start": start,
+                    "end": end,
+                    "duration": end - start,
                 }
             )
-            live_log(f"Generated audio for subtitle {i + 1}/{len(subtitles)}")
-        file_log(f"Generated audio for subtitle {len(subtitles)}")
 
-        if not os.path.exists(output_path):
-            file_log(f"Merge audio not found")
-            file_log(f"Merge audio clips to {output_path}")
-            await self.merge_with_timing(audio_files, output_path)
-        print(output_path)
-        return output_path
+        return audio_files, list(jobs.values())
 
-    async def generate_speech(self, text: str, voice: str, output_path: str):
-        """Generate speech using edge-tts"""
+    async def synthesize_speech(
+            self, jobs: List[tuple], on_done=None, backends: Dict[str, TTSBackend] = None
+    ) -> List[str]:
+        """
+        Generate speech for (text, voice, output_path) jobs concurrently.
+        `backends` optionally maps an output path to a non-default backend.
+        Clips another call is already synthesizing are awaited instead, and
+        only requested here if that call fails.
+        """
+        backends = backends or {}
+        started = time.time()
+        loop = asyncio.get_running_loop()
+        done = 0
+
+        def finished(*_):
+            nonlocal done
+            done += 1
+            if on_done:
+                on_done(done, len(jobs))
+
+        shared = {job[2]: (job, self.speech_in_flight[job[2]]) for job in jobs if job[2] in self.speech_in_flight}
+        owned = [job for job in jobs if job[2] not in shared]
+        futures = {job[2]: loop.create_future() for job in owned}
+        self.speech_in_flight.update(futures)
+
+        async def speak(text: str, voice: str, output_path: str):
+            await self.tts_client.call(self.generate_speech, text, voice, output_path, backends.get(output_path))
+            self.audio_cache.add(output_path)
+            futures[output_path].set_result(output_path)
+
+        async def synthesize_owned():
+            try:
+                await synthesize_all(
+                    owned,
+                    speak,
+                    retries=self.tts_retries,
+                    on_done=finished,
+                    semaphore=self.tts_semaphore,
+                )
+            finally:
+                for path, future in futures.items():
+                    if self.speech_in_flight.get(path) is future:
+                        del self.speech_in_flight[path]
+                    # Waiters synthesize failed clips themselves
+                    if not future.done():
+                        future.cancel()
+
+        async def wait_shared():
+            if not shared:
+                return
+            await asyncio.wait([future for _, future in shared.values()])
+            failed = [job for job, future in shared.values() if future.cancelled()]
+            for _ in range(len(shared) - len(failed)):
+                finished()
+            if failed:
+                await self.synthesize_speech(failed, lambda *_: finished(), backends)
+
+        # Let both halves finish before reporting a failure, so neither keeps
+        # synthesizing in the background
+        errors = [e for e in await asyncio.gather(synthesize_owned(), wait_shared(), return_exceptions=True) if e]
+        self.audio_cache.evict()
+        if owned:
+            self.metrics.throughput("tts", len(owned), time.time() - started, backend=self.tts_backend.name)
+        self.metrics.cache("audio", self.audio_cache.hits, self.audio_cache.misses)
+        if errors:
+            raise errors[0]
+        return [job[2] for job in jobs]
+
+    async def generate_speech(self, text: str, voice: str, output_path: str, backend: TTSBackend = None):
+        """Generate speech using the configured TTS backend"""
         # clean text ។
         text = text.strip().replace("។", "  ")
         text = unicodedata.normalize("NFC", text)
-        communicate = edge_tts.Communicate(text, voice)
-        await communicate.save(output_path)
+        await (backend or self.tts_backend).synthesize(text, voice, output_path)
+
+    async def measure_speech(self, audio_files: List[Dict]) -> np.ndarray:
+        """Synthesized length in seconds of every audio file"""
+        paths = list(dict.fromkeys(af["path"] for af in audio_files))
+        # Header reads are cheap: one thread for all clips, ffprobe only for
+        # formats clip_duration can't read
+        lengths = await asyncio.to_thread(lambda: [clip_duration(path) for path in paths])
+        by_path = dict(zip(paths, lengths))
+        unknown = [path for path in paths if by_path[path] is None]
+        for path, info in zip(unknown, await asyncio.gather(*(self.probe(path) for path in unknown))):
+            by_path[path] = info.duration
+        return np.array([by_path[af["path"]] for af in audio_files])
+
+    async def fit_speech(self, audio_files: List[Dict], voice: str):
+        """
+        Make overrunning speech fit its cue: borrow gap time, re-request
+        TTS at a faster rate for clips that would need a large speed-up,
+        and mark the rest with a tempo applied when merging.
+        """
+        starts = np.array([af["start"] for af in audio_files])
+        ends = np.array([af["end"] for af in audio_files])
+        lengths = await self.measure_speech(audio_files)
+        fit = fit_cues(starts, ends, lengths)
+
+        rerun = np.flatnonzero(fit["resynthesize"])
+        if len(rerun) and self.tts_backend.with_rate(0) is None:
+            rerun = rerun[:0]
+
+        backends = {}
+        jobs = {}
+        for i in rerun:
+            # Round up to 10% steps so faster clips are shared in the audio cache
+            percent = min(100, 10 * math.ceil((fit["tempo"][i] - 1) * 10))
+            backend = self.tts_backend.with_rate(percent)
+            af = audio_files[i]
+            af["path"] = self.audio_cache.path_for(af["text"], voice, backend.signature, backend.extension)
+            if af["path"] not in jobs and not self.audio_cache.lookup(af["path"]):
+                jobs[af["path"]] = (af["text"], voice, af["path"])
+                backends[af["path"]] = backend
+
+        if len(rerun):
+            live_log(f"Re-synthesize {len(rerun)} overrunning subtitles at a faster rate")
+            await self.synthesize_speech(list(jobs.values()), backends=backends)
+            lengths = await self.measure_speech(audio_files)
+            fit = fit_cues(starts, ends, lengths)
+
+        for af, duration, tempo in zip(audio_files, fit["duration"], fit["tempo"]):
+            af["duration"] = float(duration)
+            af["tempo"] = float(tempo)
+
+        stretched = int(np.count_nonzero(fit["tempo"] > 1.0))
+        file_log(f"Speech fit: {len(rerun)} re-synthesized, {stretched} time-stretched")
 
     async def create_translated_audio(
-            self, subtitles: List[Dict], target_lang: str
+            self, cues: Cues, target_lang: str, output_path: str = None, total_ms: float = 0
     ) -> str:
         """Create translated audio for all subtitles"""
         voice = self.supported_voices.get(target_lang, "en-US-AriaNeural")
-        audio_files = []
+        audio_files, jobs = self.plan_speech(self.speech_units(cues), voice)
+        output_path = output_path or os.path.join(self.temp_dir, f"translated_{target_lang}.wav")
 
-        for i, subtitle in enumerate(subtitles):
-            # Generate speech
-            audio_path = os.path.join(self.temp_dir, f"audio_{i:04d}.wav")
-            await self.generate_speech(subtitle["text"], voice, audio_path)
-
-            audio_files.append(
-                {
-                    "path": audio_path,
-                    "start": subtitle["start"],
-                    "end": subtitle["end"],
-                    "duration": subtitle["end"] - subtitle["start"],
-                }
-            )
-
-            logger.info(f"Generated audio for subtitle {i + 1}/{len(subtitles)}")
+        await self.synthesize_speech(
+            jobs,
+            lambda done, total: logger.info(f"Generated [{target_lang}] audio for subtitle {done}/{total}"),
+        )
+        if self.speech_fit:
+            with self.metrics.timer("speech_fit", voice=voice):
+                await self.fit_speech(audio_files, voice)
 
-        return await self.merge_audio_segments(audio_files)
+        return await self.merge_with_timing(audio_files, output_path, total_ms=total_ms)
 
     async def merge_audio_segments(self, audio_files: List[Dict]) -> str:
         """Merge audio segments with proper timing"""
@@ -330,64 +671,19 @@ class VideoTool:
 
         # Get total duration
         total_duration = max(af["end"] for af in audio_files)
+        # A fresh directory per call, as concurrent jobs share temp_dir
+        merged_audio = os.path.join(tempfile.mkdtemp(prefix="merge_", dir=self.temp_dir), "merged_audio.wav")
 
-        # Create filter complex for ffmpeg
-        inputs = []
-        filters = []
-
-        for i, af in enumerate(audio_files):
-            inputs.extend(["-i", af["path"]])
-            # Add delay and trim audio to fit timing
-            delay = af["start"]
-            duration = af["duration"]
-            filters.append(f"[{i}]adelay={int(delay * 1000)}|{int(delay * 1000)}[a{i}]")
-
-        # Mix all audio streams
-        mix_filter = "+".join([f"[a{i}]" for i in range(len(audio_files))])
-        filters.append(
-            f"{mix_filter}amix=inputs={len(audio_files)}:duration=longest[out]"
-        )
-
-        merged_audio = os.path.join(self.temp_dir, "merged_audio.wav")
-
-        cmd = (
-                ["ffmpeg"]
-                + inputs
-                + [
-                    "-filter_complex",
-                    ";".join(filters),
-                    "-map",
-                    "[out]",
-                    "-t",
-                    str(total_duration),
-                    merged_audio,
-                    "-y",
-                ]
-        )
-
-        subprocess.run(cmd, check=True, capture_output=True)
+        # Mix in groups so no ffmpeg call sees more than MIX_FAN_IN inputs
+        await mix_hierarchical(audio_files, merged_audio, self.temp_dir, duration=total_duration, runner=self.ffmpeg)
         return merged_audio
 
-    def create_translated_subtitles(
-            self, subtitles: List[Dict], target_lang: str
-    ) -> str:
-        """Create translated subtitle file"""
-        translated_srt = os.path.join(self.temp_dir, f"translated_{target_lang}.srt")
-
-        with open(translated_srt, "w", encoding="utf-8") as f:
-            for subtitle in subtitles:
-                # In real implementation, translate the text here
-                translated_text = f"[{target_lang.upper()}] {subtitle['text']}"
-
-                f.write(f"{subtitle['index']}\n")
-                f.write(
-                    f"{self.seconds_to_srt_time(subtitle['start'])} --> {self.seconds_to_srt_time(subtitle['end'])}\n"
-                )
-                f.write(f"{translated_text}\n\n")
-
-        return translated_srt
+    def create_translated_subtitles(self, cues: Cues, target_lang: str, output_path: str = None) -> str:
+        """Write subtitles (already carrying translated text) as SRT, WebVTT or ASS by extension"""
+        translated_srt = output_path or os.path.join(self.temp_dir, f"translated_{target_lang}.srt")
+        return write_cues(cues, translated_srt)
 
-    def combine_video_audio(self, video_path: str, audio_path: str, output_path: str):
+    async def combine_video_audio(self, video_path: str, audio_path: str, output_path: str):
         """Combine original video with translated audio"""
         cmd = [
             "ffmpeg",
@@ -401,96 +697,229 @@ class VideoTool:
             "-y",
         ]
 
-        subprocess.run(cmd, check=True, capture_output=True)
+        await self.ffmpeg.run(cmd, on_progress=self.progress_logger("Mux audio"))
 
-    def add_subtitles_to_video(
-            self, video_path: str, subtitle_path: str, output_path: str
+    async def render_output(
+            self,
+            video_path: str,
+            audio_path: str,
+            output_path: str,
+            subtitle_path: str = None,
+            duck_original: bool = None,
+            background_path: str = None,
+    ) -> str:
+        """
+        Write the final video in a single ffmpeg pass: the dubbed track
+        (optionally over the ducked original audio, or over a background
+        track from extract_audio) plus subtitles, attached or burned in
+        per subtitle_mode. Replaces combine_video_audio followed by
+        add_subtitles_to_video, which each read and wrote the whole video.
+        """
+        subtitle = None
+        if subtitle_path:
+            lang = self.extract_lang_code(subtitle_path)
+            subtitle = (LANGUAGE_TAGS.get(lang, lang), subtitle_path)
+        if self.subtitle_mode == "parallel":
+            logger.info("Segment-parallel burn needs its own pass; burning in the single output pass instead")
+
+        cmd = output_command(
+            video_path,
+            audio_path,
+            output_path,
+            subtitle,
+            "soft" if self.subtitle_mode == "soft" else "burn",
+            self.duck_original if duck_original is None else duck_original,
+            background_path,
+            encoder_options(self.burn_preset, self.burn_crf, self.burn_threads),
+        )
+        await self.ffmpeg.run(cmd, on_progress=self.progress_logger("Render output"))
+        return output_path
+
+    async def mux_tracks(
+            self,
+            video_path: str,
+            output_path: str,
+            audio_tracks: List[Tuple[str, str]],
+            subtitle_tracks: List[Tuple[str, str]] = (),
+            keep_original_audio: bool = True,
+    ):
+        """
+        Mux (lang, path) dubbed audio and subtitle tracks into one file in a
+        single ffmpeg pass. The video stream is copied; the first dub is the
+        default audio track and the original audio follows the dubs.
+        """
+        cmd = ["ffmpeg", "-loglevel", "error", "-i", video_path]
+        for _, path in list(audio_tracks) + list(subtitle_tracks):
+            cmd.extend(["-i", path])
+
+        cmd.extend(["-map", "0:v:0"])
+        for i in range(len(audio_tracks)):
+            cmd.extend(["-map", f"{i + 1}:a:0"])
+        if keep_original_audio:
+            cmd.extend(["-map", "0:a:0?"])
+        for i in range(len(subtitle_tracks)):
+            cmd.extend(["-map", f"{len(audio_tracks) + i + 1}:s:0"])
+
+        cmd.extend(["-c:v", "copy", "-c:a", "aac", "-c:s", "mov_text"])
+        for i, (lang, _) in enumerate(audio_tracks):
+            cmd.extend([f"-metadata:s:a:{i}", f"language={LANGUAGE_TAGS.get(lang, lang)}"])
+            cmd.extend([f"-disposition:a:{i}", "default" if i == 0 else "0"])
+        if keep_original_audio:
+            # The copied original keeps its default flag otherwise, leaving two defaults
+            cmd.extend([f"-disposition:a:{len(audio_tracks)}", "0"])
+        for i, (lang, _) in enumerate(subtitle_tracks):
+            cmd.extend([f"-metadata:s:s:{i}", f"language={LANGUAGE_TAGS.get(lang, lang)}"])
+
+        cmd.extend([output_path, "-y"])
+        await self.ffmpeg.run(cmd, on_progress=self.progress_logger("Mux tracks"))
+
+    async def add_subtitles_to_video(
+            self, video_path: str, subtitle_path: str, output_path: str, mode: str = None
     ):
-        """Add subtitles to video file"""
-        # Soft subtitle on video / removable
-        # cmd = [
-        #     "ffmpeg",
-        #     "-loglevel",  "debug",
-        #     "-i", video_path,
-        #     "-i", subtitle_path,
-        #     "-c:v", "copy",
-        #     "-c:a", "copy",
-        #     "-c:s", "mov_text",
-        #     output_path,
-        #     "-y",
-        # ]
+        """Add subtitles to video file, as a soft track or burned in (see subtitle_mode)"""
+        mode = mode or self.subtitle_mode
+        on_progress = self.progress_logger(f"Subtitles ({mode})")
+
+        if mode == "soft":
+            # Soft subtitle on video / removable
+            lang = self.extract_lang_code(subtitle_path)
+            cmd = [
+                "ffmpeg",
+                "-loglevel", "error",
+                "-i", video_path,
+                "-i", subtitle_path,
+                "-map", "0:v",
+                "-map", "0:a?",
+                "-map", "1:s:0",
+                "-c", "copy",
+                "-c:s", soft_subtitle_codec(output_path),
+            ]
+            if lang:
+                cmd.extend(["-metadata:s:s:0", f"language={LANGUAGE_TAGS.get(lang, lang)}"])
+            cmd.extend([output_path, "-y"])
+            await self.ffmpeg.run(cmd, on_progress=on_progress)
+            return output_path
+
+        if mode == "parallel":
+            burn_dir = tempfile.mkdtemp(prefix="burn_", dir=self.temp_dir)
+            try:
+                return await burn_parallel(
+                    self.ffmpeg,
+                    video_path,
+                    subtitle_path,
+                    output_path,
+                    burn_dir,
+                    (await self.probe(video_path)).duration,
+                    await self.media.keyframes(video_path),
+                    preset=self.burn_preset,
+                    crf=self.burn_crf,
+                    on_progress=on_progress,
+                )
+            finally:
+                shutil.rmtree(burn_dir, ignore_errors=True)
 
         # Burn subtitle to video
         cmd = [
             "ffmpeg",
-            "-loglevel", "debug",
+            "-loglevel", "error",
             "-i", video_path,
-            "-vf", f"subtitles={subtitle_path}",
+            "-vf", subtitle_filter(subtitle_path),
+            *encoder_options(self.burn_preset, self.burn_crf, self.burn_threads),
             "-c:a", "copy",
             output_path,
             "-y",
         ]
-
-        subprocess.run(cmd, check=True, capture_output=True)
+        await self.ffmpeg.run(cmd, on_progress=on_progress)
+        return output_path
 
     async def translate_video(
             self,
             video_path: str,
-            target_lang: str,
+            target_langs: Union[str, List[str]],
             output_path: str,
             include_audio: bool = True,
             include_subtitles: bool = True,
+            subtitle_path: str = None,
+            source_lang: str = None,
+            on_progress: Optional[Callable[[float, str], None]] = None,
     ) -> Dict:
-        """Main method to translate video"""
-        try:
-            logger.info(f"Starting video translation to {target_lang}")
-
-            # Extract existing subtitles
-            subtitle_path = self.extract_subtitles(video_path)
-            if not subtitle_path:
-                raise ValueError("No subtitles found in video file")
+        """
+        Main method to translate video into one or more languages. Subtitle
+        extraction, parsing and probing happen once; translation, speech and
+        merging fan out per language concurrently, and every track is muxed
+        into `output_path` in a single ffmpeg pass. `on_progress` receives
+        (fraction done, message) as steps complete.
+        """
+        if isinstance(target_langs, str):
+            target_langs = [target_langs]
 
-            # Parse subtitles
-            subtitles = self.parse_srt(subtitle_path)
-            logger.info(f"Found {len(subtitles)} subtitle segments")
+        steps_done = 0
+        steps = len(target_langs) * (2 if include_audio else 1)
 
-            result = {
-                "success": True,
-                "original_subtitles": len(subtitles),
-                "target_language": target_lang,
-                "files_created": [],
-            }
+        def report(message: str):
+            nonlocal steps_done
+            steps_done += 1
+            if on_progress:
+                on_progress(0.1 + 0.8 * steps_done / steps, message)
 
-            if include_audio:
-                # Generate translated audio
-                logger.info("Generating translated audio...")
-                translated_audio = await self.create_translated_audio(
-                    subtitles, target_lang
-                )
+        try:
+            logger.info(f"Starting video translation to {', '.join(target_langs)}")
 
-                # Combine with video
-                audio_output = output_path.replace(".mp4", f"_audio_{target_lang}.mp4")
-                self.combine_video_audio(video_path, translated_audio, audio_output)
-                result["files_created"].append(audio_output)
-                logger.info(f"Created video with translated audio: {audio_output}")
+            # Extract existing subtitles unless given a subtitle file
+            if subtitle_path:
+                cues = self.parse_srt(subtitle_path)
+                source_lang = source_lang or self.extract_lang_code(subtitle_path)
+            else:
+                cues, stream_lang = await self.extract_subtitles(video_path, source_lang)
+                if cues is None:
+                    raise ValueError("No subtitles found in video file")
+                source_lang = source_lang or stream_lang
+
+            # Probe the video once for every language
+            total_ms = await self.video_duration_ms(video_path)
+            logger.info(f"Found {len(cues)} subtitle segments")
+            if on_progress:
+                on_progress(0.1, f"Found {len(cues)} subtitles")
+
+            output_stem = Path(output_path).with_suffix("")
+            # Private scratch space, so the same video can be dubbed by many jobs at once
+            work_root = Path(tempfile.mkdtemp(prefix=f"{Path(video_path).stem}_", dir=self.temp_dir))
+
+            async def translate_to(target_lang: str) -> Tuple[str, str, str]:
+                texts = await self.translate_lines(cues.texts, source_lang, target_lang)
+                translated = cues.with_texts(texts)
+                report(f"Translated [{target_lang}]")
 
-            if include_subtitles:
-                # Create translated subtitles
                 translated_srt = self.create_translated_subtitles(
-                    subtitles, target_lang
-                )
-
-                # Add subtitles to video
-                subtitle_output = output_path.replace(
-                    ".mp4", f"_subtitles_{target_lang}.mp4"
-                )
-                self.add_subtitles_to_video(video_path, translated_srt, subtitle_output)
-                result["files_created"].append(subtitle_output)
-                logger.info(
-                    f"Created video with translated subtitles: {subtitle_output}"
+                    translated, target_lang, f"{output_stem}_{target_lang}.srt"
                 )
-
-            return result
+                translated_audio = None
+                if include_audio:
+                    translated_audio = await self.create_translated_audio(
+                        translated, target_lang, str(work_root / f"{target_lang}.wav"), total_ms
+                    )
+                    report(f"Generated [{target_lang}] speech")
+                logger.info(f"Prepared [{target_lang}] tracks")
+                return target_lang, translated_audio, translated_srt
+
+            try:
+                tracks = await asyncio.gather(*(translate_to(lang) for lang in target_langs))
+
+                audio_tracks = [(lang, audio) for lang, audio, _ in tracks if audio]
+                subtitle_tracks = [(lang, srt) for lang, _, srt in tracks] if include_subtitles else []
+                if on_progress:
+                    on_progress(0.9, "Muxing tracks")
+                await self.mux_tracks(video_path, output_path, audio_tracks, subtitle_tracks)
+            finally:
+                shutil.rmtree(work_root, ignore_errors=True)
+            logger.info(f"Created video with {len(audio_tracks)} dubbed tracks: {output_path}")
+
+            return {
+                "success": True,
+                "original_subtitles": len(cues),
+                "target_languages": target_langs,
+                "files_created": [output_path] + [srt for _, _, srt in tracks],
+            }
 
         except Exception as e:
             logger.error(f"Translation failed: {str(e)}")
@@ -502,6 +931,8 @@ class VideoTool:
 
     def cleanup(self):
         """Clean up temporary files"""
+        self.translation_cache.close()
+        self.metrics.close()
         # import shutil
         # if os.path.exists(self.temp_dir):
         #     shutil.rmtree(self.temp_dir)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bs4 import BeautifulSoup
+from deep_translator.exceptions import TranslationNotFound
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from network import ProviderClient, ProviderError, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# GoogleTranslator rejects payloads over 5000 characters
+MAX_BATCH_CHARS = 4500
+DELIMITER = "\n"
+
+GOOGLE_URL = "https://translate.google.com/m"
+HTTP_POOL_SIZE = 32
+
+_session = None
+_session_lock = threading.Lock()
+# Blocking HTTP calls get their own threads: the default executor has only
+# cpu_count + 4, which would cap translate concurrency on small machines
+_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="translate")
+
+
+def http_session() -> requests.Session:
+    """Process-wide HTTP session, so requests reuse pooled keep-alive connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+class GoogleTranslator:
+    """
+    Google Translate's mobile page (the endpoint deep_translator scrapes),
+    requested over the shared keep-alive session instead of a new
+    connection per call. Throttling and server errors raise ProviderError
+    carrying the status and Retry-After for ProviderClient.
+    """
+
+    def __init__(self, source: str = "auto", target: str = "en", base_url: str = GOOGLE_URL, timeout: float = 30.0):
+        self.source = source
+        self.target = target
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = http_session()
+
+    def translate(self, text: str, **kwargs) -> str:
+        text = text.strip()
+        if not text or self.source == self.target:
+            return text
+
+        response = self.session.get(
+            self.base_url,
+            params={"sl": self.source, "tl": self.target, "q": text},
+            timeout=self.timeout,
+        )
+        with response:
+            if response.status_code != 200:
+                raise ProviderError("google", response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+            soup = BeautifulSoup(response.text, "html.parser")
+
+        element = soup.find("div", {"class": "t0"}) or soup.find("div", {"class": "result-container"})
+        if not element:
+            raise TranslationNotFound(text)
+        return element.get_text(strip=True)
+
+
+class FakeTranslator:
+    """Offline stand-in for GoogleTranslator: tags every line with the target language"""
+
+    def __init__(self, source: str = "auto", target: str = "en", latency: float = 0.0):
+        self.source = source
+        self.target = target
+        self.latency = latency
+        self.calls = 0
+
+    def translate(self, text: str, **kwargs) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return DELIMITER.join(f"[{self.target}] {line}" for line in text.split(DELIMITER))
+
+
+TRANSLATORS = {
+    "google": GoogleTranslator,
+    "fake": FakeTranslator,
+}
+
+
+def create_translator(name: str, source: Optional[str], target: Optional[str], **options):
+    """Create a translator by name: google or fake"""
+    if name not in TRANSLATORS:
+        raise ValueError(f"Unknown translator: {name} (choose from {', '.join(TRANSLATORS)})")
+    return TRANSLATORS[name](source=source or "auto", target=target, **options)
+
+
+def pack_batches(texts: List[str], max_chars: int = MAX_BATCH_CHARS) -> List[List[int]]:
+    """Group text indices into batches whose joined length stays under max_chars"""
+    batches = []
+    batch = []
+    size = 0
+
+    for i, text in enumerate(texts):
+        length = len(text) + len(DELIMITER)
+        if batch and size + length > max_chars:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(i)
+        size += length
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def translate_batch(translate: Callable[[str], Awaitable[str]], texts: List[str]) -> List[str]:
+    """
+    Translate texts in one request by joining them with newlines. If the
+    provider merges or splits lines, the batch is bisected until every
+    piece maps back to exactly one input.
+    """
+    if len(texts) == 1:
+        return [(await translate(texts[0]) or texts[0]).strip()]
+
+    result = await translate(DELIMITER.join(texts)) or ""
+    lines = [line.strip() for line in result.strip().split(DELIMITER)]
+    if len(lines) == len(texts):
+        return lines
+
+    logger.debug(f"Batch of {len(texts)} came back as {len(lines)} lines, splitting")
+    middle = len(texts) // 2
+    return await translate_batch(translate, texts[:middle]) + await translate_batch(translate, texts[middle:])
+
+
+async def translate_texts(
+        translator,
+        texts: List[str],
+        max_chars: int = MAX_BATCH_CHARS,
+        concurrency: int = 4,
+        on_done: Optional[Callable[[int, int], None]] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        client: Optional[ProviderClient] = None,
+) -> List[str]:
+    """
+    Translate many short texts with as few requests as possible. Identical
+    texts are sent once, batches run concurrently (at most `concurrency`
+    requests in flight, or under a shared `semaphore`) and results come
+    back in input order. With a `client`, every request also goes through
+    its rate limit, adaptive concurrency and circuit breaker.
+    """
+    # Lines are the batch delimiter, so a text must not contain one
+    cleaned = [" ".join(text.split()) for text in texts]
+    unique = list(dict.fromkeys(text for text in cleaned if text))
+    semaphore = semaphore or asyncio.Semaphore(max(1, concurrency))
+    translated: Dict[str, str] = {"": ""}
+    done = 0
+
+    loop = asyncio.get_running_loop()
+
+    async def translate(text: str) -> str:
+        if client:
+            return await client.call(loop.run_in_executor, _executor, translator.translate, text)
+        return await loop.run_in_executor(_executor, translator.translate, text)
+
+    async def run(batch: List[str]):
+        nonlocal done
+        async with semaphore:
+            results = await translate_batch(translate, batch)
+        translated.update(zip(batch, results))
+        done += len(batch)
+        if on_done:
+            on_done(done, len(unique))
+
+    batches = [[unique[i] for i in batch] for batch in pack_batches(unique, max_chars)]
+    logger.info(f"Translating {len(unique)} unique lines in {len(batches)} batches")
+    await asyncio.gather(*(run(batch) for batch in batches))
+
+    return [translated[text] for text in cleaned]
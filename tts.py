@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import wave
+import zlib
+import edge_tts
+import numpy as np
+
+from contextlib import contextmanager
+
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (text, voice, output_path)
+SpeechJob = Tuple[str, str, str]
+SpeechFn = Callable[[str, str, str], Awaitable[None]]
+
+
+class SynthesisError(RuntimeError):
+    """Raised when one or more cues still fail after all retries"""
+
+    def __init__(self, failures: List[Tuple[int, Exception]]):
+        self.failures = failures
+        first_index, first_error = failures[0]
+        super().__init__(
+            f"{len(failures)} cue(s) failed to synthesize "
+            f"(first: #{first_index}: {first_error})"
+        )
+
+
+async def synthesize_all(
+        jobs: List[SpeechJob],
+        synthesize: SpeechFn,
+        concurrency: int = 8,
+        retries: int = 3,
+        backoff: float = 0.5,
+        on_done: Optional[Callable[[int, int], None]] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+) -> List[str]:
+    """
+    Run `synthesize(text, voice, output_path)` for every job with at most
+    `concurrency` requests in flight (or under a `semaphore` shared with
+    other calls). Each job is retried with exponential backoff; results
+    are returned in job order.
+    """
+    semaphore = semaphore or asyncio.Semaphore(max(1, concurrency))
+    failures: List[Tuple[int, Exception]] = []
+    done = 0
+
+    async def run(index: int, job: SpeechJob) -> Optional[str]:
+        nonlocal done
+        text, voice, output_path = job
+
+        for attempt in range(retries + 1):
+            try:
+                async with semaphore:
+                    await synthesize(text, voice, output_path)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == retries:
+                    logger.error(f"Synthesis failed for cue #{index}: {e}")
+                    failures.append((index, e))
+                    return None
+                delay = backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Synthesis retry {attempt + 1}/{retries} for cue #{index} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+        done += 1
+        if on_done:
+            on_done(done, len(jobs))
+        return output_path
+
+    results = await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+
+    if failures:
+        raise SynthesisError(sorted(failures, key=lambda f: f[0]))
+
+    return list(results)
+
+
+@contextmanager
+def partial_file(output_path: str) -> Iterator[str]:
+    """
+    A uniquely named file next to `output_path` to write into; moved into
+    place on success and removed on failure, so an interrupted request is
+    never reused and concurrent writers never share a partial file.
+    """
+    fd, partial_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(output_path) or ".")
+    os.close(fd)
+    try:
+        yield partial_path
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def write_wav(output_path: str, samples: np.ndarray, sample_rate: int = 24000):
+    """Write mono 16-bit samples as a WAV file"""
+    with wave.open(output_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+class TTSBackend:
+    """Base class for text-to-speech providers used by VideoTool"""
+
+    name = "base"
+    extension = "mp3"
+
+    @property
+    def signature(self) -> str:
+        """Settings that change the produced audio, used in cache keys"""
+        return self.name
+
+    def with_rate(self, percent: int) -> Optional["TTSBackend"]:
+        """A copy speaking `percent`% faster, or None if rate can't be changed"""
+        return None
+
+    async def synthesize(self, text: str, voice: str, output_path: str):
+        raise NotImplementedError
+
+    async def __call__(self, text: str, voice: str, output_path: str):
+        await self.synthesize(text, voice, output_path)
+
+
+class EdgeTTSBackend(TTSBackend):
+    """Microsoft Edge online voices via edge-tts"""
+
+    name = "edge"
+
+    def __init__(self, rate: str = "+0%", pitch: str = "+0Hz"):
+        self.rate = rate
+        self.pitch = pitch
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.rate}:{self.pitch}"
+
+    def with_rate(self, percent: int) -> "EdgeTTSBackend":
+        base = int(self.rate.rstrip("%"))
+        return EdgeTTSBackend(rate=f"{base + percent:+d}%", pitch=self.pitch)
+
+    async def synthesize(self, text: str, voice: str, output_path: str):
+        communicate = edge_tts.Communicate(text, voice, rate=self.rate, pitch=self.pitch)
+        with partial_file(output_path) as partial_path:
+            await communicate.save(partial_path)
+
+
+class ToneTTSBackend(TTSBackend):
+    """
+    Deterministic offline backend: one tone burst per word, pitched by
+    voice, so output length is proportional to text length. Used to
+    benchmark merge/mux stages and run the pipeline without the network.
+    """
+
+    name = "tone"
+    extension = "wav"
+
+    def __init__(self, sample_rate: int = 24000, seconds_per_char: float = 0.06):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.sample_rate}:{self.seconds_per_char}"
+
+    def with_rate(self, percent: int) -> "ToneTTSBackend":
+        return ToneTTSBackend(self.sample_rate, self.seconds_per_char / (1 + percent / 100))
+
+    def render(self, text: str, voice: str) -> np.ndarray:
+        frequency = 120 + zlib.crc32(voice.encode("utf-8")) % 180
+        gap = np.zeros(int(0.04 * self.sample_rate), dtype=np.int16)
+        parts = []
+
+        for word in text.split() or [""]:
+            length = int((len(word) + 1) * self.seconds_per_char * self.sample_rate)
+            fade = max(1, min(length // 4, int(0.01 * self.sample_rate)))
+            n = np.arange(length)
+            envelope = np.minimum(1.0, np.minimum(n / fade, (length - n) / fade))
+            parts.append((8000 * envelope * np.sin(2 * np.pi * frequency * n / self.sample_rate)).astype(np.int16))
+            parts.append(gap)
+
+        return np.concatenate(parts)
+
+    def write(self, text: str, voice: str, output_path: str):
+        with partial_file(output_path) as partial_path:
+            write_wav(partial_path, self.render(text, voice), self.sample_rate)
+
+    async def synthesize(self, text: str, voice: str, output_path: str):
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        # Rendering is CPU work: keep it off the loop so clips run concurrently
+        await asyncio.to_thread(self.write, text, voice, output_path)
+
+
+class FakeTTSBackend(ToneTTSBackend):
+    """Tone backend with injected latency and failures for load tests"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def synthesize(self, text: str, voice: str, output_path: str):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency * (0.5 + self.random.random()))
+            if self.random.random() < self.failure_rate:
+                raise ConnectionError(f"Injected failure for voice {voice}")
+            await super().synthesize(text, voice, output_path)
+        finally:
+            self.in_flight -= 1
+
+
+TTS_BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend,
+    ToneTTSBackend.name: ToneTTSBackend,
+    FakeTTSBackend.name: FakeTTSBackend,
+}
+
+
+def create_tts_backend(name: str, **options) -> TTSBackend:
+    """Create a TTS backend by name: edge, tone or fake"""
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {name} (choose from {', '.join(TTS_BACKENDS)})")
+    return TTS_BACKENDS[name](**options)
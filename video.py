@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import logging
+import os
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ffmpeg_runner import FFmpegRunner, ProgressFn
+
+logger = logging.getLogger(__name__)
+
+SUBTITLE_MODES = ["soft", "burn", "parallel"]
+# Image-based subtitle codecs ffmpeg cannot convert to text
+BITMAP_SUBTITLE_CODECS = {"hdmv_pgs_subtitle", "dvd_subtitle", "dvb_subtitle", "xsub"}
+# Segments shorter than this are not worth a separate encoder
+MIN_SEGMENT_SECONDS = 10.0
+# Original audio under the dub: base level, and how hard speech pushes it down
+DUCK_LEVEL = 0.35
+DUCK_COMPRESSOR = "threshold=0.02:ratio=8:attack=20:release=400"
+# Common format for the ducking filters, which need matching inputs
+MIX_FORMAT = "aformat=sample_fmts=fltp:sample_rates=48000:channel_layouts=stereo"
+
+
+def subtitle_filter(subtitle_path: str) -> str:
+    """`subtitles=` filter for a path, escaped for the filtergraph parser"""
+    escaped = subtitle_path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+    return f"subtitles={escaped}"
+
+
+def soft_subtitle_codec(output_path: str) -> str:
+    """MP4/MOV only carry mov_text; Matroska keeps SRT/ASS as they are"""
+    return "copy" if output_path.lower().endswith((".mkv", ".mka")) else "mov_text"
+
+
+def encoder_options(preset: str = "medium", crf: int = 23, threads: int = 0) -> List[str]:
+    return ["-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-threads", str(threads)]
+
+
+def ducking_filter(dub: str, background: str, output: str = "aout") -> str:
+    """
+    Mix `background` under `dub` (filter pads like "1:a:0"), lowered to
+    DUCK_LEVEL and compressed further while the dub is speaking.
+    """
+    return ";".join([
+        f"[{dub}]{MIX_FORMAT},asplit=2[dub][key]",
+        f"[{background}]{MIX_FORMAT},volume={DUCK_LEVEL}[background]",
+        f"[background][key]sidechaincompress={DUCK_COMPRESSOR}[ducked]",
+        f"[dub][ducked]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[{output}]",
+    ])
+
+
+def output_command(
+        video_path: str,
+        audio_path: str,
+        output_path: str,
+        subtitle: Optional[Tuple[str, str]] = None,
+        subtitle_mode: str = "soft",
+        duck: bool = False,
+        background_path: Optional[str] = None,
+        encoder: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    One ffmpeg pass producing the final video: the video stream (copied,
+    or re-encoded with burned-in subtitles), the dub track optionally
+    mixed over the ducked original audio (or `background_path`), and the
+    (lang, path) subtitle attached as a stream in soft mode.
+    """
+    cmd = ["ffmpeg", "-loglevel", "error", "-i", video_path, "-i", audio_path]
+    background = "0:a:0"
+    if duck and background_path:
+        cmd.extend(["-i", background_path])
+        background = "2:a:0"
+
+    soft = subtitle is not None and subtitle_mode == "soft"
+    subtitle_input = cmd.count("-i")
+    if soft:
+        cmd.extend(["-i", subtitle[1]])
+
+    filters = []
+    video_map = "0:v:0"
+    audio_map = "1:a:0"
+    if subtitle is not None and not soft:
+        filters.append(f"[0:v:0]{subtitle_filter(subtitle[1])}[vout]")
+        video_map = "[vout]"
+    if duck:
+        filters.append(ducking_filter("1:a:0", background))
+        audio_map = "[aout]"
+
+    if filters:
+        cmd.extend(["-filter_complex", ";".join(filters)])
+    cmd.extend(["-map", video_map, "-map", audio_map])
+
+    if soft:
+        lang, _ = subtitle
+        cmd.extend(["-map", f"{subtitle_input}:s:0", "-c:s", soft_subtitle_codec(output_path)])
+        if lang:
+            cmd.extend(["-metadata:s:s:0", f"language={lang}"])
+
+    cmd.extend((encoder or encoder_options()) if video_map == "[vout]" else ["-c:v", "copy"])
+    cmd.extend(["-c:a", "aac", "-shortest", output_path, "-y"])
+    return cmd
+
+
+def pick_subtitle_stream(streams: List[Dict], languages: Iterable[str] = ()) -> Optional[Dict]:
+    """First text subtitle stream tagged with one of `languages`, else the first text stream"""
+    text_streams = [stream for stream in streams if stream["codec"] not in BITMAP_SUBTITLE_CODECS]
+    wanted = {lang.lower() for lang in languages if lang}
+    for stream in text_streams:
+        if (stream["language"] or "").lower() in wanted:
+            return stream
+    return text_streams[0] if text_streams else None
+
+
+def split_points(keyframes: List[float], duration: float, parts: int) -> List[float]:
+    """
+    Segment start times on keyframes: the keyframe at or before each of
+    `parts` evenly spaced times, dropping segments under MIN_SEGMENT_SECONDS.
+    Always starts with 0.
+    """
+    parts = max(1, min(parts, int(duration // MIN_SEGMENT_SECONDS)))
+    points = [0.0]
+
+    for i in range(1, parts):
+        k = bisect.bisect_right(keyframes, duration * i / parts) - 1
+        if k >= 0 and keyframes[k] - points[-1] >= MIN_SEGMENT_SECONDS:
+            points.append(keyframes[k])
+
+    while len(points) > 1 and duration - points[-1] < MIN_SEGMENT_SECONDS:
+        points.pop()
+    return points
+
+
+async def probe_keyframes(runner: FFmpegRunner, video_path: str) -> List[float]:
+    """Timestamps of the video keyframes (only keyframes are decoded)"""
+    output = await runner.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-skip_frame", "nokey",
+            "-show_entries", "frame=pts_time",
+            "-of", "csv=p=0",
+            video_path,
+        ],
+        capture_stdout=True,
+    )
+    times = []
+    for line in output.decode().split():
+        try:
+            times.append(float(line.strip(",")))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+async def burn_parallel(
+        runner: FFmpegRunner,
+        video_path: str,
+        subtitle_path: str,
+        output_path: str,
+        temp_dir: str,
+        duration: float,
+        keyframes: List[float],
+        parts: int = os.cpu_count() or 1,
+        preset: str = "medium",
+        crf: int = 23,
+        on_progress: Optional[ProgressFn] = None,
+) -> str:
+    """
+    Burn subtitles by splitting the video on keyframes, encoding the
+    segments concurrently (each with its share of threads) and joining
+    them with the concat demuxer; the audio is copied once at the end.
+    Each segment is shifted back to its source time before the subtitles
+    filter, so cues land on the same frames as a single-pass burn.
+    `keyframes` are the video's keyframe times (see probe_keyframes).
+    """
+    points = split_points(keyframes, duration, parts)
+    bounds = list(zip(points, points[1:] + [None]))
+    threads = max(1, (os.cpu_count() or 1) // len(bounds))
+    logger.info(f"Burning subtitles in {len(bounds)} segments at {points}")
+
+    os.makedirs(temp_dir, exist_ok=True)
+    segment_paths = []
+    commands = []
+    for i, (start, end) in enumerate(bounds):
+        segment_path = os.path.join(temp_dir, f"burn_{i:03d}.mp4")
+        segment_paths.append(segment_path)
+        cmd = ["ffmpeg", "-loglevel", "error", "-ss", f"{start:.6f}", "-i", video_path]
+        if end is not None:
+            cmd.extend(["-t", f"{end - start:.6f}"])
+        cmd.extend([
+            "-an",
+            "-vf", f"setpts=PTS+{start:.6f}/TB,{subtitle_filter(subtitle_path)},setpts=PTS-STARTPTS",
+            *encoder_options(preset, crf, threads),
+            segment_path,
+            "-y",
+        ])
+        commands.append(cmd)
+
+    await asyncio.gather(*(
+        runner.run(cmd, on_progress=on_progress if i == 0 else None) for i, cmd in enumerate(commands)
+    ))
+
+    list_path = os.path.join(temp_dir, "burn_segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    await runner.run([
+        "ffmpeg",
+        "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", video_path,
+        "-map", "0:v:0", "-map", "1:a?",
+        "-c", "copy",
+        output_path,
+        "-y",
+    ])
+
+    for path in segment_paths + [list_path]:
+        os.remove(path)
+    return output_path
@@ -1,62 +1,134 @@
 import gradio as gr
-import subprocess
+import json
 import os
 from pathlib import Path
-import uuid
+from dotenv import load_dotenv
+
+from cache import UploadStore, content_key
+from config import EDGE_TTS_VOICES
+from jobs import JobQueue, JobWorkers
+from tools import create_logger
+
+load_dotenv()
+
+logger = create_logger(__name__)
 
-INPUT_DIR = Path("./tmp/input")
 OUTPUT_DIR = Path("./tmp/output")
 
-INPUT_DIR.mkdir(exist_ok=True)
-OUTPUT_DIR.mkdir(exist_ok=True)
+OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+uploads = UploadStore(os.getenv("UPLOADS_DIR", "cache/uploads"))
+queue = JobQueue(os.getenv("JOBS_DB", "cache/jobs.sqlite3"))
+workers = JobWorkers(
+    queue,
+    str(OUTPUT_DIR),
+    workers=int(os.getenv("WORKERS", "2")),
+    tts_backend=os.getenv("TTS_BACKEND", "edge"),
+    translator=os.getenv("TRANSLATOR", "google"),
+)
+
 
 def save_uploaded_file(uploaded_file):
+    """Store an upload by content; returns (digest, path), (None, None) without a file"""
     if uploaded_file is None:
-        return None
-    
-    filename = Path(uploaded_file).name
-    destination = INPUT_DIR / filename
+        return None, None
+    return uploads.store(uploaded_file)
 
-    if not destination.exists():
-        shutil.copy(uploaded_file, destination)
-    
-    return str(destination)
 
-def remember_file(file_obj):
-    return file_obj  # store file path as state
+def submit_job(video, subtitle, languages, source_lang):
+    """Enqueue a dubbing job; returns immediately with the job id"""
+    if video is None:
+        raise gr.Error("Upload a video first")
+    if not languages:
+        raise gr.Error("Pick at least one language")
+
+    video_digest, video_path = save_uploaded_file(video)
+    subtitle_digest, subtitle_path = save_uploaded_file(subtitle)
+    params = {"languages": list(languages), "source_lang": source_lang or None}
+    # Same video, subtitles and settings: the finished outputs of an earlier job are reused
+    settings = json.dumps({**params, **workers.options}, sort_keys=True)
+    input_key = content_key(video_digest, subtitle_digest or "", settings)
+
+    job_id = queue.submit(video_path, input_key=input_key, subtitle_path=subtitle_path, **params)
+    return job_id, job_table()
 
-def process_video(input_video):
-    if input_video_path is None:
-        return None, None
-    
-    output_path = OUTPUT_DIR / f"{uuid.uuid4()}.mp4"
 
-    cmd = [
-        "ffmpeg", "-i", input_video, "-c", "copy", str(output_path),
-        "-y"
+def job_table():
+    return [
+        [
+            job["id"],
+            job["status"],
+            f"{job['progress'] * 100:.0f}%",
+            job["error"] or job["message"],
+            ", ".join(job["params"].get("languages", [])),
+        ]
+        for job in queue.recent()
     ]
-    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    return str(output_path), str(output_path)
 
-with gr.Blocks() as demo:
-    gr.Markdown("### 🎬 FFmpeg Video Editor with Memory")
+def job_result(job_id):
+    """Status line and, once done, the dubbed video and its files"""
+    job = queue.get(job_id.strip()) if job_id else None
+    if job is None:
+        return "No job selected", None, None
+
+    status = f"{job['status']} · {job['progress'] * 100:.0f}% · {job['error'] or job['message']}"
+    if job["status"] != "done":
+        return status, None, None
+
+    files = job["result"]["files_created"]
+    return status, files[0], files
+
+
+def poll(job_id):
+    counts = queue.counts()
+    summary = " · ".join(f"{status}: {count}" for status, count in counts.items())
+    return (summary, job_table()) + job_result(job_id)
 
-    video_state = gr.State()
+
+with gr.Blocks() as demo:
+    gr.Markdown("### 🎬 Video.AI Dubbing Queue")
 
     with gr.Row():
-        video_input = gr.Video(label="Upload Video")
-        video_output = gr.Video(label="Processed Video", interactive=False)
+        with gr.Column():
+            video_input = gr.File(label="Upload Video", file_types=["video"])
+            subtitle_input = gr.File(label="Subtitles (optional, otherwise read from the video)", file_types=[".srt", ".vtt", ".ass", ".ssa"])
+            with gr.Row():
+                source_input = gr.Textbox(label="Source language", value="en")
+                language_input = gr.Dropdown(
+                    label="Dub into", choices=sorted(EDGE_TTS_VOICES), value=["km"], multiselect=True
+                )
+            btn = gr.Button("Queue Dubbing Job", variant="primary")
+
+        with gr.Column():
+            job_id_input = gr.Textbox(label="Job ID")
+            job_status = gr.Markdown()
+            video_output = gr.Video(label="Dubbed Video", interactive=False)
+            download = gr.File(label="Download", file_count="multiple", interactive=False)
+
+    queue_summary = gr.Markdown()
+    jobs_output = gr.Dataframe(
+        headers=["Job", "Status", "Progress", "Message", "Languages"], interactive=False, value=job_table
+    )
 
-    download = gr.File(label="Download Edited Video")
-    btn = gr.Button("Run FFmpeg Edit")
+    # Submitting only writes the upload and a queue row; workers do the rest
+    btn.click(
+        fn=submit_job,
+        inputs=[video_input, subtitle_input, language_input, source_input],
+        outputs=[job_id_input, jobs_output],
+    )
 
-    # On file upload, store in gr.State
-    # video_input.change(fn=remember_file, inputs=video_input, outputs=video_state)
-    video_input.change(fn=save_uploaded_file, inputs=video_input, outputs=video_state)
+    # The UI polls the queue instead of holding a request open per job
+    timer = gr.Timer(2)
+    timer.tick(
+        fn=poll,
+        inputs=job_id_input,
+        outputs=[queue_summary, jobs_output, job_status, video_output, download],
+        show_progress="hidden",
+    )
 
-    # On button click, use remembered file path
-    btn.click(fn=process_video, inputs=video_state, outputs=video_output)
-    # btn.click(fn=process_video, inputs=video_state, outputs=[video_output, download])
 
-demo.launch(server_name="0.0.0.0", server_port=7779, share=True)
+if __name__ == "__main__":
+    workers.start()
+    demo.queue(default_concurrency_limit=32)
+    demo.launch(server_name="0.0.0.0", server_port=7779, share=True)